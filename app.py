@@ -2,24 +2,73 @@
 RAG-E Chat Service
 FastAPI microservice that exposes /chat endpoint for n8n orchestration.
 """
+import asyncio
+import hmac
+import json
 import logging
 import time
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional
 
 from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from src.services.supabase_service import get_context
-from src.services.ai_service import AIService
+from src.services.supabase_service import (
+    get_context,
+    is_small_knowledge_base,
+    knowledge_base_version,
+    invalidate_kb_context_cache,
+    get_kb_context_cache_stats
+)
+from src.services.ai_client_pool import ai_client_pool
+from src.services.ai_service import get_usage_stats, FALLBACK_REPLIES
+from src.services.ai_credentials_service import (
+    get_user_ai_credentials,
+    validate_credentials,
+    get_temperature,
+    get_context_token_budget,
+    invalidate_credentials_cache,
+    get_credentials_cache_stats
+)
 from src.services import conversation_service, message_service
+from src.services.message_service import get_conversation_history
+from src.services.history_buffer import history_buffers, invalidate_history_buffers
 from src.services.personality_service import (
-    get_agent_personality,
-    build_system_prompt_with_personality
+    get_compiled_prompt,
+    render_system_prompt,
+    personalize_system_prompt,
+    invalidate_personality_cache,
+    get_personality_cache_stats
+)
+from src.services.vector_search import hybrid_search
+from src.services.lexical_index import (
+    lexical_search,
+    invalidate_lexical_index,
+    get_lexical_index_stats
 )
+from src.services.turn_classifier import classify_turn
+from src.services.embeddings import (
+    generate_embedding,
+    embedding_cache,
+    close_client as close_embeddings_client
+)
+from src.services.response_cache import response_cache, invalidate_response_cache
+from src.services.local_index import local_index, invalidate_local_index
+from src.services.knowledge_processing import process_knowledge
+from src.services.knowledge_jobs import knowledge_jobs
 from src.models.conversation import ConversationUpsertRequest, ConversationUpsertResponse
 from src.models.message import MessageCreateRequest, MessageCreateResponse
-from src.utils.config import PORT
+from src.utils.config import (
+    PORT,
+    CACHE_ADMIN_TOKEN,
+    RESPONSE_CACHE_ENABLED,
+    LEXICAL_SEARCH_ENABLED,
+    LEXICAL_ONLY_ENABLED,
+    RETRIEVAL_SKIP_ENABLED
+)
+from src.utils.tokens import estimate_tokens
 
 # Logging config
 logging.basicConfig(
@@ -29,11 +78,29 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan.
+    
+    Async clients (embeddings) live on the server's event loop for the whole
+    process, so their keep-alive connections are reused across requests.
+    They are closed here on shutdown, together with the pooled chat clients.
+    The knowledge job workers run on the same loop.
+    """
+    knowledge_jobs.start()
+    yield
+    await knowledge_jobs.stop()
+    await close_embeddings_client()
+    ai_client_pool.close_all()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG-E Chat Service",
     description="Microservice for AI-powered chat with Supabase knowledge base",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware - TODO: restrict origins for production
@@ -45,8 +112,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Note: AIService is now instantiated per-request with user credentials
-# No global instance needed
+# Note: AIService instances are pooled per tenant credentials (ai_client_pool)
 
 
 # Request/Response models
@@ -78,144 +144,463 @@ class SimulationChatOut(BaseModel):
     request_id: Optional[str] = Field(None, description="Request tracking ID if provided")
 
 
-# Internal helper function
-def generate_agent_reply(
+# Internal helper functions
+def _build_history_context(history: list, contact_name: Optional[str]) -> str:
+    """
+    Format conversation history and contact name into the block that is
+    prepended to the user prompt.
+    
+    Args:
+        history: Messages from get_conversation_history() (oldest first)
+        contact_name: Contact name from the conversation, if known
+        
+    Returns:
+        History context string ending with the current message header
+    """
+    history_context = "=== INFORMAÇÕES DA CONVERSA ===\n"
+    
+    if contact_name:
+        history_context += f"Você está conversando com: {contact_name}\n"
+    
+    if history:
+        history_context += "\n=== HISTÓRICO DE MENSAGENS ===\n"
+        for msg in history:
+            direction = msg.get("direction", "unknown")
+            msg_text = msg.get("message", "")  # Campo 'message' em inglês
+            
+            if direction == "inbound":  # Mensagem do usuário
+                history_context += f"Usuário: {msg_text}\n"
+            elif direction == "outbound":  # Mensagem do assistente
+                history_context += f"Assistente: {msg_text}\n"
+    
+    history_context += "=== FIM DO HISTÓRICO ===\n\n"
+    history_context += "=== MENSAGEM ATUAL ===\n"
+    
+    return history_context
+
+
+def _resolved(value) -> asyncio.Future:
+    """Return an already completed future (stands in for a skipped lookup)."""
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+async def _embed_query(
+    message: str,
+    lexical_task: Optional["asyncio.Future"] = None
+) -> Optional[List[float]]:
+    """
+    Embed the user's message once for both retrieval and the response cache.
+    
+    Args:
+        message: User's message
+        lexical_task: Task resolving to the message's lexical search result;
+            a confident match (LEXICAL_ONLY_ENABLED) makes the embedding unnecessary
+    
+    Returns:
+        Embedding vector, or None if the embeddings API failed or was not needed
+    """
+    if lexical_task is not None:
+        lexical = await lexical_task
+        if lexical is not None and lexical.confident and LEXICAL_ONLY_ENABLED:
+            return None
+    
+    try:
+        return await generate_embedding(message)
+    except Exception as e:
+        logger.warning(f"Query embedding failed: {e}")
+        return None
+
+
+def _kb_version(user_id: str) -> Optional[str]:
+    """Knowledge base version for the response cache scope (None if it cannot be read)."""
+    try:
+        return knowledge_base_version(user_id)
+    except Exception as e:
+        logger.warning(f"Knowledge base version unavailable for user_id={user_id[-4:]}: {e}")
+        return None
+
+
+async def _fetch_context(
+    user_id: str,
+    message: str,
+    embedding_task: "asyncio.Future",
+    credentials_task: "asyncio.Task",
+    lexical_task: "asyncio.Future"
+) -> str:
+    """
+    Fetch knowledge base context using hybrid (lexical + vector) search with fallback.
+    
+    Args:
+        user_id: User identifier
+        message: User's message (used for semantic search)
+        embedding_task: Task resolving to the message embedding (or None)
+        credentials_task: Task resolving to the tenant's AI credentials
+            (they carry the context token budget)
+        lexical_task: Task resolving to the message's lexical search result (or None)
+        
+    Returns:
+        Context string for the system prompt
+    """
+    query_embedding, credentials, lexical = await asyncio.gather(
+        embedding_task, credentials_task, lexical_task
+    )
+    token_budget = get_context_token_budget(credentials)
+    
+    # Using hybrid_search: tries vector search first, falls back to original get_context()
+    try:
+        context = await hybrid_search(
+            user_id=user_id,
+            query=message,  # Use user's message for semantic search
+            top_k=5,
+            query_embedding=query_embedding,
+            token_budget=token_budget,
+            lexical=lexical
+        )
+        
+        logger.info("Retrieved context using hybrid search (lexical + vector + fallback)")
+        return context
+        
+    except Exception as e:
+        logger.warning(f"Hybrid search failed, using original get_context(): {e}")
+        # Fallback to original implementation if vector search fails
+        return await asyncio.to_thread(get_context, owner_id=user_id, query=message, token_budget=token_budget)
+
+
+async def _fetch_history(user_id: str, external_contact_id: Optional[str]) -> tuple:
+    """
+    Fetch conversation history and contact name, if a contact is known.
+    
+    Args:
+        user_id: User identifier
+        external_contact_id: Optional external contact ID
+        
+    Returns:
+        Tuple of (history, contact_name)
+    """
+    if not external_contact_id:
+        return [], None
+    
+    logger.info(f"Fetching conversation history for contact={external_contact_id}")
+    
+    history, contact_name = await asyncio.to_thread(
+        get_conversation_history,
+        user_id=user_id,
+        external_contact_id=external_contact_id,
+        limit=10  # Last 10 messages
+    )
+    
+    logger.info(f"Found {len(history)} messages in history, contact_name={contact_name}")
+    
+    return history, contact_name
+
+
+class AgentPrompt(NamedTuple):
+    """Everything needed to call the LLM for one agent turn."""
+    system_prompt: str
+    user_prompt: str
+    model: str
+    temperature: float
+    api_key: Optional[str]
+    base_url: Optional[str]
+    organization_id: Optional[str]
+    cached_reply: Optional[str] = None
+    cache_scope: Optional[tuple] = None
+    query_embedding: Optional[List[float]] = None
+
+
+async def build_agent_prompt(
     user_id: str,
     message: str,
-    x_request_id: Optional[str] = None,
     external_contact_id: Optional[str] = None
-) -> ChatOut:
+) -> AgentPrompt:
     """
-    Generate agent reply using knowledge base context and user configuration.
+    Build the prompts and model settings for an agent turn.
     
-    This function is shared between /chat and /simulation/chat routes.
-    Uses user-specific AI credentials instead of global .env configuration.
+    This is the context-building path shared by generate_agent_reply() and
+    the streaming routes. The independent lookups (credentials, knowledge
+    base context, personality and conversation history) are issued
+    concurrently, so the time spent before the LLM call is roughly one round
+    trip instead of four.
+    
+    Turns without conversation history are first looked up in the semantic
+    response cache; on a hit the returned AgentPrompt carries cached_reply
+    and retrieval is cancelled. The tenant's lexical index is searched
+    concurrently with the other lookups and before the embedding call: a
+    confident match skips the embedding call (and with it the
+    response cache and vector search). Small talk ("oi", "obrigado", "tchau",
+    see classify_turn()) skips retrieval altogether and is answered with
+    the tenant's minimal system prompt, without the knowledge base. Tenants
+    with a small knowledge base (see is_small_knowledge_base()) get it
+    inlined whole, also without lexical search or the embedding call.
     
     Args:
         user_id: User identifier for fetching context and config
         message: User's message/question
-        x_request_id: Optional request tracking ID
         external_contact_id: Optional external contact ID for conversation history
         
     Returns:
-        ChatOut with AI-generated reply
+        AgentPrompt with system/user prompts, model settings and credentials
         
     Raises:
-        Exception: If context fetching or AI generation fails
+        Exception: If the user's AI credentials are missing or invalid
     """
-    # STEP 1: Fetch user's AI credentials
-    from src.services.ai_credentials_service import get_user_ai_credentials, validate_credentials, get_temperature
+    # STEP 1: Fan out the independent lookups
+    lookup_start = time.time()
+    
+    credentials_task = asyncio.create_task(asyncio.to_thread(get_user_ai_credentials, user_id))
     
-    credentials = get_user_ai_credentials(user_id)
+    # Small talk needs no knowledge base: skip lexical search, embedding and context
+    needs_retrieval = True
+    if RETRIEVAL_SKIP_ENABLED:
+        decision = classify_turn(message)
+        needs_retrieval = decision.needs_retrieval
+        logger.info(
+            "agent_turn_classified retrieval=%s reason=%s",
+            needs_retrieval, decision.reason
+        )
+    
+    # Small knowledge bases are inlined whole: nothing to search
+    inline_kb = needs_retrieval and is_small_knowledge_base(user_id)
+    
+    # Lexical search runs alongside the other lookups; a confident match
+    # answers retrieval without the embeddings API (see _embed_query())
+    lexical_task = _resolved(None)
+    if LEXICAL_SEARCH_ENABLED and needs_retrieval and not inline_kb:
+        lexical_task = asyncio.create_task(asyncio.to_thread(lexical_search, user_id, message))
+    
+    embed = needs_retrieval and not inline_kb
+    if embed:
+        embedding_task = asyncio.create_task(_embed_query(message, lexical_task))
+    else:
+        embedding_task = _resolved(None)
+    
+    if needs_retrieval:
+        context_task = asyncio.create_task(
+            _fetch_context(user_id, message, embedding_task, credentials_task, lexical_task)
+        )
+    else:
+        context_task = _resolved("")
+    
+    try:
+        compiled_prompt, (history, contact_name), credentials = await asyncio.gather(
+            asyncio.to_thread(get_compiled_prompt, user_id),
+            _fetch_history(user_id, external_contact_id),
+            credentials_task,
+        )
+    except BaseException:
+        context_task.cancel()
+        raise
     
     if not validate_credentials(credentials):
+        context_task.cancel()
         logger.error(f"Invalid AI credentials for user_id={user_id[-4:]}")
         raise Exception("User AI credentials not configured or invalid")
     
     # Extract credentials
-    api_key = credentials.get("api_key_encrypted")
     model = credentials.get("default_model") or "gpt-4o-mini"
     temperature = get_temperature(credentials, default=0.2)
-    base_url = credentials.get("base_url")
-    organization_id = credentials.get("organization_id")
     provider = credentials.get("provider", "openai")
     
     logger.info(f"Using AI credentials: provider={provider} model={model} temp={temperature}")
     
-    # STEP 2: Initialize AIService with user's credentials
-    user_ai = AIService(
-        api_key=api_key,
-        base_url=base_url,
-        organization_id=organization_id
+    prompt_kwargs = dict(
+        model=model,
+        temperature=temperature,
+        api_key=credentials.get("api_key_encrypted"),
+        base_url=credentials.get("base_url"),
+        organization_id=credentials.get("organization_id")
     )
     
-    # STEP 3: Fetch context from Supabase using vector search (with fallback)
-    # Using hybrid_search: tries vector search first, falls back to original get_context()
-    try:
-        from src.services.vector_search import hybrid_search
-        import asyncio
-        
-        # Run async hybrid_search (vector search with fallback)
-        context = asyncio.run(hybrid_search(
-            user_id=user_id,
-            query=message,  # Use user's message for semantic search
-            top_k=5
-        ))
-        
-        logger.info(f"Retrieved context using hybrid search (vector + fallback)")
-        
-    except Exception as e:
-        logger.warning(f"Hybrid search failed, using original get_context(): {e}")
-        # Fallback to original implementation if vector search fails
-        context = get_context(owner_id=user_id)
+    # STEP 2: Semantic response cache (only for turns that don't depend on history)
+    cache_scope = None
+    query_embedding = None
     
-    # STEP 4: Fetch agent personality configuration
-    personality = get_agent_personality(user_id)
+    # Cached replies are scoped to the knowledge base version they were built
+    # from; it is only read for turns that can use the cache
+    if RESPONSE_CACHE_ENABLED and embed and not history and not contact_name:
+        query_embedding, kb_version = await asyncio.gather(
+            embedding_task, asyncio.to_thread(_kb_version, user_id)
+        )
+        if query_embedding is not None and kb_version is not None:
+            cache_scope = (compiled_prompt.version, kb_version, model, temperature)
+            cached_reply = response_cache.lookup(user_id, cache_scope, query_embedding)
+            if cached_reply is not None:
+                context_task.cancel()
+                logger.info(
+                    "agent_response_cache_hit user=%s elapsed_ms=%d",
+                    user_id[-4:], int((time.time() - lookup_start) * 1000)
+                )
+                return AgentPrompt(
+                    system_prompt="",
+                    user_prompt=message,
+                    cached_reply=cached_reply,
+                    **prompt_kwargs
+                )
     
-    # STEP 5: Build system prompt with personality and knowledge base
-    system_prompt = build_system_prompt_with_personality(context, personality)
+    context = await context_task
     
-    # STEP 6: Build user prompt with conversation history if available
+    logger.info("agent_lookups_done elapsed_ms=%d", int((time.time() - lookup_start) * 1000))
+    
+    # STEP 3: Splice knowledge base into the tenant's precompiled system prompt
+    if needs_retrieval:
+        system_prompt = render_system_prompt(compiled_prompt, context)
+    else:
+        system_prompt = compiled_prompt.minimal
+    
+    # STEP 4: Build user prompt with conversation history if available
     user_prompt = message
-    contact_name = None
     
-    # If we have external_contact_id, fetch conversation history
-    if external_contact_id:
-        from src.services.message_service import get_conversation_history
+    if history or contact_name:
+        if contact_name:
+            # Replace {{contact_name}} placeholder in system prompt
+            system_prompt = personalize_system_prompt(system_prompt, contact_name)
         
-        logger.info(f"Fetching conversation history for contact={external_contact_id}")
-        
-        history, contact_name = get_conversation_history(
-            user_id=user_id,
-            external_contact_id=external_contact_id,
-            limit=10  # Last 10 messages
-        )
+        history_context = _build_history_context(history, contact_name)
         
-        logger.info(f"Found {len(history)} messages in history, contact_name={contact_name}")
+        logger.info(f"History context built: {len(history_context)} chars")
         
-        if history or contact_name:
-            # Build conversation context
-            history_context = "=== INFORMAÇÕES DA CONVERSA ===\n"
-            
-            if contact_name:
-                history_context += f"Você está conversando com: {contact_name}\n"
-                # Replace {{contact_name}} placeholder in system prompt
-                system_prompt = system_prompt.replace('{{contact_name}}', contact_name)
-            
-            if history:
-                history_context += "\n=== HISTÓRICO DE MENSAGENS ===\n"
-                for msg in history:
-                    direction = msg.get("direction", "unknown")
-                    msg_text = msg.get("message", "")  # Campo 'message' em inglês
-                    
-                    if direction == "inbound":  # Mensagem do usuário
-                        history_context += f"Usuário: {msg_text}\n"
-                    elif direction == "outbound":  # Mensagem do assistente
-                        history_context += f"Assistente: {msg_text}\n"
-            
-            history_context += "=== FIM DO HISTÓRICO ===\n\n"
-            history_context += "=== MENSAGEM ATUAL ===\n"
-            
-            logger.info(f"History context built: {len(history_context)} chars")
-            
-            # Prepend history to user prompt
-            user_prompt = f"{history_context}{message}"
+        # Prepend history to user prompt
+        user_prompt = f"{history_context}{message}"
+    
+    # Estimated prompt tokens per section (the knowledge context is budgeted)
+    context_tokens = estimate_tokens(context)
+    logger.info(
+        "agent_prompt_tokens system=%d knowledge=%d user=%d",
+        estimate_tokens(system_prompt) - context_tokens, context_tokens, estimate_tokens(user_prompt)
+    )
     
-    # STEP 7: Generate AI response using user's credentials
-    reply = user_ai.generate_response(
-        system_prompt=system_prompt, 
+    return AgentPrompt(
+        system_prompt=system_prompt,
         user_prompt=user_prompt,
-        model=model,
-        temperature=temperature
+        cache_scope=cache_scope,
+        query_embedding=query_embedding,
+        **prompt_kwargs
     )
+
+
+def _store_cached_reply(user_id: str, prompt: AgentPrompt, reply: str) -> None:
+    """Store a freshly generated reply in the semantic response cache."""
+    if prompt.cache_scope is None or prompt.query_embedding is None:
+        return
+    if not reply or reply in FALLBACK_REPLIES:
+        return
+    response_cache.store(user_id, prompt.cache_scope, prompt.query_embedding, reply)
+
+
+async def generate_agent_reply(
+    user_id: str,
+    message: str,
+    x_request_id: Optional[str] = None,
+    external_contact_id: Optional[str] = None
+) -> ChatOut:
+    """
+    Generate agent reply using knowledge base context and user configuration.
+    
+    This function is shared between /chat and /simulation/chat routes.
+    Uses user-specific AI credentials instead of global .env configuration.
+    
+    Args:
+        user_id: User identifier for fetching context and config
+        message: User's message/question
+        x_request_id: Optional request tracking ID
+        external_contact_id: Optional external contact ID for conversation history
+        
+    Returns:
+        ChatOut with AI-generated reply (source "cache" when served from the
+        semantic response cache)
+        
+    Raises:
+        Exception: If context fetching or AI generation fails
+    """
+    prompt = await build_agent_prompt(user_id, message, external_contact_id)
+    
+    if prompt.cached_reply is not None:
+        return ChatOut(reply=prompt.cached_reply, source="cache", request_id=x_request_id)
+    
+    # STEP 5: Generate AI response using a pooled client for user's credentials
+    with ai_client_pool.acquire(
+        api_key=prompt.api_key,
+        base_url=prompt.base_url,
+        organization_id=prompt.organization_id
+    ) as user_ai:
+        reply = await asyncio.to_thread(
+            user_ai.generate_response,
+            system_prompt=prompt.system_prompt, 
+            user_prompt=prompt.user_prompt,
+            model=prompt.model,
+            temperature=prompt.temperature
+        )
     
     # Normalize line breaks for WhatsApp compatibility
     # WhatsApp may need explicit \n characters, ensure they're preserved
     reply = reply.replace('\r\n', '\n')  # Normalize Windows line breaks
     
+    _store_cached_reply(user_id, prompt, reply)
+    
     return ChatOut(reply=reply, source="supabase", request_id=x_request_id)
 
 
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Encode a Server-Sent Event."""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+def _stream_agent_reply(
+    prompt: AgentPrompt,
+    source: str,
+    x_request_id: Optional[str],
+    log_prefix: str,
+    masked_user: str,
+    start: float
+) -> Iterator[str]:
+    """
+    Stream an agent reply as Server-Sent Events.
+    
+    Emits one `data: {"delta": ...}` event per token chunk and a final
+    `event: done` with the source and request_id.
+    
+    Starlette iterates this sync generator in its thread pool, so the pooled
+    client is held only for the lifetime of the stream.
+    
+    Cached replies are served from the semantic response cache, but streamed
+    replies are not stored (a stream cut short would cache a partial reply).
+    """
+    if prompt.cached_reply is not None:
+        yield _sse_event({"delta": prompt.cached_reply})
+        yield _sse_event({"source": "cache", "request_id": x_request_id}, event="done")
+        return
+    
+    first_token_ms = None
+    
+    with ai_client_pool.acquire(
+        api_key=prompt.api_key,
+        base_url=prompt.base_url,
+        organization_id=prompt.organization_id
+    ) as user_ai:
+        for delta in user_ai.stream_response(
+            system_prompt=prompt.system_prompt,
+            user_prompt=prompt.user_prompt,
+            model=prompt.model,
+            temperature=prompt.temperature
+        ):
+            if first_token_ms is None:
+                first_token_ms = int((time.time() - start) * 1000)
+            yield _sse_event({"delta": delta.replace('\r\n', '\n')})
+    
+    elapsed_ms = int((time.time() - start) * 1000)
+    logger.info(
+        "%s_success user=%s request_id=%s first_token_ms=%s elapsed_ms=%d",
+        log_prefix, masked_user, x_request_id, first_token_ms, elapsed_ms
+    )
+    
+    yield _sse_event({"source": source, "request_id": x_request_id}, event="done")
+
+
 # Routes
 @app.get("/healthz")
 def healthz():
@@ -224,7 +609,7 @@ def healthz():
 
 
 @app.post("/chat", response_model=ChatOut)
-def chat(payload: ChatIn, x_request_id: Optional[str] = Header(default=None)):
+async def chat(payload: ChatIn, x_request_id: Optional[str] = Header(default=None)):
     """
     Chat endpoint - receives user message and returns AI-generated response
     based on Supabase knowledge base context.
@@ -253,7 +638,8 @@ def chat(payload: ChatIn, x_request_id: Optional[str] = Header(default=None)):
         if payload.external_contact_id:
             from src.services.name_collection_service import process_name_collection_flow
             
-            response_text, should_continue_to_ai = process_name_collection_flow(
+            response_text, should_continue_to_ai = await asyncio.to_thread(
+                process_name_collection_flow,
                 message_text=payload.message,
                 external_contact_id=payload.external_contact_id,
                 user_id=payload.user_id
@@ -270,7 +656,7 @@ def chat(payload: ChatIn, x_request_id: Optional[str] = Header(default=None)):
                 )
         
         # STEP 2: Process with AI (name already collected or no external_contact_id)
-        result = generate_agent_reply(
+        result = await generate_agent_reply(
             user_id=payload.user_id,
             message=payload.message,
             x_request_id=x_request_id,
@@ -289,7 +675,7 @@ def chat(payload: ChatIn, x_request_id: Optional[str] = Header(default=None)):
 
 
 @app.post("/simulation/chat", response_model=SimulationChatOut)
-def simulation_chat(payload: SimulationChatIn, x_request_id: Optional[str] = Header(default=None)):
+async def simulation_chat(payload: SimulationChatIn, x_request_id: Optional[str] = Header(default=None)):
     """
     Simulation chat endpoint - for testing the agent without WhatsApp integration.
     
@@ -334,7 +720,7 @@ def simulation_chat(payload: SimulationChatIn, x_request_id: Optional[str] = Hea
         logger.info("chat_simulation_start user=%s request_id=%s", masked_user, x_request_id)
         
         # Generate reply using shared logic (same as /chat)
-        result = generate_agent_reply(
+        result = await generate_agent_reply(
             user_id=payload.user_id,
             message=payload.message,
             x_request_id=x_request_id,
@@ -356,6 +742,110 @@ def simulation_chat(payload: SimulationChatIn, x_request_id: Optional[str] = Hea
         raise HTTPException(status_code=500, detail="internal_error")
 
 
+@app.post("/chat/stream")
+async def chat_stream(payload: ChatIn, x_request_id: Optional[str] = Header(default=None)):
+    """
+    Streaming chat endpoint - same flow as /chat, but the reply is sent as
+    Server-Sent Events while the model generates it.
+    
+    Events:
+        data: {"delta": "..."}                               (one per token chunk)
+        event: done / data: {"source": "...", "request_id": "..."}
+    
+    Args:
+        payload: ChatIn with user_id and message
+        x_request_id: Optional request tracking header
+        
+    Returns:
+        StreamingResponse with media type text/event-stream
+        
+    Raises:
+        HTTPException: 500 if an error occurs before streaming starts
+    """
+    start = time.time()
+    
+    try:
+        masked_user = f"***{payload.user_id[-4:]}" if len(payload.user_id) > 4 else "***"
+        logger.info("chat_stream_start user=%s request_id=%s", masked_user, x_request_id)
+        
+        # Name collection flow replies are short - send them as a single delta
+        if payload.external_contact_id:
+            from src.services.name_collection_service import process_name_collection_flow
+            
+            response_text, should_continue_to_ai = await asyncio.to_thread(
+                process_name_collection_flow,
+                message_text=payload.message,
+                external_contact_id=payload.external_contact_id,
+                user_id=payload.user_id
+            )
+            
+            if not should_continue_to_ai:
+                events = [
+                    _sse_event({"delta": response_text}),
+                    _sse_event({"source": "name_collection", "request_id": x_request_id}, event="done"),
+                ]
+                return StreamingResponse(iter(events), media_type="text/event-stream")
+        
+        prompt = await build_agent_prompt(
+            user_id=payload.user_id,
+            message=payload.message,
+            external_contact_id=payload.external_contact_id
+        )
+        
+        return StreamingResponse(
+            _stream_agent_reply(prompt, "supabase", x_request_id, "chat_stream", masked_user, start),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        
+    except Exception as e:
+        elapsed_ms = int((time.time() - start) * 1000)
+        logger.exception("chat_stream_error request_id=%s elapsed_ms=%d error=%s", x_request_id, elapsed_ms, str(e))
+        raise HTTPException(status_code=500, detail="internal_error")
+
+
+@app.post("/simulation/chat/stream")
+async def simulation_chat_stream(payload: SimulationChatIn, x_request_id: Optional[str] = Header(default=None)):
+    """
+    Streaming variant of /simulation/chat for the web panel's simulation mode.
+    
+    Emits the same Server-Sent Events as /chat/stream and, like
+    /simulation/chat, skips the name collection flow.
+    
+    Args:
+        payload: SimulationChatIn with user_id and message
+        x_request_id: Optional request tracking header
+        
+    Returns:
+        StreamingResponse with media type text/event-stream
+        
+    Raises:
+        HTTPException: 500 if an error occurs before streaming starts
+    """
+    start = time.time()
+    
+    try:
+        masked_user = f"***{payload.user_id[-4:]}" if len(payload.user_id) > 4 else "***"
+        logger.info("chat_simulation_stream_start user=%s request_id=%s", masked_user, x_request_id)
+        
+        prompt = await build_agent_prompt(
+            user_id=payload.user_id,
+            message=payload.message,
+            external_contact_id=payload.external_contact_id
+        )
+        
+        return StreamingResponse(
+            _stream_agent_reply(prompt, "supabase", x_request_id, "chat_simulation_stream", masked_user, start),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        
+    except Exception as e:
+        elapsed_ms = int((time.time() - start) * 1000)
+        logger.exception("chat_simulation_stream_error request_id=%s elapsed_ms=%d error=%s", x_request_id, elapsed_ms, str(e))
+        raise HTTPException(status_code=500, detail="internal_error")
+
+
 @app.post("/conversations/upsert", response_model=ConversationUpsertResponse, status_code=200)
 async def upsert_conversation(payload: ConversationUpsertRequest):
     """
@@ -434,6 +924,114 @@ async def create_message(payload: MessageCreateRequest):
         raise HTTPException(status_code=500, detail="internal_error")
 
 
+# ============================================================================
+# Cache Management Endpoints
+# ============================================================================
+
+# Per-tenant caches that the dashboard can invalidate after edits
+CACHE_INVALIDATORS = {
+    "credentials": invalidate_credentials_cache,
+    "personality": invalidate_personality_cache,
+    "responses": invalidate_response_cache,
+    "vector_index": invalidate_local_index,
+    "lexical_index": invalidate_lexical_index,
+    "knowledge_context": invalidate_kb_context_cache,
+    "history": invalidate_history_buffers,
+}
+
+
+class CacheInvalidateRequest(BaseModel):
+    """Cache invalidation request payload"""
+    scopes: Optional[List[str]] = Field(None, description="Caches to invalidate (default: all)")
+
+
+class CacheInvalidateResponse(BaseModel):
+    """Cache invalidation response payload"""
+    user_id: str
+    invalidated: List[str] = Field(..., description="Scopes that were invalidated")
+
+
+def _require_cache_admin(x_admin_token: Optional[str]) -> None:
+    """
+    Authenticate cache management calls against CACHE_ADMIN_TOKEN.
+    
+    Raises:
+        HTTPException: 503 if no token is configured, 401 if the token is wrong
+    """
+    if not CACHE_ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="cache_admin_disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, CACHE_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="unauthorized")
+
+
+@app.post("/cache/invalidate/{user_id}", response_model=CacheInvalidateResponse)
+async def invalidate_cache(
+    user_id: str,
+    payload: Optional[CacheInvalidateRequest] = None,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Invalidate a tenant's in-process caches (e.g. after editing AI credentials
+    or the agent personality).
+    
+    Requires the X-Admin-Token header to match CACHE_ADMIN_TOKEN.
+    Only the worker that serves the call is invalidated; other workers pick
+    up the change when their TTL expires.
+    
+    Args:
+        user_id: User UUID
+        payload: Optional CacheInvalidateRequest with the scopes to invalidate
+        x_admin_token: Admin token header
+        
+    Returns:
+        CacheInvalidateResponse with the invalidated scopes
+        
+    Raises:
+        HTTPException: 400 for unknown scopes, 401/503 for auth failures
+    """
+    _require_cache_admin(x_admin_token)
+    
+    scopes = (payload.scopes if payload and payload.scopes else list(CACHE_INVALIDATORS))
+    unknown = [scope for scope in scopes if scope not in CACHE_INVALIDATORS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown cache scopes: {', '.join(unknown)}")
+    
+    for scope in scopes:
+        CACHE_INVALIDATORS[scope](user_id)
+    
+    logger.info(f"cache_invalidate user={user_id[-4:]} scopes={scopes}")
+    
+    return CacheInvalidateResponse(user_id=user_id, invalidated=scopes)
+
+
+@app.get("/cache/stats")
+async def cache_stats(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Report in-process cache counters and provider prompt-cache usage.
+    
+    Requires the X-Admin-Token header to match CACHE_ADMIN_TOKEN.
+    Counters are per worker process.
+    
+    Returns:
+        Dictionary with stats for each cache and the LLM prompt token usage
+        (including cached_tokens and cached_ratio)
+    """
+    _require_cache_admin(x_admin_token)
+    
+    return {
+        "credentials": get_credentials_cache_stats(),
+        "personality": get_personality_cache_stats(),
+        "responses": response_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "vector_index": local_index.stats(),
+        "lexical_index": get_lexical_index_stats(),
+        "knowledge_context": get_kb_context_cache_stats(),
+        "history": history_buffers.stats(),
+        "knowledge_jobs": knowledge_jobs.stats(),
+        "llm_usage": get_usage_stats(),
+    }
+
+
 # ============================================================================
 # Knowledge Processing Endpoints (RAG with Vector Embeddings)
 # ============================================================================
@@ -444,18 +1042,23 @@ class KnowledgeProcessResponse(BaseModel):
     knowledge_entries: int
     chunks_created: int
     processing_time_ms: int
+    entries_changed: int = 0
+    entries_unchanged: int = 0
+    entries_removed: int = 0
+    chunks_deleted: int = 0
 
 
 @app.post("/knowledge/process-chunks/{user_id}", response_model=KnowledgeProcessResponse)
 async def process_knowledge_chunks(user_id: str):
     """
-    Process all knowledge_base entries for a user into chunks with embeddings.
+    Process knowledge_base entries for a user into chunks with embeddings.
     
-    This endpoint:
+    Processing is incremental (see src/services/knowledge_processing.py):
     1. Fetches all knowledge_base entries for the user
-    2. Splits them into chunks (500 chars with 100 char overlap)
-    3. Generates embeddings using OpenAI
-    4. Stores chunks in knowledge_chunks table
+    2. Hashes each entry and skips entries whose chunks are up to date
+    3. Splits changed/new entries into chunks (500 chars with 100 char overlap)
+       and generates their embeddings using OpenAI
+    4. Stores the new chunks and deletes chunks of changed or removed entries
     
     Call this after the user creates/updates knowledge base entries.
     Can be called from frontend or triggered automatically.
@@ -474,95 +1077,29 @@ async def process_knowledge_chunks(user_id: str):
     try:
         logger.info(f"Processing knowledge chunks for user {user_id[-4:]}")
         
-        from src.services.supabase_service import _client
-        from src.services.chunking import split_into_chunks, prepare_knowledge_for_chunking
-        from src.services.embeddings import generate_embeddings_batch
-        
-        # 1. Fetch all knowledge_base entries for the user
-        result = _client.table('knowledge_base')\
-            .select('*')\
-            .eq('user_id', user_id)\
-            .execute()
-        
-        knowledge_entries = result.data or []
-        
-        if not knowledge_entries:
-            elapsed_ms = int((time.time() - start) * 1000)
-            logger.info(f"No knowledge entries found for user {user_id[-4:]}")
-            return KnowledgeProcessResponse(
-                message="Nenhuma entrada encontrada na base de conhecimento",
-                knowledge_entries=0,
-                chunks_created=0,
-                processing_time_ms=elapsed_ms
-            )
-        
-        # 2. Delete old chunks for this user (reprocess everything)
-        _client.table('knowledge_chunks')\
-            .delete()\
-            .eq('owner_id', user_id)\
-            .execute()
-        
-        logger.info(f"Cleared old chunks for user {user_id[-4:]}")
-        
-        all_chunks = []
-        
-        # 3. For each knowledge entry, prepare text and split into chunks
-        for entry in knowledge_entries:
-            # Prepare formatted text
-            full_text = prepare_knowledge_for_chunking(entry)
-            
-            # Split into chunks
-            chunks = split_into_chunks(full_text, chunk_size=500, chunk_overlap=100)
-            
-            # Prepare chunk records
-            for chunk_text in chunks:
-                all_chunks.append({
-                    'owner_id': user_id,
-                    'knowledge_id': entry.get('id'),
-                    'category': entry.get('category'),
-                    'source': 'dashboard',
-                    'chunk_text': chunk_text
-                })
-        
-        logger.info(f"Created {len(all_chunks)} chunks from {len(knowledge_entries)} entries")
-        
-        if not all_chunks:
-            elapsed_ms = int((time.time() - start) * 1000)
-            return KnowledgeProcessResponse(
-                message="Nenhum chunk foi criado",
-                knowledge_entries=len(knowledge_entries),
-                chunks_created=0,
-                processing_time_ms=elapsed_ms
-            )
-        
-        # 4. Generate embeddings in batch
-        chunk_texts = [c['chunk_text'] for c in all_chunks]
-        embeddings = await generate_embeddings_batch(chunk_texts)
-        
-        logger.info(f"Generated {len(embeddings)} embeddings")
-        
-        # 5. Add embeddings to chunk records
-        for i, chunk in enumerate(all_chunks):
-            chunk['embedding'] = embeddings[i]
-        
-        # 6. Insert all chunks into knowledge_chunks table
-        _client.table('knowledge_chunks')\
-            .insert(all_chunks)\
-            .execute()
+        async with knowledge_jobs.tenant_lock(user_id):
+            result = await process_knowledge(user_id)
         
         elapsed_ms = int((time.time() - start) * 1000)
         
         logger.info(
             f"Processed knowledge for user {user_id[-4:]}: "
-            f"{len(knowledge_entries)} entries → {len(all_chunks)} chunks "
-            f"in {elapsed_ms}ms"
+            f"{result.knowledge_entries} entries ({result.entries_changed} changed, "
+            f"{result.entries_removed} removed) → {result.chunks_created} chunks "
+            f"created, {result.chunks_deleted} deleted in {elapsed_ms}ms"
         )
         
+        if not result.knowledge_entries and not result.entries_removed:
+            message = "Nenhuma entrada encontrada na base de conhecimento"
+        elif not result.entries_changed and not result.entries_removed:
+            message = "Base de conhecimento já está atualizada"
+        else:
+            message = f"Base de conhecimento processada com sucesso: {result.chunks_created} chunks criados"
+        
         return KnowledgeProcessResponse(
-            message="Chunks processados e embeddings gerados com sucesso",
-            knowledge_entries=len(knowledge_entries),
-            chunks_created=len(all_chunks),
-            processing_time_ms=elapsed_ms
+            message=message,
+            processing_time_ms=elapsed_ms,
+            **result._asdict()
         )
         
     except Exception as e:
@@ -573,6 +1110,56 @@ async def process_knowledge_chunks(user_id: str):
         )
 
 
+class KnowledgeJobResponse(BaseModel):
+    """Status of a background knowledge processing job"""
+    job_id: str
+    user_id: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, int]
+    result: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    superseded_by: Optional[str] = None
+
+
+@app.post("/knowledge/jobs/{user_id}", response_model=KnowledgeJobResponse, status_code=202)
+async def submit_knowledge_job(user_id: str):
+    """
+    Queue processing of a user's knowledge base and return immediately.
+    
+    Same processing as /knowledge/process-chunks, run by a background worker.
+    A job still waiting in the queue for the same user is superseded by the
+    new one. Poll GET /knowledge/jobs/{job_id} for progress.
+    
+    Args:
+        user_id: User UUID
+        
+    Returns:
+        KnowledgeJobResponse with status "queued" (HTTP 202)
+    """
+    job = knowledge_jobs.submit(user_id)
+    return KnowledgeJobResponse(**job.as_dict())
+
+
+@app.get("/knowledge/jobs/{job_id}", response_model=KnowledgeJobResponse)
+async def get_knowledge_job(job_id: str):
+    """
+    Report status and progress of a knowledge processing job.
+    
+    Progress counters: entries_total, entries_chunked, chunks_total,
+    embeddings_done, rows_written, rows_deleted.
+    
+    Raises:
+        HTTPException: 404 if the job is unknown to this worker
+    """
+    job = knowledge_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return KnowledgeJobResponse(**job.as_dict())
+
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting RAG-E Chat Service on port %s", PORT)
@@ -0,0 +1,144 @@
+"""
+Benchmark: streaming chunker (iter_chunks) vs. the previous split_into_chunks.
+
+For each synthetic corpus, reports throughput in MB/s for both
+implementations and checks that they produce the same chunks (parity is
+expected with align_overlap=False). The previous implementation is
+reproduced below as legacy_split_into_chunks, with the one forward-progress
+guard iter_chunks also has: the original moved the window backwards and
+looped forever whenever a sentence ended within chunk_overlap characters of
+the window start.
+
+Corpora:
+- faq: many short knowledge entries (typical knowledge_base sizes)
+- company_doc: one long company document (~1 MB)
+- huge_doc: one very long document (~20 MB) - iter_chunks only keeps the
+  current window, the legacy version first copies the stripped text
+
+Usage:
+    python benchmarks/bench_chunking.py [--repeat 3] [--check]
+
+With --check the script exits with status 1 if chunk outputs differ, so it
+can run in CI.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.services.chunking import iter_chunks  # noqa: E402
+
+_WORDS = (
+    "o plano essencial inclui suporte por email atendimento das 9h às 18h "
+    "preço mensal benefícios integração whatsapp relatórios equipe clientes "
+    "agendamento cancelamento a qualquer momento sem fidelidade pagamento "
+    "pix cartão boleto período de teste grátis serviço consultoria empresa"
+).split()
+
+_ENDINGS = [". ", ". ", ". ", ".\n", "! ", "? ", ", ", "\n\n"]
+
+
+def legacy_split_into_chunks(text, chunk_size=500, chunk_overlap=100):
+    """split_into_chunks as it was before iter_chunks (four rfind scans per window)."""
+    if not text or not text.strip():
+        return []
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text]
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            sentence_end = max(
+                text.rfind('. ', start, end),
+                text.rfind('.\n', start, end),
+                text.rfind('! ', start, end),
+                text.rfind('? ', start, end)
+            )
+            if sentence_end > start:
+                end = sentence_end + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        next_start = end - chunk_overlap
+        start = next_start if next_start > start else end
+    return chunks
+
+
+def make_document(rng: random.Random, size: int) -> str:
+    """Sentences of 40-200 characters until the document reaches size."""
+    parts, length = [], 0
+    while length < size:
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 30)))
+        sentence = sentence[:rng.randint(40, 200)].rstrip() + rng.choice(_ENDINGS)
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)
+
+
+def make_corpora(seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {
+        "faq": [make_document(rng, rng.randint(100, 1500)) for _ in range(2000)],
+        "company_doc": [make_document(rng, 1_000_000)],
+        "huge_doc": [make_document(rng, 20_000_000)],
+    }
+
+
+def _throughput(fn, texts, repeat: int):
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [fn(text) for text in texts]
+        best = min(best, time.perf_counter() - start)
+    return megabytes / best, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--check", action="store_true", help="Exit 1 if outputs differ")
+    args = parser.parse_args()
+
+    def legacy(text):
+        return legacy_split_into_chunks(text, args.chunk_size, args.chunk_overlap)
+
+    def streaming(text):
+        return list(iter_chunks(text, args.chunk_size, args.chunk_overlap))
+
+    def aligned(text):
+        return list(iter_chunks(text, args.chunk_size, args.chunk_overlap, align_overlap=True))
+
+    parity_ok = True
+    print(f"{'corpus':<12} {'legacy MB/s':>12} {'iter MB/s':>10} {'aligned MB/s':>13} "
+          f"{'speedup':>8} {'chunks':>9}  parity")
+
+    for name, texts in make_corpora().items():
+        legacy_mbs, legacy_chunks = _throughput(legacy, texts, args.repeat)
+        stream_mbs, stream_chunks = _throughput(streaming, texts, args.repeat)
+        aligned_mbs, _ = _throughput(aligned, texts, args.repeat)
+
+        parity = legacy_chunks == stream_chunks
+        parity_ok &= parity
+        count = sum(len(chunks) for chunks in stream_chunks)
+        legacy_count = sum(len(chunks) for chunks in legacy_chunks)
+
+        print(f"{name:<12} {legacy_mbs:>12.1f} {stream_mbs:>10.1f} {aligned_mbs:>13.1f} "
+              f"{stream_mbs / legacy_mbs:>7.2f}x {count:>9}  "
+              f"{'ok' if parity else f'MISMATCH (legacy: {legacy_count} chunks)'}")
+
+    if args.check and not parity_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
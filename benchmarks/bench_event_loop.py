@@ -0,0 +1,115 @@
+"""
+Benchmark: per-request asyncio.run() vs. a long-lived event loop.
+
+Compares the two ways the chat path has run async retrieval:
+
+- per_request_loop: every call does asyncio.run() with a fresh
+  httpx.AsyncClient (new event loop, new TCP connection each time) -
+  the old behavior of generate_agent_reply().
+- shared_loop: every call is awaited on one long-lived loop with a shared
+  httpx.AsyncClient, so keep-alive connections are reused - the current
+  behavior under uvicorn.
+
+The "retrieval" is a small HTTP GET against a local keep-alive server, so the
+numbers isolate loop setup and connection setup from network latency.
+
+Usage:
+    python benchmarks/bench_event_loop.py [--requests 500]
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    """Minimal HTTP/1.1 handler that keeps connections open."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _retrieve(client: httpx.AsyncClient, url: str) -> None:
+    response = await client.get(url)
+    response.raise_for_status()
+
+
+def bench_per_request_loop(url: str, n: int) -> list:
+    """Fresh event loop and fresh client for every call."""
+    async def one_call():
+        async with httpx.AsyncClient() as client:
+            await _retrieve(client, url)
+
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        asyncio.run(one_call())
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_shared_loop(url: str, n: int) -> list:
+    """One long-lived loop and one shared client for all calls."""
+    async def run_all():
+        timings = []
+        async with httpx.AsyncClient() as client:
+            for _ in range(n):
+                start = time.perf_counter()
+                await _retrieve(client, url)
+                timings.append(time.perf_counter() - start)
+        return timings
+
+    return asyncio.run(run_all())
+
+
+def _report(name: str, timings: list) -> None:
+    ordered = sorted(timings)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p95 = ordered[int(len(ordered) * 0.95) - 1] * 1000
+    mean = statistics.mean(timings) * 1000
+    print(f"{name:<18} mean={mean:7.3f}ms  p50={p50:7.3f}ms  p95={p95:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Calls per scenario")
+    args = parser.parse_args()
+
+    server = _start_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    try:
+        per_request = bench_per_request_loop(url, args.requests)
+        shared = bench_shared_loop(url, args.requests)
+    finally:
+        server.shutdown()
+
+    print(f"{args.requests} calls per scenario")
+    _report("per_request_loop", per_request)
+    _report("shared_loop", shared)
+    speedup = statistics.mean(per_request) / statistics.mean(shared)
+    print(f"shared_loop is {speedup:.1f}x faster per call")
+
+
+if __name__ == "__main__":
+    main()
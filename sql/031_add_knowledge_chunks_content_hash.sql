@@ -0,0 +1,17 @@
+-- ================================================
+-- Migration 031: Content hash on knowledge chunks
+-- Enables incremental knowledge reprocessing
+-- ================================================
+
+-- 1. Hash of the prepared text of the knowledge_base entry a chunk came from
+ALTER TABLE knowledge_chunks
+ADD COLUMN IF NOT EXISTS content_hash text;
+
+-- 2. Reprocessing reads (knowledge_id, content_hash) for one owner
+CREATE INDEX IF NOT EXISTS idx_knowledge_chunks_owner_knowledge
+ON knowledge_chunks (owner_id, knowledge_id);
+
+COMMENT ON COLUMN knowledge_chunks.content_hash IS
+  'sha256 of the chunking version and the prepared text of the source entry.
+   /knowledge/process-chunks only re-chunks and re-embeds entries whose hash
+   changed. NULL (rows created before this migration) is always reprocessed.';
@@ -0,0 +1,77 @@
+-- ================================================
+-- Migration 032: Structure metadata on knowledge chunks
+-- One chunk per product plan, FAQ or service
+-- ================================================
+
+-- 1. Section of the source entry a chunk covers
+ALTER TABLE knowledge_chunks
+ADD COLUMN IF NOT EXISTS metadata jsonb NOT NULL DEFAULT '{}'::jsonb;
+
+COMMENT ON COLUMN knowledge_chunks.metadata IS
+  'Structure of the chunk within its knowledge_base entry:
+   category, section (product, plan, faq, service, company, ...),
+   title (product/service name, FAQ question, company topic),
+   plan (plan name, section = plan) and part/parts when a long
+   section was split.';
+
+-- 2. Return metadata from vector search (the return type changes,
+--    so the function has to be dropped first)
+DROP FUNCTION IF EXISTS match_knowledge_chunks(vector, int, uuid, text, float);
+
+CREATE OR REPLACE FUNCTION match_knowledge_chunks(
+  query_embedding vector(1536),
+  match_count int DEFAULT 5,
+  filter_user_id uuid DEFAULT NULL,
+  filter_category text DEFAULT NULL,
+  similarity_threshold float DEFAULT 0.7
+)
+RETURNS TABLE (
+  id uuid,
+  owner_id uuid,
+  knowledge_id uuid,
+  category text,
+  source text,
+  chunk_text text,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    kc.id,
+    kc.owner_id,
+    kc.knowledge_id,
+    kc.category,
+    kc.source,
+    kc.chunk_text,
+    kc.metadata,
+    1 - (kc.embedding <=> query_embedding) as similarity
+  FROM knowledge_chunks kc
+  WHERE 
+    (filter_user_id IS NULL OR kc.owner_id = filter_user_id)
+    AND (filter_category IS NULL OR kc.category = filter_category)
+    AND (1 - (kc.embedding <=> query_embedding)) >= similarity_threshold
+  ORDER BY kc.embedding <=> query_embedding
+  LIMIT match_count;
+END;
+$$;
+
+-- DROP FUNCTION discarded the comment from migration 029: restore it
+COMMENT ON FUNCTION match_knowledge_chunks IS 
+  'Semantic search using cosine similarity on embeddings. 
+   Returns TOP-K chunks most similar to query_embedding.
+
+   Parameters:
+   - query_embedding: 1536-dim vector from OpenAI text-embedding-3-small
+   - match_count: number of results to return (default: 5)
+   - filter_user_id: optional user filter for tenant isolation
+   - filter_category: optional category filter (product, faq, company, etc.)
+   - similarity_threshold: minimum similarity score 0-1 (default: 0.7)
+
+   Returns: chunks ordered by similarity (highest first) with scores
+   and their structure metadata';
+
+GRANT EXECUTE ON FUNCTION match_knowledge_chunks TO authenticated;
+GRANT EXECUTE ON FUNCTION match_knowledge_chunks TO anon;
@@ -0,0 +1,12 @@
+-- ================================================
+-- Migration 033: Knowledge context token budget per tenant
+-- ================================================
+
+-- Maximum estimated tokens of knowledge base context in the system prompt.
+-- NULL uses CONTEXT_TOKEN_BUDGET from the environment; 0 disables the limit.
+ALTER TABLE ai_credentials
+ADD COLUMN IF NOT EXISTS context_token_budget integer;
+
+COMMENT ON COLUMN ai_credentials.context_token_budget IS
+  'Token budget for knowledge base context (chunks or fallback entries are
+   kept by relevance until it is full). NULL: server default, 0: no limit.';
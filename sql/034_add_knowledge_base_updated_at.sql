@@ -0,0 +1,32 @@
+-- ================================================
+-- Migration 034: updated_at on knowledge_base
+-- Versions a tenant's knowledge base for the formatted context cache
+-- ================================================
+
+-- 1. Last change of each entry
+ALTER TABLE knowledge_base
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+-- 2. Keep it current on every edit (function from create_conversas_messages.sql)
+CREATE OR REPLACE FUNCTION update_updated_at_column()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_knowledge_base_updated_at ON knowledge_base;
+CREATE TRIGGER update_knowledge_base_updated_at
+    BEFORE UPDATE ON knowledge_base
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- 3. The version check reads max(updated_at) and count(*) for one owner
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_user_updated_at
+ON knowledge_base (user_id, updated_at DESC);
+
+COMMENT ON COLUMN knowledge_base.updated_at IS
+  'Last change of the entry. max(updated_at) and the row count version a
+   tenant''s knowledge base: the formatted fallback context is cached until
+   they change.';
@@ -0,0 +1,61 @@
+-- ================================================
+-- Migration 035: Conversation history in one round trip
+-- Latest messages of a conversation plus the contact name
+-- ================================================
+
+-- 1. Latest messages of a conversation, newest first
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp
+ON messages (conversation_id, timestamp DESC);
+
+-- 2. Conversation lookup and its last p_limit messages (oldest first), with
+--    each message cut to p_max_chars characters (NULL or 0: no cap).
+--    Returns no row when the contact has no conversation.
+CREATE OR REPLACE FUNCTION get_conversation_history(
+  p_user_id uuid,
+  p_external_contact_id text,
+  p_limit int DEFAULT 10,
+  p_max_chars int DEFAULT NULL
+)
+RETURNS TABLE (
+  conversation_id uuid,
+  contact_name text,
+  messages jsonb
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    c.id,
+    c.contact_name,
+    COALESCE((
+      SELECT jsonb_agg(
+        jsonb_build_object(
+          'direction', m.direction,
+          'message', CASE
+            WHEN p_max_chars IS NULL OR p_max_chars <= 0 THEN m.message
+            ELSE left(m.message, p_max_chars)
+          END,
+          'timestamp', m.timestamp
+        )
+        ORDER BY m.timestamp, m.id
+      )
+      FROM (
+        SELECT id, direction, message, timestamp
+        FROM messages
+        WHERE messages.conversation_id = c.id
+        ORDER BY timestamp DESC
+        LIMIT p_limit
+      ) m
+    ), '[]'::jsonb)
+  FROM conversations c
+  WHERE c.user_id = p_user_id
+    AND c.external_contact_id = p_external_contact_id
+  LIMIT 1;
+$$;
+
+GRANT EXECUTE ON FUNCTION get_conversation_history TO authenticated;
+GRANT EXECUTE ON FUNCTION get_conversation_history TO anon;
+
+COMMENT ON FUNCTION get_conversation_history IS
+  'Contact name and the last p_limit messages (oldest first, each capped at
+   p_max_chars characters) of the conversation with a contact.';
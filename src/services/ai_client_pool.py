@@ -0,0 +1,177 @@
+"""
+AI Client Pool
+Bounded LRU registry of AIService instances keyed by tenant credentials.
+
+Building an AIService creates a new OpenAI client, which means a new httpx
+connection pool and new TLS handshakes. Tenants that chat constantly reuse a
+warm client (and its keep-alive connections) from this pool instead.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import httpx
+
+from src.services.ai_service import AIService
+from src.utils.config import (
+    AI_CLIENT_POOL_SIZE,
+    AI_CLIENT_IDLE_TTL,
+    AI_CLIENT_MAX_CONNECTIONS,
+    AI_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+    AI_CLIENT_HTTP2,
+    OPENAI_KEEPALIVE_EXPIRY
+)
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, Optional[str], Optional[str]]
+
+
+class _PooledClient:
+    """AIService plus bookkeeping for LRU/idle eviction."""
+
+    def __init__(self, service: AIService, http_client: httpx.Client):
+        self.service = service
+        self.http_client = http_client
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.evicted = False
+
+
+class AIClientPool:
+    """
+    Thread-safe LRU pool of AIService clients.
+
+    - At most max_size clients are kept; the least recently used one is
+      evicted when a new tenant needs a slot.
+    - Clients idle for longer than idle_ttl seconds are evicted.
+    - Each client has its own capped httpx connection pool, so the number of
+      open connections is bounded by max_size * AI_CLIENT_MAX_CONNECTIONS.
+
+    Evicted clients are closed as soon as no request is using them.
+    """
+
+    def __init__(self, max_size: int = AI_CLIENT_POOL_SIZE, idle_ttl: float = AI_CLIENT_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients: "OrderedDict[PoolKey, _PooledClient]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(api_key: Optional[str], base_url: Optional[str], organization_id: Optional[str]) -> PoolKey:
+        # Never keep raw API keys as dict keys (they can end up in debug output)
+        key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        return key_hash, base_url or None, organization_id or None
+
+    @staticmethod
+    def _create(api_key: Optional[str], base_url: Optional[str], organization_id: Optional[str]) -> _PooledClient:
+        http_client = httpx.Client(
+            http2=AI_CLIENT_HTTP2,
+            limits=httpx.Limits(
+                max_connections=AI_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=AI_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        service = AIService(
+            api_key=api_key,
+            base_url=base_url,
+            organization_id=organization_id,
+            http_client=http_client
+        )
+        return _PooledClient(service, http_client)
+
+    @staticmethod
+    def _close(entry: _PooledClient) -> None:
+        try:
+            entry.http_client.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled AI client: {e}")
+
+    def _evict(self, key: PoolKey) -> None:
+        """Remove a client from the pool (caller holds the lock)."""
+        entry = self._clients.pop(key)
+        entry.evicted = True
+        if entry.in_use == 0:
+            self._close(entry)
+
+    def _evict_idle(self, now: float) -> None:
+        """Evict clients idle for longer than idle_ttl (caller holds the lock)."""
+        expired = [
+            key for key, entry in self._clients.items()
+            if entry.in_use == 0 and now - entry.last_used > self.idle_ttl
+        ]
+        for key in expired:
+            self._evict(key)
+        if expired:
+            logger.info(f"Evicted {len(expired)} idle AI clients")
+
+    @contextmanager
+    def acquire(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        organization_id: Optional[str] = None
+    ) -> Iterator[AIService]:
+        """
+        Borrow the AIService for the given credentials, creating it if needed.
+
+        Args:
+            api_key: Provider API key (None uses the .env default)
+            base_url: Optional custom base URL
+            organization_id: Optional organization ID
+
+        Yields:
+            AIService bound to a warm, pooled HTTP client
+
+        Example:
+            >>> with ai_client_pool.acquire(api_key="sk-...") as ai:
+            ...     reply = ai.generate_response(system_prompt, user_prompt)
+        """
+        key = self._make_key(api_key, base_url, organization_id)
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            entry = self._clients.get(key)
+            if entry is None:
+                while len(self._clients) >= self.max_size:
+                    lru_key = next(iter(self._clients))
+                    self._evict(lru_key)
+                entry = self._create(api_key, base_url, organization_id)
+                self._clients[key] = entry
+                logger.info(f"AI client pool miss (size={len(self._clients)}/{self.max_size})")
+            else:
+                self._clients.move_to_end(key)
+
+            entry.in_use += 1
+            entry.last_used = now
+
+        try:
+            yield entry.service
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                if entry.evicted and entry.in_use == 0:
+                    self._close(entry)
+
+    def close_all(self) -> None:
+        """Close every pooled client. Called on application shutdown."""
+        with self._lock:
+            for key in list(self._clients):
+                self._evict(key)
+        logger.info("AI client pool closed")
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+# Process-wide pool shared by all requests
+ai_client_pool = AIClientPool()
@@ -1,15 +1,38 @@
 """
 AI Credentials Service
 Handles fetching user-specific AI provider credentials from Supabase.
+
+Credentials change rarely, so they are cached in-process with a TTL
+(AI_CREDENTIALS_CACHE_TTL). Tenants without a row (using the .env defaults)
+are cached as well, with a shorter TTL (AI_CREDENTIALS_NEGATIVE_TTL).
 """
 import logging
 from typing import Optional, Dict, Any
 
 from src.services.supabase_service import _client
-from src.utils.config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TEMPERATURE
+from src.utils.cache import TTLCache
+from src.utils.config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    OPENAI_TEMPERATURE,
+    CONTEXT_TOKEN_BUDGET,
+    AI_CREDENTIALS_CACHE_TTL,
+    AI_CREDENTIALS_NEGATIVE_TTL,
+    AI_CREDENTIALS_CACHE_SIZE,
+    CACHE_REFRESH_AHEAD
+)
 
 logger = logging.getLogger(__name__)
 
+# Cached ai_credentials rows by user_id. None means "no active row" (negative entry).
+_credentials_cache = TTLCache(
+    "ai_credentials",
+    ttl=AI_CREDENTIALS_CACHE_TTL,
+    max_size=AI_CREDENTIALS_CACHE_SIZE,
+    refresh_ahead=CACHE_REFRESH_AHEAD,
+    ttl_for=lambda row: AI_CREDENTIALS_CACHE_TTL if row else AI_CREDENTIALS_NEGATIVE_TTL
+)
+
 
 def get_default_credentials() -> Dict[str, Any]:
     """
@@ -35,6 +58,7 @@ def get_user_ai_credentials(user_id: str) -> Dict[str, Any]:
     
     This function retrieves the user's configured AI provider credentials
     (OpenAI, Anthropic, Google, etc.) to use for generating responses.
+    Results are served from the in-process cache when fresh.
     
     Args:
         user_id: User UUID from auth.users
@@ -57,24 +81,65 @@ def get_user_ai_credentials(user_id: str) -> Dict[str, Any]:
         "gpt-4o-mini"
     """
     try:
-        # Use .maybe_single() instead of .single() to handle "no rows" gracefully
-        result = _client.table("ai_credentials") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .eq("is_active", True) \
-            .maybe_single() \
-            .execute()
-        
-        if result.data:
-            logger.info(f"AI credentials found for user_id={user_id[-4:]} provider={result.data.get('provider')}")
-            return result.data
-        else:
-            logger.warning(f"No AI credentials found for user_id={user_id[-4:]}, using defaults from .env")
-            return get_default_credentials()
-            
+        row = _credentials_cache.get_or_load(user_id, lambda: _fetch_credentials_row(user_id))
     except Exception as e:
+        # Not cached: the next request retries the database
         logger.exception(f"Failed to fetch AI credentials for user_id={user_id[-4:]}: {e}")
         return get_default_credentials()
+    
+    if row:
+        return row
+    
+    return get_default_credentials()
+
+
+def _fetch_credentials_row(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Query the active ai_credentials row for a user.
+    
+    Args:
+        user_id: User UUID from auth.users
+        
+    Returns:
+        Credentials row, or None if the user has no active credentials
+        
+    Raises:
+        Exception: If the database query fails
+    """
+    # Use .maybe_single() instead of .single() to handle "no rows" gracefully
+    result = _client.table("ai_credentials") \
+        .select("*") \
+        .eq("user_id", user_id) \
+        .eq("is_active", True) \
+        .maybe_single() \
+        .execute()
+    
+    if result and result.data:
+        logger.info(f"AI credentials found for user_id={user_id[-4:]} provider={result.data.get('provider')}")
+        return result.data
+    
+    logger.warning(f"No AI credentials found for user_id={user_id[-4:]}, using defaults from .env")
+    return None
+
+
+def invalidate_credentials_cache(user_id: str) -> bool:
+    """
+    Drop cached credentials for a user (call after the dashboard edits them).
+    
+    Args:
+        user_id: User UUID
+        
+    Returns:
+        True if an entry was cached
+    """
+    invalidated = _credentials_cache.invalidate(user_id)
+    logger.info(f"AI credentials cache invalidated for user_id={user_id[-4:]} (cached={invalidated})")
+    return invalidated
+
+
+def get_credentials_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss counters of the credentials cache."""
+    return _credentials_cache.stats()
 
 
 def validate_credentials(credentials: Dict[str, Any]) -> bool:
@@ -119,3 +184,23 @@ def get_temperature(credentials: Dict[str, Any], default: float = 0.2) -> float:
     except (ValueError, TypeError):
         logger.warning(f"Invalid temperature value: {credentials.get('temperature')}, using default {default}")
         return default
+
+
+def get_context_token_budget(credentials: Dict[str, Any], default: int = CONTEXT_TOKEN_BUDGET) -> Optional[int]:
+    """
+    Extract the knowledge context token budget from credentials with fallback.
+    
+    Args:
+        credentials: Credentials dictionary
+        default: Budget if the tenant has none configured
+        
+    Returns:
+        Budget in estimated tokens, or None for no limit (a value <= 0)
+    """
+    budget = credentials.get("context_token_budget") if credentials else None
+    try:
+        budget = default if budget is None else int(budget)
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid context_token_budget value: {budget}, using default {default}")
+        budget = default
+    return budget if budget > 0 else None
@@ -4,13 +4,76 @@ Simplified OpenAI integration for generating chat responses.
 Supports user-specific credentials instead of global configuration.
 """
 import logging
-from typing import Optional
+import threading
+from typing import Any, Dict, Iterator, Optional
 
+import httpx
 from openai import OpenAI
 from src.utils.config import OPENAI_API_KEY, OPENAI_MODEL, OPENAI_TEMPERATURE
 
 logger = logging.getLogger(__name__)
 
+# Replies returned instead of raising when the provider gives nothing / fails
+EMPTY_REPLY = "Desculpe, não consegui gerar uma resposta."
+ERROR_REPLY = "Desculpe, tive um problema ao processar sua solicitação. Tente novamente em instantes."
+FALLBACK_REPLIES = (EMPTY_REPLY, ERROR_REPLY)
+
+# Process-wide prompt token counters, used to measure provider prefix-cache hit rates
+_usage_lock = threading.Lock()
+_usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+def _cached_tokens(usage: Any) -> int:
+    """Extract prompt_tokens_details.cached_tokens from a usage object (0 if absent)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        return 0
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def record_usage(usage: Any, model: str) -> None:
+    """
+    Record prompt/cached token counts from a chat completion response.
+    
+    Args:
+        usage: response.usage from the chat completions API (may be None)
+        model: Model used, for logging
+    """
+    if usage is None:
+        return
+    
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cached_tokens = _cached_tokens(usage)
+    
+    with _usage_lock:
+        _usage_totals["requests"] += 1
+        _usage_totals["prompt_tokens"] += prompt_tokens
+        _usage_totals["cached_tokens"] += cached_tokens
+        _usage_totals["completion_tokens"] += completion_tokens
+    
+    logger.info(
+        f"AI usage model={model} prompt_tokens={prompt_tokens} "
+        f"cached_tokens={cached_tokens} completion_tokens={completion_tokens}"
+    )
+
+
+def get_usage_stats() -> Dict[str, Any]:
+    """
+    Return accumulated token counters and the prompt cache hit rate.
+    
+    Returns:
+        Dictionary with requests, prompt/cached/completion tokens and
+        cached_ratio (cached_tokens / prompt_tokens)
+    """
+    with _usage_lock:
+        stats = dict(_usage_totals)
+    prompt_tokens = stats["prompt_tokens"]
+    stats["cached_ratio"] = round(stats["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    return stats
+
 
 class AIService:
     """
@@ -20,7 +83,13 @@ class AIService:
     Uses user-specific credentials when provided, falls back to global config.
     """
     
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, organization_id: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        organization_id: Optional[str] = None,
+        http_client: Optional[httpx.Client] = None
+    ):
         """
         Initialize AI client with custom or default credentials.
         
@@ -28,6 +97,7 @@ class AIService:
             api_key: API key for the provider (uses OPENAI_API_KEY from .env if None)
             base_url: Optional custom base URL for API
             organization_id: Optional organization ID
+            http_client: Optional shared httpx client (see ai_client_pool)
         """
         self.api_key = api_key or OPENAI_API_KEY
         self.base_url = base_url
@@ -39,6 +109,8 @@ class AIService:
             client_kwargs["base_url"] = base_url
         if organization_id:
             client_kwargs["organization"] = organization_id
+        if http_client is not None:
+            client_kwargs["http_client"] = http_client
             
         self.client = OpenAI(**client_kwargs)
         logger.info(f"AIService initialized with {'custom' if api_key else 'default'} credentials")
@@ -87,10 +159,82 @@ class AIService:
                 ],
             )
             
+            record_usage(response.usage, model_to_use)
+            
             reply = response.choices[0].message.content
             logger.info(f"AI response generated successfully using model={model_to_use}")
-            return reply.strip() if reply else "Desculpe, não consegui gerar uma resposta."
+            return reply.strip() if reply else EMPTY_REPLY
             
         except Exception as e:
             logger.exception("AI API call failed with model=%s: %s", model_to_use, e)
-            return "Desculpe, tive um problema ao processar sua solicitação. Tente novamente em instantes."
+            return ERROR_REPLY
+
+    def stream_response(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None
+    ) -> Iterator[str]:
+        """
+        Stream AI response token chunks as they are generated.
+        
+        Same parameters and fallbacks as generate_response(), but yields text
+        deltas instead of waiting for the whole completion.
+        
+        Args:
+            system_prompt: System message defining AI behavior and constraints
+            user_prompt: User message with context and question
+            model: Model to use (uses OPENAI_MODEL from .env if None)
+            temperature: Temperature setting 0.0-2.0 (uses OPENAI_TEMPERATURE from .env if None)
+            
+        Yields:
+            Text deltas; a single fallback message if the call fails before
+            any content was produced
+            
+        Example:
+            >>> for delta in ai.stream_response("You are helpful", "Hi"):
+            ...     print(delta, end="")
+        """
+        model_to_use = model or OPENAI_MODEL
+        temp_to_use = temperature if temperature is not None else OPENAI_TEMPERATURE
+        produced = False
+        
+        # Usage on the final chunk is an OpenAI extension; other
+        # OpenAI-compatible providers may reject stream_options
+        extra_kwargs = {}
+        if not self.base_url:
+            extra_kwargs["stream_options"] = {"include_usage": True}
+        
+        try:
+            stream = self.client.chat.completions.create(
+                model=model_to_use,
+                temperature=temp_to_use,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                stream=True,
+                **extra_kwargs
+            )
+            
+            with stream:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        record_usage(chunk.usage, model_to_use)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        produced = True
+                        yield delta
+            
+            logger.info(f"AI response streamed successfully using model={model_to_use}")
+            
+            if not produced:
+                yield EMPTY_REPLY
+                
+        except Exception as e:
+            logger.exception("AI API streaming call failed with model=%s: %s", model_to_use, e)
+            if not produced:
+                yield ERROR_REPLY
@@ -0,0 +1,191 @@
+"""
+Approximate Nearest Neighbour Index
+Pure NumPy IVF (inverted file) index for large tenant knowledge bases.
+
+Vectors are partitioned into `nlist` clusters with spherical k-means. A query
+only scores the vectors in its `nprobe` closest clusters, so search cost
+grows with n * nprobe / nlist instead of n. Raising nprobe trades latency
+for recall (nprobe == nlist is an exact search).
+
+The index maps clusters to row numbers of a matrix owned by the caller (see
+local_index.TenantIndex) and keeps a contiguous copy of each cluster's
+vectors, so probing a cluster is one dense matrix-vector product instead of a
+scattered gather (the same layout as FAISS IndexIVFFlat). It is built
+incrementally: rows are assigned to the nearest centroid as they are added,
+and the centroids are retrained once the index has grown by
+ANN_RETRAIN_GROWTH since the last training.
+"""
+import logging
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.config import ANN_NLIST, ANN_NPROBE, ANN_RETRAIN_GROWTH
+
+logger = logging.getLogger(__name__)
+
+# Training sample size per cluster (same rule of thumb as FAISS)
+_SAMPLES_PER_CENTROID = 40
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = 10,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Args:
+        vectors: Normalized float32 matrix (n, dims)
+        k: Number of centroids
+        iterations: Lloyd iterations
+        seed: Random seed for the initial centroids
+
+    Returns:
+        Normalized centroid matrix (k, dims)
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # Re-seed empty clusters with random points
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+            norms[empty] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted file index over rows of an external normalized matrix.
+
+    Args:
+        nlist: Number of clusters (0 = sqrt(n) at training time)
+        nprobe: Clusters scanned per query
+        retrain_growth: Retrain centroids when the index grows by this factor
+    """
+
+    def __init__(
+        self,
+        nlist: int = ANN_NLIST,
+        nprobe: int = ANN_NPROBE,
+        retrain_growth: float = ANN_RETRAIN_GROWTH
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.retrain_growth = retrain_growth
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._blocks: List[Optional[Tuple[np.ndarray, np.ndarray]]] = []
+        self.size = 0
+        self.trained_size = 0
+
+    def train(self, matrix: np.ndarray, size: int) -> None:
+        """(Re)train centroids on matrix[:size] and reassign every row."""
+        nlist = self.nlist or max(1, int(math.sqrt(size)))
+        nlist = min(nlist, size)
+        sample_size = min(size, nlist * _SAMPLES_PER_CENTROID)
+        sample = matrix[np.random.default_rng(0).choice(size, size=sample_size, replace=False)]
+
+        self.centroids = spherical_kmeans(sample, nlist)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._blocks = [None] * len(self.centroids)
+        self.size = 0
+        self._assign(matrix, 0, size)
+        self.trained_size = size
+
+        logger.info(f"Trained IVF index: {size} vectors, {len(self.centroids)} lists")
+
+    def add(self, matrix: np.ndarray, start: int, end: int) -> None:
+        """
+        Index rows matrix[start:end] (rows must be added in order).
+
+        Trains on first use and retrains when the index has grown by
+        retrain_growth since the last training.
+        """
+        if self.centroids is None or end >= self.trained_size * self.retrain_growth:
+            self.train(matrix, end)
+            return
+        self._assign(matrix, start, end)
+
+    def _assign(self, matrix: np.ndarray, start: int, end: int) -> None:
+        if end <= start:
+            return
+        assignment = np.argmax(matrix[start:end] @ self.centroids.T, axis=1)
+        for offset, cluster in enumerate(assignment):
+            self._lists[cluster].append(start + offset)
+            self._blocks[cluster] = None
+        self.size = end
+
+    def _block(self, matrix: np.ndarray, cluster: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(row numbers, contiguous vectors) of a cluster, rebuilt after adds."""
+        block = self._blocks[cluster]
+        if block is None:
+            rows = np.asarray(self._lists[cluster], dtype=np.int64)
+            block = (rows, np.ascontiguousarray(matrix[rows]))
+            self._blocks[cluster] = block
+        return block
+
+    @property
+    def nbytes(self) -> int:
+        """Memory once every cluster block is built (centroids, row numbers, vector copies)."""
+        if self.centroids is None:
+            return 0
+        return int(self.centroids.nbytes + self.size * (8 + self.centroids.shape[1] * 4))
+
+    def probe(
+        self,
+        matrix: np.ndarray,
+        query: np.ndarray,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every vector in the nprobe clusters closest to the query.
+
+        Args:
+            matrix: Matrix the index was built on
+            query: Normalized query vector
+            nprobe: Override of the configured nprobe
+
+        Returns:
+            Tuple of (row numbers, cosine scores), unordered
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        blocks = [self._block(matrix, int(c)) for c in probes]
+        rows = np.concatenate([rows for rows, _ in blocks])
+        scores = np.concatenate([vectors @ query for _, vectors in blocks])
+        return rows, scores
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by cosine similarity.
+
+        Returns:
+            Tuple of (row numbers, scores), best first
+        """
+        rows, scores = self.probe(matrix, query, nprobe)
+        if len(rows) == 0:
+            return rows, scores
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return rows[best], scores[best]
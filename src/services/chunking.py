@@ -4,75 +4,143 @@ Splits text into overlapping chunks for vector embeddings.
 """
 import logging
 import re
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterator, List, NamedTuple
 
 logger = logging.getLogger(__name__)
 
 
-def split_into_chunks(
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def iter_chunks(
     text: str,
     chunk_size: int = 500,
-    chunk_overlap: int = 100
-) -> List[str]:
+    chunk_overlap: int = 100,
+    align_overlap: bool = False
+) -> Iterator[str]:
     """
-    Split text into overlapping chunks.
+    Lazily split text into overlapping chunks.
     
-    Tries to break at sentence boundaries for better semantic coherence.
+    Each window of chunk_size characters is cut after the last sentence end
+    (". ", ".\n", "! ", "? ") inside it. Sentence ends are found with
+    single-character rfind() calls (memrchr) and a check of the following
+    character; "!" and "?" are only searched after the last "." end. The
+    text is never copied as a whole (only the yielded chunks are).
     
     Args:
         text: Full text to split
         chunk_size: Maximum size of each chunk in characters
         chunk_overlap: Overlap between chunks to maintain context
+        align_overlap: Start each overlap at a word boundary instead of
+            mid-word (the overlap shrinks to the next word start)
+    
+    Yields:
+        Non-empty, stripped text chunks in order
     
-    Returns:
-        List of text chunks
-        
     Example:
-        >>> text = "First sentence. Second sentence. Third sentence."
-        >>> chunks = split_into_chunks(text, chunk_size=30, chunk_overlap=10)
-        >>> len(chunks)
-        2
+        >>> text = "Plano Essencial. Suporte por email. Atendimento das 9h às 18h."
+        >>> list(iter_chunks(text, chunk_size=40, chunk_overlap=15))
+        ['Plano Essencial. Suporte por email.', 'orte por email.', 'Atendimento das 9h às 18h.']
+        >>> list(iter_chunks(text, chunk_size=40, chunk_overlap=15, align_overlap=True))
+        ['Plano Essencial. Suporte por email.', 'por email. Atendimento das 9h às 18h.']
     """
-    if not text or not text.strip():
-        return []
-    
-    text = text.strip()
+    if not text:
+        return
     
     if len(text) <= chunk_size:
-        return [text]
+        text = text.strip()
+        if text:
+            yield text
+        return
+    
+    # Bounds of text.strip(), without the copy
+    lo, hi = 0, len(text)
+    while lo < hi and text[lo].isspace():
+        lo += 1
+    while hi > lo and text[hi - 1].isspace():
+        hi -= 1
+    if lo == hi:
+        return
     
-    chunks = []
-    start = 0
+    if hi - lo <= chunk_size:
+        yield text[lo:hi]
+        return
     
-    while start < len(text):
+    rfind = text.rfind
+    start = lo
+    
+    while start < hi:
         end = start + chunk_size
         
         # If not at the end, try to break at sentence boundary
-        if end < len(text):
-            # Look for sentence endings: ". ", ".\n", "! ", "? "
-            sentence_end = max(
-                text.rfind('. ', start, end),
-                text.rfind('.\n', start, end),
-                text.rfind('! ', start, end),
-                text.rfind('? ', start, end)
-            )
+        if end < hi:
+            # The boundary char must be followed by its space inside the window
+            stop = end - 1
+            best = rfind('.', start, stop)
+            while best > start and text[best + 1] not in ' \n':
+                best = rfind('.', start, best)
+            
+            floor = best + 1 if best > start else start
+            for mark in '!?':
+                pos = rfind(mark, floor, stop)
+                while pos > start and text[pos + 1] != ' ':
+                    pos = rfind(mark, floor, pos)
+                if pos > best:
+                    best = pos
             
-            if sentence_end > start:
-                end = sentence_end + 1  # Include the period
+            if best > start:
+                end = best + 1  # Include the punctuation
         
         chunk = text[start:end].strip()
+        if chunk:  # Only yield non-empty chunks
+            yield chunk
         
-        if chunk:  # Only add non-empty chunks
-            chunks.append(chunk)
+        if end >= hi:
+            break
         
         # Move start position with overlap
-        start = end - chunk_overlap
+        next_start = end - chunk_overlap
         
-        # Prevent infinite loop - if we've already passed the end
-        if end >= len(text):
-            break
+        if align_overlap and next_start > start and not text[next_start - 1].isspace():
+            space = _WHITESPACE_RE.search(text, next_start, end)
+            if space is not None:
+                next_start = space.end()
+        
+        # Always advance (a sentence end near the window start would
+        # otherwise move the window backwards forever)
+        start = next_start if next_start > start else end
+
+
+def split_into_chunks(
+    text: str,
+    chunk_size: int = 500,
+    chunk_overlap: int = 100,
+    align_overlap: bool = False
+) -> List[str]:
+    """
+    Split text into overlapping chunks.
+    
+    Tries to break at sentence boundaries for better semantic coherence.
+    See iter_chunks() for the lazy version.
+    
+    Args:
+        text: Full text to split
+        chunk_size: Maximum size of each chunk in characters
+        chunk_overlap: Overlap between chunks to maintain context
+        align_overlap: Start each overlap at a word boundary
+    
+    Returns:
+        List of text chunks
+        
+    Example:
+        >>> text = "First sentence. Second sentence. Third sentence."
+        >>> chunks = split_into_chunks(text, chunk_size=30, chunk_overlap=10)
+        >>> len(chunks)
+        3
+    """
+    chunks = list(iter_chunks(text, chunk_size, chunk_overlap, align_overlap))
     
-    logger.debug(f"Split text ({len(text)} chars) into {len(chunks)} chunks")
+    logger.debug(f"Split text ({len(text or '')} chars) into {len(chunks)} chunks")
     
     return chunks
 
@@ -201,3 +269,188 @@ def prepare_knowledge_for_chunking(knowledge_entry: Dict[str, Any]) -> str:
     logger.debug(f"Prepared knowledge entry (category: {category}, length: {len(result)})")
     
     return result if result else "Sem conteúdo disponível"
+
+
+class KnowledgeSection(NamedTuple):
+    """A self-contained part of a knowledge entry (e.g. one plan of a product)."""
+    header: str
+    body: str
+    metadata: Dict[str, Any]
+
+
+def _knowledge_sections(knowledge_entry: Dict[str, Any]) -> List[KnowledgeSection]:
+    """
+    Split a knowledge_base entry into sections, using the same fields and
+    labels as prepare_knowledge_for_chunking() (so its content hash still
+    covers everything chunked).
+    """
+    category = knowledge_entry.get("category", "").lower()
+    data = knowledge_entry.get("data", {})
+    
+    if not isinstance(data, dict):
+        return [KnowledgeSection("", str(data), {"category": category, "section": "entry"})]
+    
+    header = [f"Categoria: {category.upper()}"] if category else []
+    body: List[str] = []
+    metadata: Dict[str, Any] = {"category": category, "section": category or "entry"}
+    
+    if category == "product":
+        if data.get("nome"):
+            header.append(f"Produto: {data['nome']}")
+            metadata["title"] = data["nome"]
+        
+        if data.get("descricao"):
+            body.append(f"Descrição: {data['descricao']}")
+        
+        if data.get("tipo_produto"):
+            body.append(f"Tipo: {data['tipo_produto']}")
+        
+        if data.get("preco"):
+            body.append(f"Preço: {data['preco']}")
+        elif data.get("preco_mensal"):
+            body.append(f"Preço mensal: R$ {data['preco_mensal']}")
+        
+        if data.get("periodo_trial"):
+            body.append(f"Período de teste grátis: {data['periodo_trial']} dias")
+        
+        if data.get("formas_pagamento"):
+            body.append(f"Formas de pagamento: {data['formas_pagamento']}")
+        
+        # One section per plan, each repeating the product header
+        plans: List[KnowledgeSection] = []
+        if data.get("planos") and isinstance(data["planos"], list):
+            for plano in data["planos"]:
+                plano_parts = []
+                if plano.get("nome"):
+                    plano_parts.append(f"Plano: {plano['nome']}")
+                if plano.get("preco_mensal"):
+                    plano_parts.append(f"Preço mensal: R$ {plano['preco_mensal']}")
+                if plano.get("beneficios"):
+                    plano_parts.append(f"Benefícios: {', '.join(plano['beneficios'])}")
+                if plano_parts:
+                    plans.append(KnowledgeSection(
+                        "\n\n".join(header),
+                        "\n".join(plano_parts),
+                        {**metadata, "section": "plan", "plan": plano.get("nome")}
+                    ))
+        
+        if body or not plans:
+            plans.insert(0, KnowledgeSection("\n\n".join(header), "\n\n".join(body), metadata))
+        return plans
+    
+    if category == "faq":
+        if data.get("pergunta"):
+            header.append(f"Pergunta: {data['pergunta']}")
+            metadata["title"] = data["pergunta"]
+        
+        if data.get("resposta"):
+            body.append(f"Resposta: {data['resposta']}")
+    
+    elif category == "company":
+        titulo = data.get("titulo") or data.get("topico")
+        conteudo = data.get("descricao") or data.get("conteudo")
+        
+        if titulo:
+            header.append(f"Assunto: {titulo}")
+            metadata["title"] = titulo
+        
+        if conteudo:
+            body.append(conteudo)
+    
+    elif category == "service":
+        if data.get("nome"):
+            header.append(f"Serviço: {data['nome']}")
+            metadata["title"] = data["nome"]
+        
+        if data.get("descricao"):
+            body.append(f"Descrição: {data['descricao']}")
+        
+        if data.get("preco"):
+            body.append(f"Preço: {data['preco']}")
+        
+        if data.get("duracao"):
+            body.append(f"Duração: {data['duracao']}")
+    
+    else:
+        for key, value in data.items():
+            if isinstance(value, (str, int, float, bool)):
+                body.append(f"{key}: {value}")
+            elif isinstance(value, list):
+                body.append(f"{key}: {', '.join(str(v) for v in value)}")
+    
+    return [KnowledgeSection("\n\n".join(header), "\n\n".join(body), metadata)]
+
+
+def iter_knowledge_chunks(
+    knowledge_entry: Dict[str, Any],
+    chunk_size: int = 500,
+    chunk_overlap: int = 100
+) -> Iterator[Dict[str, Any]]:
+    """
+    Structure-aware chunking of a knowledge_base entry.
+    
+    Emits one self-contained chunk per section: the overview of a product and
+    each of its plans (with the product header repeated), or a whole FAQ,
+    service or company entry. Only a section longer than chunk_size is split,
+    and every piece of it starts with the section header again.
+    
+    Args:
+        knowledge_entry: Dict with "category" and "data" from knowledge_base
+        chunk_size: Maximum size of each chunk in characters
+        chunk_overlap: Overlap between pieces of a split section
+    
+    Yields:
+        {"chunk_text": str, "metadata": {"category", "section", "title",
+        "plan", "part", "parts"}} (title/plan only when known; part/parts
+        only on split sections)
+    
+    Example:
+        >>> entry = {
+        ...     "category": "product",
+        ...     "data": {
+        ...         "nome": "RAG-E",
+        ...         "planos": [
+        ...             {"nome": "Essencial", "preco_mensal": "260"},
+        ...             {"nome": "Pro", "preco_mensal": "520"}
+        ...         ]
+        ...     }
+        ... }
+        >>> [c["metadata"].get("plan") for c in iter_knowledge_chunks(entry)]
+        ['Essencial', 'Pro']
+        >>> print(next(iter_knowledge_chunks(entry))["chunk_text"])
+        Categoria: PRODUCT
+        <BLANKLINE>
+        Produto: RAG-E
+        <BLANKLINE>
+        Plano: Essencial
+        Preço mensal: R$ 260
+    """
+    emitted = False
+    for header, body, metadata in _knowledge_sections(knowledge_entry):
+        text = f"{header}\n\n{body}" if header and body else header or body
+        if not text.strip():
+            continue
+        
+        # A header taking most of the window leaves no room to repeat it
+        body_size = chunk_size - len(header) - 2
+        if len(text) <= chunk_size or body_size < chunk_size // 2:
+            pieces = list(iter_chunks(text, chunk_size, chunk_overlap, align_overlap=True))
+        else:
+            overlap = min(chunk_overlap, body_size // 2)
+            pieces = [
+                f"{header}\n\n{piece}" if header else piece
+                for piece in iter_chunks(body, body_size, overlap, align_overlap=True)
+            ]
+        
+        for part, piece in enumerate(pieces, 1):
+            chunk_metadata = {key: value for key, value in metadata.items() if value is not None}
+            if len(pieces) > 1:
+                chunk_metadata.update(part=part, parts=len(pieces))
+            emitted = True
+            yield {"chunk_text": piece, "metadata": chunk_metadata}
+    
+    if not emitted:
+        yield {
+            "chunk_text": "Sem conteúdo disponível",
+            "metadata": {"category": knowledge_entry.get("category", "").lower(), "section": "entry"}
+        }
@@ -0,0 +1,116 @@
+"""
+Context Assembly Service
+Fits knowledge base context into a per-tenant token budget.
+
+Retrieved chunks (or, on the fallback path, formatted knowledge_base
+entries) are candidate sections. assemble_context() adds them greedily by
+relevance while they fit the budget: a section that does not fit is
+skipped and smaller, less relevant ones are still tried. Token counts come
+from the local estimator (src.utils.tokens), so no tokenizer or API call is
+involved, and every assembled context reports what each section cost.
+"""
+import logging
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from src.utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w{3,}")
+
+
+class ContextSection(NamedTuple):
+    """A candidate piece of context."""
+    name: str
+    text: str
+    relevance: float = 0.0
+
+
+class AssembledContext(NamedTuple):
+    """Result of assemble_context()."""
+    text: str
+    budget: Optional[int]
+    tokens_used: int
+    section_tokens: Dict[str, int]
+    dropped: List[str]
+
+
+def lexical_relevance(query: str, text: str) -> float:
+    """
+    Fraction of the query's words (3+ characters) that appear in text.
+
+    Used to rank sections that have no similarity score (the fallback path).
+
+    Example:
+        >>> lexical_relevance("preço do plano Essencial", "Plano Essencial: R$ 260/mês")
+        0.6667
+    """
+    terms = {word.lower() for word in _WORD_RE.findall(query or "")}
+    if not terms:
+        return 0.0
+    words = {word.lower() for word in _WORD_RE.findall(text or "")}
+    return round(len(terms & words) / len(terms), 4)
+
+
+def assemble_context(
+    header: str,
+    sections: List[ContextSection],
+    budget: Optional[int] = None,
+    separator: str = "\n"
+) -> AssembledContext:
+    """
+    Build a context string from the most relevant sections that fit a budget.
+
+    Sections are tried in descending relevance (ties keep their input
+    order) and kept in that order in the output. The header is always
+    included and counts against the budget.
+
+    Args:
+        header: Text placed before the sections
+        sections: Candidate sections
+        budget: Maximum estimated tokens of the result (None: no limit)
+        separator: Joins the header and the sections
+
+    Returns:
+        AssembledContext with the text, estimated tokens used, tokens per
+        included section (by name) and the names of dropped sections
+
+    Example:
+        >>> result = assemble_context("KB:", [
+        ...     ContextSection("a", "x" * 70, relevance=0.9),
+        ...     ContextSection("b", "y" * 700, relevance=0.8),
+        ...     ContextSection("c", "z" * 35, relevance=0.1),
+        ... ], budget=40)
+        >>> result.section_tokens, result.dropped
+        ({'a': 20, 'c': 10}, ['b'])
+    """
+    separator_tokens = estimate_tokens(separator)
+    used = estimate_tokens(header)
+    parts = [header] if header else []
+    section_tokens: Dict[str, int] = {}
+    dropped: List[str] = []
+
+    for section in sorted(sections, key=lambda s: s.relevance, reverse=True):
+        tokens = estimate_tokens(section.text)
+        cost = tokens + (separator_tokens if parts else 0)
+        if budget is not None and used + cost > budget:
+            dropped.append(section.name)
+            continue
+        parts.append(section.text)
+        section_tokens[section.name] = tokens
+        used += cost
+
+    if dropped:
+        logger.info(
+            f"Context budget {budget} tokens: kept {len(section_tokens)} sections "
+            f"({used} tokens), dropped {len(dropped)}"
+        )
+
+    return AssembledContext(
+        text=separator.join(parts),
+        budget=budget,
+        tokens_used=used,
+        section_tokens=section_tokens,
+        dropped=dropped
+    )
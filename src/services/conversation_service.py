@@ -9,6 +9,8 @@ from supabase import Client
 
 from src.services.supabase_service import _client
 from src.models.conversation import ConversationUpsertRequest
+from src.services.history_buffer import history_buffers
+from src.utils.config import HISTORY_BUFFER_ENABLED
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +69,11 @@ async def upsert_conversation(request: ConversationUpsertRequest) -> tuple[str,
                     .execute()
                 
                 logger.info(f"Updated conversation {conversation_id} with changes: {list(updates.keys())}")
+                
+                if HISTORY_BUFFER_ENABLED and "contact_name" in updates:
+                    history_buffers.set_contact_name(
+                        (request.user_id, request.external_contact_id), request.contact_name
+                    )
             
             return conversation_id, False
         
@@ -99,6 +106,10 @@ async def upsert_conversation(request: ConversationUpsertRequest) -> tuple[str,
             conversation_id = result.data[0]["id"]
             logger.info(f"Created new conversation {conversation_id} for user {request.user_id}")
             
+            if HISTORY_BUFFER_ENABLED:
+                # A new conversation has no history: buffer it from the start
+                history_buffers.start((request.user_id, request.external_contact_id), request.contact_name)
+            
             return conversation_id, True
             
     except Exception as e:
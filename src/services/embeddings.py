@@ -2,24 +2,158 @@
 Embeddings Service
 Generates vector embeddings using OpenAI API for semantic search.
 """
+import asyncio
 import logging
-from typing import List
+import random
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import openai
 from openai import AsyncOpenAI
-from src.utils.config import OPENAI_API_KEY
+from src.utils.config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_BATCH_MAX_ITEMS,
+    EMBEDDING_BATCH_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_RETRY_BASE_DELAY,
+    EMBEDDING_RETRY_MAX_DELAY
+)
+from src.utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client (singleton).
+# The underlying httpx pool binds to the event loop on first use, so this
+# client must only be awaited from the server's long-lived loop - never from
+# a per-request asyncio.run(), which would discard its keep-alive connections.
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
 
 # Default embedding model (1536 dimensions)
 DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
 
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Errors worth retrying in batch embedding (rate limits and transient failures)
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+def normalize_query_text(text: str) -> str:
+    """
+    Normalize a query for cache lookups: Unicode NFC, casefolded, with
+    surrounding whitespace stripped and inner whitespace collapsed.
+    
+    Example:
+        >>> normalize_query_text("  Quero   saber MAIS ")
+        'quero saber mais'
+    """
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    LRU cache of query embeddings bounded by memory.
+    
+    Vectors are stored as float32 NumPy arrays (6 KB for 1536 dims instead of
+    ~50 KB as a list of Python floats). Keys are (model, normalized text).
+    
+    Args:
+        max_bytes: Memory budget for stored vectors
+    """
+    
+    def __init__(self, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, model: str, text: str):
+        """Return the cached vector (float32 array) or None."""
+        key = (model, normalize_query_text(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+    
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        """Store an embedding, evicting least recently used vectors over budget."""
+        if self.max_bytes <= 0:
+            return
+        key = (model, normalize_query_text(text))
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = vector
+            self._bytes += vector.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+    
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return size, memory use and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": "embeddings",
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Process-wide cache of query embeddings
+embedding_cache = EmbeddingCache()
+
 
 async def generate_embedding(text: str, model: str = DEFAULT_EMBEDDING_MODEL) -> List[float]:
     """
     Generate embedding vector for a single text using OpenAI API.
     
+    Results are cached by normalized text (see EmbeddingCache), so repeated
+    short messages ("oi", "preço") don't call the API again.
+    
     Args:
         text: Text to generate embedding for
         model: OpenAI embedding model (default: text-embedding-3-small = 1536 dims)
@@ -37,6 +171,10 @@ async def generate_embedding(text: str, model: str = DEFAULT_EMBEDDING_MODEL) ->
             logger.warning("Empty text provided for embedding generation")
             return [0.0] * 1536  # Return zero vector for empty text
         
+        cached = embedding_cache.get(model, text)
+        if cached is not None:
+            return cached.tolist()
+        
         response = await client.embeddings.create(
             model=model,
             input=text.strip()
@@ -45,6 +183,8 @@ async def generate_embedding(text: str, model: str = DEFAULT_EMBEDDING_MODEL) ->
         embedding = response.data[0].embedding
         logger.debug(f"Generated embedding for text (length: {len(text)}, dims: {len(embedding)})")
         
+        embedding_cache.put(model, text, embedding)
+        
         return embedding
         
     except Exception as e:
@@ -52,22 +192,108 @@ async def generate_embedding(text: str, model: str = DEFAULT_EMBEDDING_MODEL) ->
         raise
 
 
+def pack_batches(
+    texts: List[str],
+    indices: List[int],
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+    max_items: int = EMBEDDING_BATCH_MAX_ITEMS
+) -> List[List[int]]:
+    """
+    Group texts into request batches by estimated token count.
+    
+    Texts are packed in order; a batch is closed when adding the next text
+    would exceed max_tokens or max_items (a single oversized text still gets
+    its own batch).
+    
+    Args:
+        texts: Texts to embed
+        indices: Positions of the texts to pack
+        max_tokens: Estimated token budget per request
+        max_items: Inputs per request (OpenAI allows 2048)
+    
+    Returns:
+        List of batches, each a list of positions into texts
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    batch_tokens = 0
+    
+    for i in indices:
+        tokens = estimate_tokens(texts[i])
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Exponential backoff with full jitter, honoring Retry-After when sent."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), EMBEDDING_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(EMBEDDING_RETRY_MAX_DELAY, EMBEDDING_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def _create_embeddings(texts: List[str], model: str) -> List[List[float]]:
+    """One embeddings request, retried on rate limits and transient errors."""
+    # Retries are handled here (with jitter) instead of by the SDK
+    no_sdk_retries = client.with_options(max_retries=0)
+    
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            response = await no_sdk_retries.embeddings.create(model=model, input=texts)
+            return [item.embedding for item in response.data]
+        except _RETRYABLE_ERRORS as e:
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, e)
+            logger.warning(
+                f"Embedding batch of {len(texts)} failed ({type(e).__name__}), "
+                f"retry {attempt + 1}/{EMBEDDING_MAX_RETRIES} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+    
+    raise RuntimeError("unreachable")
+
+
 async def generate_embeddings_batch(
     texts: List[str], 
-    model: str = DEFAULT_EMBEDDING_MODEL
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    on_progress: Optional[Callable[[int], None]] = None,
+    semaphore: Optional[asyncio.Semaphore] = None
 ) -> List[List[float]]:
     """
-    Generate embeddings for multiple texts in a single API call.
-    More efficient than calling generate_embedding() multiple times.
+    Generate embeddings for many texts with few, concurrent API calls.
     
-    OpenAI allows up to 2048 texts per batch.
+    Texts are packed into requests by estimated tokens (pack_batches), up to
+    EMBEDDING_BATCH_CONCURRENCY requests run at once, and rate-limit or
+    transient errors are retried with exponential backoff and jitter.
+    Concurrent calls can share one limit by passing the same semaphore.
     
     Args:
         texts: List of texts to generate embeddings for
         model: OpenAI embedding model (default: text-embedding-3-small)
+        on_progress: Optional callback receiving the number of texts
+            embedded by each completed request
+        semaphore: Limits concurrent requests (a new one allowing
+            EMBEDDING_BATCH_CONCURRENCY if None)
     
     Returns:
-        List of embedding vectors, one per input text
+        List of embedding vectors, one per input text (zero vectors for
+        empty texts)
+        
+    Raises:
+        Exception: If a request still fails after EMBEDDING_MAX_RETRIES
+            (pending requests are cancelled)
         
     Example:
         >>> texts = ["Product A", "Product B", "Product C"]
@@ -82,54 +308,49 @@ async def generate_embeddings_batch(
             logger.warning("Empty texts list provided for batch embedding generation")
             return []
         
-        # Filter out empty texts but keep track of original indices
-        valid_texts = []
-        valid_indices = []
+        stripped = [text.strip() if text else "" for text in texts]
+        valid_indices = [i for i, text in enumerate(stripped) if text]
         
-        for i, text in enumerate(texts):
-            if text and text.strip():
-                valid_texts.append(text.strip())
-                valid_indices.append(i)
+        # Zero vectors for empty texts; filled in place, so mapping back is linear
+        result: List[List[float]] = [[0.0] * 1536 for _ in texts]
         
-        if not valid_texts:
+        if not valid_indices:
             logger.warning("All texts were empty after filtering")
-            return [[0.0] * 1536] * len(texts)
-        
-        # OpenAI limit is 2048 texts per batch
-        if len(valid_texts) > 2048:
-            logger.warning(f"Batch size {len(valid_texts)} exceeds limit, processing in chunks")
-            
-            # Process in chunks of 2048
-            all_embeddings = []
-            for i in range(0, len(valid_texts), 2048):
-                chunk = valid_texts[i:i + 2048]
-                response = await client.embeddings.create(
-                    model=model,
-                    input=chunk
-                )
-                all_embeddings.extend([item.embedding for item in response.data])
-        else:
-            response = await client.embeddings.create(
-                model=model,
-                input=valid_texts
-            )
-            all_embeddings = [item.embedding for item in response.data]
+            return result
         
-        # Reconstruct full list with zero vectors for empty texts
-        result = []
-        valid_idx = 0
+        batches = pack_batches(stripped, valid_indices)
+        semaphore = semaphore or asyncio.Semaphore(EMBEDDING_BATCH_CONCURRENCY)
         
-        for i in range(len(texts)):
-            if i in valid_indices:
-                result.append(all_embeddings[valid_idx])
-                valid_idx += 1
-            else:
-                result.append([0.0] * 1536)  # Zero vector for empty text
+        async def run_batch(batch: List[int]) -> None:
+            async with semaphore:
+                embeddings = await _create_embeddings([stripped[i] for i in batch], model)
+            for i, embedding in zip(batch, embeddings):
+                result[i] = embedding
+            if on_progress:
+                on_progress(len(batch))
         
-        logger.info(f"Generated {len(result)} embeddings in batch")
+        tasks = [asyncio.create_task(run_batch(batch)) for batch in batches]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        logger.info(f"Generated {len(result)} embeddings in {len(batches)} requests")
         
         return result
         
     except Exception as e:
         logger.exception(f"Failed to generate batch embeddings: {e}")
         raise
+
+
+async def close_client() -> None:
+    """
+    Close the shared embeddings client and its connection pool.
+    
+    Called once on application shutdown.
+    """
+    await client.close()
+    logger.info("Embeddings client closed")
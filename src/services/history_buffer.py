@@ -0,0 +1,227 @@
+"""
+Conversation History Buffers
+Write-through in-memory ring of the latest messages of each conversation.
+
+n8n posts every inbound and outbound message to /messages and, moments
+later, /chat reads the same conversation back. create_message() appends each
+stored message to the conversation's ring, and get_conversation_history()
+serves from it while it is warm, so active conversations need no history
+read from the database.
+
+A ring becomes warm when a conversation is created in this worker (empty
+history) or when its history is read from the database once (seed). Rings
+expire HISTORY_BUFFER_TTL seconds after they were created, however active
+the conversation is, and the least recently used are evicted beyond
+HISTORY_BUFFER_MAX_CONVERSATIONS. The TTL bounds how long a ring can miss
+messages stored by other worker processes or conversation updates made
+outside conversation_service and state_manager.
+
+A write that lands while the same conversation is being read from the
+database makes that read's result stale, so it is not used as a seed.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.config import (
+    HISTORY_BUFFER_SIZE,
+    HISTORY_BUFFER_TTL,
+    HISTORY_BUFFER_MAX_CONVERSATIONS
+)
+
+logger = logging.getLogger(__name__)
+
+# (user_id, external_contact_id)
+ConversationKey = Tuple[str, str]
+
+
+class _ConversationRing:
+    """Latest messages (oldest first) and contact name of one conversation."""
+
+    def __init__(self, contact_name: Optional[str], messages: List[Dict[str, Any]], capacity: int):
+        self.contact_name = contact_name
+        self.messages: deque = deque(messages, maxlen=capacity)
+        self.created_at = time.monotonic()
+
+
+class ConversationHistoryBuffers:
+    """
+    Thread-safe per-conversation ring buffers.
+
+    Args:
+        capacity: Messages kept per conversation
+        ttl: Seconds a ring stays valid after it was created or seeded
+        max_conversations: Conversations kept in memory (least recently used evicted)
+    """
+
+    def __init__(
+        self,
+        capacity: int = HISTORY_BUFFER_SIZE,
+        ttl: float = HISTORY_BUFFER_TTL,
+        max_conversations: int = HISTORY_BUFFER_MAX_CONVERSATIONS
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._rings: "OrderedDict[ConversationKey, _ConversationRing]" = OrderedDict()
+        # In-flight database reads per conversation: [reads, writes seen since]
+        self._loading: Dict[ConversationKey, List[int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ring(self, key: ConversationKey) -> Optional[_ConversationRing]:
+        """Live ring for a key (expired rings are dropped). Caller holds the lock."""
+        ring = self._rings.get(key)
+        if ring is not None and ring.created_at <= time.monotonic() - self.ttl:
+            del self._rings[key]
+            ring = None
+        return ring
+
+    def _store(self, key: ConversationKey, ring: _ConversationRing) -> None:
+        """Insert a ring, evicting the least recently used. Caller holds the lock."""
+        self._rings[key] = ring
+        self._rings.move_to_end(key)
+        while len(self._rings) > self.max_conversations:
+            self._rings.popitem(last=False)
+
+    def get(self, key: ConversationKey, limit: int) -> Optional[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Latest messages of a conversation from its ring.
+
+        Args:
+            key: (user_id, external_contact_id)
+            limit: Number of messages (more than the capacity is always a miss)
+
+        Returns:
+            Tuple of (messages oldest first, contact_name), or None on a miss
+        """
+        with self._lock:
+            ring = self._ring(key) if limit <= self.capacity else None
+            if ring is None:
+                self.misses += 1
+                return None
+            self._rings.move_to_end(key)
+            self.hits += 1
+            messages = list(ring.messages)
+            return messages[-limit:] if limit > 0 else [], ring.contact_name
+
+    def begin_load(self, key: ConversationKey) -> int:
+        """
+        Register a database read of a conversation's history.
+
+        Returns:
+            Token to pass to finish_load()
+        """
+        with self._lock:
+            loading = self._loading.setdefault(key, [0, 0])
+            loading[0] += 1
+            return loading[1]
+
+    def finish_load(
+        self,
+        key: ConversationKey,
+        token: int,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        contact_name: Optional[str] = None
+    ) -> bool:
+        """
+        Seed a ring with the result of a database read.
+
+        The read is discarded if a message was written to the conversation
+        since begin_load() or if a ring was created meanwhile.
+
+        Args:
+            key: (user_id, external_contact_id)
+            token: Value returned by begin_load()
+            messages: Latest messages read (oldest first, at least capacity of
+                them if the conversation has that many); None if the read failed
+            contact_name: Contact name read with them
+
+        Returns:
+            True if the ring was seeded
+        """
+        with self._lock:
+            loading = self._loading[key]
+            fresh = loading[1] == token
+            loading[0] -= 1
+            if loading[0] == 0:
+                del self._loading[key]
+
+            if messages is None or not fresh or self._ring(key) is not None:
+                return False
+            self._store(key, _ConversationRing(contact_name, messages, self.capacity))
+            return True
+
+    def start(self, key: ConversationKey, contact_name: Optional[str] = None) -> None:
+        """Create the (empty) ring of a conversation that was just created."""
+        with self._lock:
+            self._store(key, _ConversationRing(contact_name, [], self.capacity))
+
+    def append(self, key: ConversationKey, message: Dict[str, Any]) -> bool:
+        """
+        Write a stored message through to its conversation's ring.
+
+        Args:
+            key: (user_id, external_contact_id)
+            message: Message row (direction, message, timestamp)
+
+        Returns:
+            True if the conversation had a ring
+        """
+        with self._lock:
+            if key in self._loading:
+                self._loading[key][1] += 1
+            ring = self._ring(key)
+            if ring is None:
+                return False
+            ring.messages.append(message)
+            self._rings.move_to_end(key)
+            return True
+
+    def set_contact_name(self, key: ConversationKey, contact_name: str) -> None:
+        """Update the contact name of a buffered conversation."""
+        with self._lock:
+            ring = self._ring(key)
+            if ring is not None:
+                ring.contact_name = contact_name
+
+    def invalidate(self, user_id: str) -> bool:
+        """Drop all rings of a tenant. Returns True if any were buffered."""
+        with self._lock:
+            keys = [key for key in self._rings if key[0] == user_id]
+            for key in keys:
+                del self._rings[key]
+            return bool(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return conversation count and hit/miss counters."""
+        with self._lock:
+            return {
+                "name": "history",
+                "conversations": len(self._rings),
+                "messages": sum(len(ring.messages) for ring in self._rings.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Process-wide buffers shared by all requests
+history_buffers = ConversationHistoryBuffers()
+
+
+def invalidate_history_buffers(user_id: str) -> bool:
+    """
+    Drop buffered conversation history for a user.
+
+    Args:
+        user_id: User UUID
+
+    Returns:
+        True if conversations were buffered
+    """
+    invalidated = history_buffers.invalidate(user_id)
+    logger.info(f"History buffers invalidated for user_id={user_id[-4:]} (buffered={invalidated})")
+    return invalidated
@@ -0,0 +1,222 @@
+"""
+Knowledge Jobs
+Background queue for knowledge processing (see knowledge_processing).
+
+Large knowledge bases take longer to chunk and embed than a proxy will hold
+a request open, so POST /knowledge/jobs/{user_id} only enqueues a job and
+returns its id; GET /knowledge/jobs/{job_id} reports its status and progress.
+
+- KNOWLEDGE_JOB_WORKERS asyncio workers run jobs on the server's event loop
+  (the blocking Supabase calls inside a job already run in threads).
+- At most one job per tenant waits in the queue: submitting again while a
+  job is queued supersedes it, because the newer job will see the newer
+  knowledge base anyway. A tenant's queued job is not started while another
+  job for the tenant is running; it stays queued (and can still be
+  superseded) until that job finishes.
+- Finished jobs are kept for status polling, up to KNOWLEDGE_JOB_HISTORY.
+
+This is the in-process backend: it needs no external services, but job ids
+are only known to the uvicorn worker that accepted them and queued jobs are
+lost on restart (resubmitting is safe, processing is incremental).
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Dict, List, Optional, Set
+
+from src.services.knowledge_processing import (
+    KnowledgeProcessResult,
+    KnowledgeProgress,
+    process_knowledge
+)
+from src.utils.config import KNOWLEDGE_JOB_WORKERS, KNOWLEDGE_JOB_HISTORY
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    """Lifecycle of a knowledge job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SUPERSEDED = "superseded"   # Replaced by a newer job for the same tenant
+
+
+class KnowledgeJob:
+    """One queued or finished processing run of a tenant's knowledge base."""
+
+    def __init__(self, user_id: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = JobStatus.QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress = KnowledgeProgress()
+        self.result: Optional[KnowledgeProcessResult] = None
+        self.error: Optional[str] = None
+        self.superseded_by: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.as_dict(),
+            "result": self.result._asdict() if self.result else None,
+            "error": self.error,
+            "superseded_by": self.superseded_by,
+        }
+
+
+class KnowledgeJobQueue:
+    """
+    Bounded pool of asyncio workers processing knowledge jobs.
+
+    Args:
+        workers: Jobs processed concurrently (across tenants)
+        history: Jobs kept for status lookups (oldest finished ones dropped)
+    """
+
+    def __init__(self, workers: int = KNOWLEDGE_JOB_WORKERS, history: int = KNOWLEDGE_JOB_HISTORY):
+        self.workers = workers
+        self.history = history
+        self._jobs: "OrderedDict[str, KnowledgeJob]" = OrderedDict()
+        self._queued: Dict[str, KnowledgeJob] = {}
+        self._running: Set[str] = set()
+        self._deferred: Set[str] = set()
+        self._tenant_locks: Dict[str, asyncio.Lock] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Start the workers on the running event loop (application startup)."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"knowledge-job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Knowledge job queue started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers (application shutdown). Running jobs are abandoned."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def tenant_lock(self, user_id: str) -> asyncio.Lock:
+        """Lock serializing knowledge processing runs of one tenant."""
+        return self._tenant_locks.setdefault(user_id, asyncio.Lock())
+
+    def submit(self, user_id: str) -> KnowledgeJob:
+        """
+        Queue a processing job for a tenant, superseding its queued job.
+
+        Args:
+            user_id: User UUID
+
+        Returns:
+            The new job (status QUEUED)
+
+        Raises:
+            RuntimeError: If the queue was not started
+        """
+        if self._queue is None:
+            raise RuntimeError("Knowledge job queue is not running")
+
+        job = KnowledgeJob(user_id)
+        previous = self._queued.get(user_id)
+        self._queued[user_id] = job
+        self._remember(job)
+
+        if previous is not None:
+            previous.status = JobStatus.SUPERSEDED
+            previous.finished_at = time.time()
+            previous.superseded_by = job.id
+            logger.info(f"Knowledge job {previous.id} superseded by {job.id} for user {user_id[-4:]}")
+        else:
+            # The tenant is already in the queue when a job was superseded
+            self._queue.put_nowait(user_id)
+
+        logger.info(f"Knowledge job {job.id} queued for user {user_id[-4:]}")
+        return job
+
+    def get(self, job_id: str) -> Optional[KnowledgeJob]:
+        """Look up a job by id (None if unknown or dropped from history)."""
+        return self._jobs.get(job_id)
+
+    def _remember(self, job: KnowledgeJob) -> None:
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history:
+            oldest_id = next(iter(self._jobs))
+            if self._jobs[oldest_id].status in (JobStatus.QUEUED, JobStatus.RUNNING):
+                break
+            del self._jobs[oldest_id]
+
+    async def _worker(self) -> None:
+        while True:
+            user_id = await self._queue.get()
+            try:
+                if user_id in self._running:
+                    # Re-queued when the tenant's running job finishes
+                    self._deferred.add(user_id)
+                    continue
+                job = self._queued.pop(user_id, None)
+                if job is None:
+                    continue
+                self._running.add(user_id)
+                try:
+                    await self._run(job)
+                finally:
+                    self._running.discard(user_id)
+                    if user_id in self._deferred:
+                        self._deferred.discard(user_id)
+                        self._queue.put_nowait(user_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: KnowledgeJob) -> None:
+        async with self.tenant_lock(job.user_id):
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+            logger.info(f"Knowledge job {job.id} started for user {job.user_id[-4:]}")
+            try:
+                job.result = await process_knowledge(job.user_id, job.progress)
+                job.status = JobStatus.SUCCEEDED
+            except Exception as e:
+                logger.exception(f"Knowledge job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = JobStatus.FAILED
+            finally:
+                job.finished_at = time.time()
+
+        logger.info(
+            f"Knowledge job {job.id} {job.status.value} in "
+            f"{int((job.finished_at - job.started_at) * 1000)}ms"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and job counts by status."""
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status.value] = counts.get(job.status.value, 0) + 1
+        return {
+            "name": "knowledge_jobs",
+            "workers": len(self._tasks),
+            "queued": len(self._queued),
+            "jobs": counts,
+        }
+
+
+# Process-wide queue, started by the application lifespan
+knowledge_jobs = KnowledgeJobQueue()
@@ -0,0 +1,347 @@
+"""
+Knowledge Processing Service
+Turns knowledge_base entries into embedded knowledge_chunks rows.
+
+Processing is incremental. Every chunk row stores the content_hash of the
+prepared text of the entry it came from (see prepare_knowledge_for_chunking).
+Each run:
+
+1. Hashes every entry and compares it with the hashes already stored
+2. Re-chunks and re-embeds only the entries whose hash changed (or are new),
+   streaming them through embed/insert in bounded pages
+3. Deletes the superseded chunks of each entry once its new chunks are
+   written, and the chunks of entries that no longer exist
+
+New chunks are inserted before old ones are deleted, so search never sees an
+entry without chunks, and a failed run leaves the previous chunks in place.
+Bump CHUNKING_VERSION whenever chunking changes so every entry is
+reprocessed once. When anything changed, the tenant's cached replies and
+local vector and lexical indexes are invalidated.
+
+Runs for the same tenant must not overlap: callers go through
+knowledge_jobs.tenant_lock().
+"""
+import asyncio
+import hashlib
+import logging
+import random
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from postgrest.types import ReturnMethod
+
+from src.services.chunking import iter_knowledge_chunks, prepare_knowledge_for_chunking
+from src.services.embeddings import generate_embeddings_batch
+from src.services.lexical_index import invalidate_lexical_index
+from src.services.local_index import invalidate_local_index
+from src.services.response_cache import invalidate_response_cache
+from src.services.supabase_service import _client
+from src.utils.config import (
+    KNOWLEDGE_PAGE_SIZE,
+    KNOWLEDGE_PIPELINE_DEPTH,
+    KNOWLEDGE_INSERT_RETRIES,
+    EMBEDDING_BATCH_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+
+# Part of every content hash: changing it invalidates all stored chunks
+# (2: overlaps start at word boundaries, 3: one chunk per plan/FAQ/service)
+CHUNKING_VERSION = 3
+
+# PostgREST page size when reading existing chunks
+_PAGE_SIZE = 1000
+
+# Chunk ids per DELETE request (ids travel in the URL)
+_DELETE_BATCH = 100
+
+
+class KnowledgeProgress:
+    """Live counters of a processing run (read by the job status endpoint)."""
+
+    def __init__(self):
+        self.entries_total = 0
+        self.entries_chunked = 0
+        self.chunks_total = 0
+        self.embeddings_done = 0
+        self.rows_written = 0
+        self.rows_deleted = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+
+class KnowledgeProcessResult(NamedTuple):
+    """Counters of one processing run."""
+    knowledge_entries: int
+    entries_changed: int
+    entries_unchanged: int
+    entries_removed: int
+    chunks_created: int
+    chunks_deleted: int
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash the prepared text of an entry together with the chunking settings.
+
+    Args:
+        text: Output of prepare_knowledge_for_chunking()
+
+    Returns:
+        Hex sha256 digest
+    """
+    key = f"v{CHUNKING_VERSION}:{CHUNK_SIZE}:{CHUNK_OVERLAP}\n{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _fetch_entries(user_id: str) -> List[Dict[str, Any]]:
+    result = _client.table('knowledge_base')\
+        .select('*')\
+        .eq('user_id', user_id)\
+        .execute()
+    return result.data or []
+
+
+def _fetch_existing_chunks(user_id: str) -> List[Dict[str, Any]]:
+    """(id, knowledge_id, content_hash) of every stored chunk of a tenant."""
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        result = _client.table('knowledge_chunks')\
+            .select('id,knowledge_id,content_hash')\
+            .eq('owner_id', user_id)\
+            .order('id')\
+            .range(start, start + _PAGE_SIZE - 1)\
+            .execute()
+        page = result.data or []
+        rows.extend(page)
+        if len(page) < _PAGE_SIZE:
+            return rows
+        start += _PAGE_SIZE
+
+
+def _insert_chunks(chunks: List[Dict[str, Any]]) -> None:
+    # Don't echo the inserted rows (and their embeddings) back
+    _client.table('knowledge_chunks')\
+        .insert(chunks, returning=ReturnMethod.minimal)\
+        .execute()
+
+
+def _delete_chunks(user_id: str, chunk_ids: List[str]) -> None:
+    for i in range(0, len(chunk_ids), _DELETE_BATCH):
+        _client.table('knowledge_chunks')\
+            .delete()\
+            .eq('owner_id', user_id)\
+            .in_('id', chunk_ids[i:i + _DELETE_BATCH])\
+            .execute()
+
+
+def _stored_hashes(existing: List[Dict[str, Any]]) -> Dict[Optional[str], Set[Optional[str]]]:
+    hashes: Dict[Optional[str], Set[Optional[str]]] = defaultdict(set)
+    for row in existing:
+        hashes[row.get('knowledge_id')].add(row.get('content_hash'))
+    return hashes
+
+
+def _changed_pages(
+    user_id: str,
+    changed: List[Tuple[Dict[str, Any], str]],
+    page_size: int
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lazily chunk changed entries into pages of about page_size chunks.
+
+    Pages never split an entry, so each entry's chunks are written by a
+    single insert: either all of them exist or none do.
+    """
+    page: List[Dict[str, Any]] = []
+    for entry, entry_hash in changed:
+        for chunk in iter_knowledge_chunks(entry, CHUNK_SIZE, CHUNK_OVERLAP):
+            page.append({
+                'owner_id': user_id,
+                'knowledge_id': entry.get('id'),
+                'category': entry.get('category'),
+                'source': 'dashboard',
+                'chunk_text': chunk['chunk_text'],
+                'metadata': chunk['metadata'],
+                'content_hash': entry_hash
+            })
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+async def _insert_page(chunks: List[Dict[str, Any]]) -> None:
+    """Insert one page, retrying with backoff (a page is all-or-nothing)."""
+    for attempt in range(KNOWLEDGE_INSERT_RETRIES + 1):
+        try:
+            await asyncio.to_thread(_insert_chunks, chunks)
+            return
+        except Exception as e:
+            if attempt == KNOWLEDGE_INSERT_RETRIES:
+                raise
+            delay = random.uniform(0.5, 1.5) * 2 ** attempt
+            logger.warning(
+                f"Insert of {len(chunks)} chunks failed ({e}), "
+                f"retry {attempt + 1}/{KNOWLEDGE_INSERT_RETRIES} in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+
+async def process_knowledge(
+    user_id: str,
+    progress: Optional[KnowledgeProgress] = None
+) -> KnowledgeProcessResult:
+    """
+    Bring a tenant's knowledge_chunks in sync with its knowledge_base.
+
+    Changed entries flow through a bounded pipeline: pages of
+    KNOWLEDGE_PAGE_SIZE chunks are embedded by one task and inserted by
+    another. Up to EMBEDDING_BATCH_CONCURRENCY pages are embedded at once
+    (sharing that many concurrent requests) and handed to the writer in
+    order, with at most KNOWLEDGE_PIPELINE_DEPTH embedded pages waiting,
+    so memory stays flat regardless of the knowledge base size. After a page
+    is written, the superseded chunks of its entries are deleted.
+
+    A failed run can simply be repeated: entries whose page was written are
+    recognized by their hash and not embedded again.
+
+    Args:
+        user_id: User UUID
+        progress: Optional counters updated as the run advances
+
+    Returns:
+        KnowledgeProcessResult with entry and chunk counters
+
+    Raises:
+        Exception: If a database or embedding call still fails after retries
+    """
+    # The Supabase client is synchronous: keep it off the event loop
+    entries, existing = await asyncio.gather(
+        asyncio.to_thread(_fetch_entries, user_id),
+        asyncio.to_thread(_fetch_existing_chunks, user_id)
+    )
+    stored = _stored_hashes(existing)
+    progress = progress or KnowledgeProgress()
+    progress.entries_total = len(entries)
+
+    current_hashes: Dict[Optional[str], str] = {}
+    to_embed: List[Tuple[Dict[str, Any], str]] = []
+    changed = 0
+
+    for entry in entries:
+        knowledge_id = entry.get('id')
+        entry_hash = content_hash(prepare_knowledge_for_chunking(entry))
+        current_hashes[knowledge_id] = entry_hash
+        hashes = stored.get(knowledge_id, set())
+
+        if hashes != {entry_hash}:
+            changed += 1
+        # Chunks with this hash are complete (written by a single insert)
+        if entry_hash not in hashes:
+            to_embed.append((entry, entry_hash))
+
+    removed_ids = set(stored) - set(current_hashes)
+    progress.entries_chunked = len(entries) - len(to_embed)
+
+    # Rows whose entry was removed or has a newer hash, grouped by entry
+    stale: Dict[Optional[str], List[str]] = defaultdict(list)
+    for row in existing:
+        knowledge_id = row.get('knowledge_id')
+        if current_hashes.get(knowledge_id) != row.get('content_hash'):
+            stale[knowledge_id].append(row['id'])
+
+    logger.info(
+        f"Knowledge diff for user {user_id[-4:]}: {changed} changed, "
+        f"{len(entries) - changed} unchanged, {len(removed_ids)} removed "
+        f"→ {len(to_embed)} entries to embed"
+    )
+
+    pages: asyncio.Queue = asyncio.Queue(maxsize=KNOWLEDGE_PIPELINE_DEPTH)
+
+    def on_embedded(count: int) -> None:
+        progress.embeddings_done += count
+
+    # One request limit for all pages embedding at once
+    requests = asyncio.Semaphore(EMBEDDING_BATCH_CONCURRENCY)
+
+    async def embed_page(page: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        embeddings = await generate_embeddings_batch(
+            [chunk['chunk_text'] for chunk in page],
+            on_progress=on_embedded,
+            semaphore=requests
+        )
+        for chunk, embedding in zip(page, embeddings):
+            chunk['embedding'] = embedding
+        return page
+
+    async def embed_pages() -> None:
+        # A page usually fits one request: keep several pages in flight
+        in_flight: deque = deque()
+        try:
+            for page in _changed_pages(user_id, to_embed, KNOWLEDGE_PAGE_SIZE):
+                progress.entries_chunked += len({chunk['knowledge_id'] for chunk in page})
+                progress.chunks_total += len(page)
+                in_flight.append(asyncio.create_task(embed_page(page)))
+                if len(in_flight) >= EMBEDDING_BATCH_CONCURRENCY:
+                    # Blocks while the writer is KNOWLEDGE_PIPELINE_DEPTH pages behind
+                    await pages.put(await in_flight.popleft())
+            while in_flight:
+                await pages.put(await in_flight.popleft())
+        finally:
+            for task in in_flight:
+                task.cancel()
+        await pages.put(None)
+
+    async def write_pages() -> None:
+        while True:
+            page = await pages.get()
+            if page is None:
+                return
+            await _insert_page(page)
+            progress.rows_written += len(page)
+
+            superseded = [
+                chunk_id
+                for knowledge_id in {chunk['knowledge_id'] for chunk in page}
+                for chunk_id in stale.pop(knowledge_id, [])
+            ]
+            if superseded:
+                await asyncio.to_thread(_delete_chunks, user_id, superseded)
+                progress.rows_deleted += len(superseded)
+
+    tasks = [asyncio.create_task(embed_pages()), asyncio.create_task(write_pages())]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    # What is left: chunks of removed entries and superseded chunks of
+    # entries that needed no embedding (resumed runs, legacy duplicates)
+    leftover = [chunk_id for chunk_ids in stale.values() for chunk_id in chunk_ids]
+    if leftover:
+        await asyncio.to_thread(_delete_chunks, user_id, leftover)
+        progress.rows_deleted += len(leftover)
+
+    if changed or removed_ids:
+        # Cached replies and the local vector/lexical indexes reflect the old chunks
+        invalidate_response_cache(user_id)
+        invalidate_local_index(user_id)
+        invalidate_lexical_index(user_id)
+
+    return KnowledgeProcessResult(
+        knowledge_entries=len(entries),
+        entries_changed=changed,
+        entries_unchanged=len(entries) - changed,
+        entries_removed=len(removed_ids),
+        chunks_created=progress.rows_written,
+        chunks_deleted=progress.rows_deleted
+    )
@@ -0,0 +1,294 @@
+"""
+Lexical Index Service
+Per-tenant BM25 index over knowledge_chunks.chunk_text.
+
+Many customer questions name a product or plan exactly ("plano Essencial"),
+which an inverted index answers in-process and without the embeddings API.
+Text is tokenized for Portuguese: lowercased, accents folded ("preço" ->
+"preco"), stopwords and question words dropped, plurals reduced
+("planos" -> "plano", "opções" -> "opcao") and price words mapped to
+"preco" ("quanto custa" matches "Preço mensal").
+
+Indexes are loaded lazily (chunk rows only, no embeddings) and kept in a
+TTLCache for LEXICAL_INDEX_TTL seconds, or until the tenant's knowledge is
+reprocessed in this worker. search() reports how confident the best match
+is, so callers can skip vector search (and the embedding call) entirely.
+"""
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from src.services.supabase_service import _client
+from src.utils.cache import TTLCache
+from src.utils.config import (
+    LEXICAL_INDEX_TTL,
+    LEXICAL_INDEX_CACHE_SIZE,
+    LEXICAL_CONFIDENCE,
+    LEXICAL_MARGIN
+)
+
+logger = logging.getLogger(__name__)
+
+# Chunk columns kept with each indexed document (same as the vector search rows)
+CHUNK_COLUMNS = ["id", "owner_id", "knowledge_id", "category", "source", "chunk_text", "metadata"]
+
+# PostgREST caps each response; page through larger tenants
+_PAGE_SIZE = 1000
+
+# BM25 parameters (the usual defaults)
+_K1 = 1.2
+_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Accent-folded; includes question and filler words common in WhatsApp messages
+_STOPWORDS = frozenset("""
+a ao aos as ate com como da das de do dos e ela elas ele eles em entre era eu
+essa esse esta este foi ha isso isto ja la lhe mais mas me meu minha muito na
+nas nao no nos nossa nosso num numa o os ou para pela pelas pelo pelos por qual
+quais quando quanto quanta quantos quantas que quem se sem ser seu sua so sobre
+tambem te tem tenho ter teu tua um uma umas uns voce voces vcs vc ai aqui oi ola
+bom boa dia tarde noite gostaria queria quero saber pode podem poderia favor pfv
+obrigado obrigada sim ok onde porque pq sao estao faz fazem fazer
+""".split())
+
+
+# Accent-folded, singular forms mapped to the term used in knowledge entries
+_SYNONYMS = {
+    "custa": "preco",
+    "custam": "preco",
+    "custo": "preco",
+    "valor": "preco",
+    "mensalidade": "preco",
+}
+
+
+class LexicalHit(NamedTuple):
+    """A chunk row matched by BM25."""
+    row: Dict[str, Any]
+    score: float
+
+
+class LexicalResult(NamedTuple):
+    """Result of BM25Index.search()."""
+    hits: List[LexicalHit]
+    confidence: float
+    confident: bool
+
+
+def fold_accents(text: str) -> str:
+    """
+    Lowercase and strip diacritics.
+
+    Example:
+        >>> fold_accents("Preço Anual — Opções")
+        'preco anual — opcoes'
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _singular(token: str) -> str:
+    if len(token) <= 3 or not token.endswith("s"):
+        return token
+    for suffix, replacement in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m")):
+        if token.endswith(suffix):
+            return token[:-len(suffix)] + replacement
+    return token[:-1]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Portuguese-aware tokenization used for both documents and queries.
+
+    Example:
+        >>> tokenize("Quanto custam os planos? Quais são as opções de pagamento?")
+        ['preco', 'plano', 'opcao', 'pagamento']
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(fold_accents(text or "")):
+        if token in _STOPWORDS:
+            continue
+        token = _singular(token)
+        tokens.append(_SYNONYMS.get(token, token))
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring over a tenant's chunk rows.
+
+    Args:
+        rows: Chunk rows (CHUNK_COLUMNS); chunk_text is indexed
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self._postings: Dict[str, List[tuple]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+        for doc, row in enumerate(rows):
+            terms = Counter(tokenize(row.get("chunk_text") or ""))
+            self._lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self._postings[term].append((doc, tf))
+
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        # Upper bound of idf(): a term that appears in no document
+        self._max_idf = self._idf(0)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _idf(self, df: int) -> float:
+        n = len(self.rows)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        category: Optional[str] = None,
+        min_confidence: float = LEXICAL_CONFIDENCE,
+        min_margin: float = LEXICAL_MARGIN
+    ) -> LexicalResult:
+        """
+        Top-k chunks by BM25 score.
+
+        The confidence of the best hit is the share of the query's idf
+        weight it matches (query terms unknown to the index count with the
+        maximum idf). The result is confident when that share reaches
+        min_confidence and the best score beats the runner-up by min_margin.
+
+        Args:
+            query: User's message
+            top_k: Number of hits to return
+            category: Optional category filter
+            min_confidence: Minimum confidence of the best hit
+            min_margin: Minimum ratio of the best score to the second best
+
+        Returns:
+            LexicalResult with hits (best first), confidence and confident
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.rows:
+            return LexicalResult([], 0.0, False)
+
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, float] = defaultdict(float)
+        total_idf = 0.0
+
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                total_idf += self._max_idf
+                continue
+            idf = self._idf(len(postings))
+            total_idf += idf
+            for doc, tf in postings:
+                if category and self.rows[doc].get("category") != category:
+                    continue
+                norm = 1 - _B + _B * self._lengths[doc] / self._avg_length
+                scores[doc] += idf * tf * (_K1 + 1) / (tf + _K1 * norm)
+                matched[doc] += idf
+
+        if not scores:
+            return LexicalResult([], 0.0, False)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        hits = [LexicalHit(self.rows[doc], scores[doc]) for doc in best]
+
+        confidence = matched[best[0]] / total_idf if total_idf else 0.0
+        runner_up = hits[1].score if len(hits) > 1 else 0.0
+        confident = confidence >= min_confidence and hits[0].score >= min_margin * runner_up
+
+        return LexicalResult(hits, round(confidence, 4), confident)
+
+
+def load_lexical_index(user_id: str) -> BM25Index:
+    """
+    Build a tenant's BM25 index from knowledge_chunks (text only).
+
+    Raises:
+        Exception: If the database query fails
+    """
+    rows: List[Dict[str, Any]] = []
+    start = 0
+
+    while True:
+        result = _client.table("knowledge_chunks") \
+            .select(",".join(CHUNK_COLUMNS)) \
+            .eq("owner_id", user_id) \
+            .order("id") \
+            .range(start, start + _PAGE_SIZE - 1) \
+            .execute()
+
+        page = result.data or []
+        rows.extend(page)
+
+        if len(page) < _PAGE_SIZE:
+            break
+        start += _PAGE_SIZE
+
+    index = BM25Index(rows)
+    logger.info(f"Loaded lexical index for user {user_id[-4:]}: {len(index)} chunks")
+    return index
+
+
+# BM25 indexes by owner_id
+_lexical_indexes = TTLCache("lexical_index", ttl=LEXICAL_INDEX_TTL, max_size=LEXICAL_INDEX_CACHE_SIZE)
+
+
+def lexical_search(
+    user_id: str,
+    query: str,
+    top_k: int = 5,
+    category: Optional[str] = None
+) -> LexicalResult:
+    """
+    BM25 search over a tenant's chunks, loading the index on first use.
+
+    Blocking on a cache miss (runs Supabase queries): call from a worker thread.
+
+    Args:
+        user_id: Tenant (owner_id)
+        query: User's message
+        top_k: Number of hits to return
+        category: Optional category filter
+
+    Returns:
+        LexicalResult (no hits if the index cannot be loaded)
+    """
+    try:
+        index = _lexical_indexes.get_or_load(user_id, lambda: load_lexical_index(user_id))
+    except Exception as e:
+        logger.warning(f"Lexical index unavailable for user {user_id[-4:]}: {e}")
+        return LexicalResult([], 0.0, False)
+
+    result = index.search(query, top_k=top_k, category=category)
+    logger.info(
+        f"Lexical search for user {user_id[-4:]}: {len(result.hits)} hits "
+        f"(confidence: {result.confidence}, confident: {result.confident})"
+    )
+    return result
+
+
+def invalidate_lexical_index(user_id: str) -> bool:
+    """
+    Drop a tenant's lexical index (after its chunks were reprocessed).
+
+    Args:
+        user_id: User UUID
+
+    Returns:
+        True if an index was loaded
+    """
+    return _lexical_indexes.invalidate(user_id)
+
+
+def get_lexical_index_stats() -> Dict[str, Any]:
+    """Return hit/miss counters of the lexical index cache."""
+    return _lexical_indexes.stats()
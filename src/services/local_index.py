@@ -0,0 +1,395 @@
+"""
+Local Vector Index
+In-process, per-tenant vector index used instead of the match_knowledge_chunks
+RPC when VECTOR_BACKEND=local.
+
+Each tenant's chunks are loaded lazily from knowledge_chunks into a
+normalized float32 NumPy matrix, so top-k search is a single matrix-vector
+product. Tenants with at least ANN_MIN_CHUNKS chunks also get an IVF index
+(see ann_index) that only scores the clusters closest to the query.
+Tenants are evicted least-recently-used once the indexes exceed
+LOCAL_INDEX_MAX_BYTES, and an index is reloaded after LOCAL_INDEX_TTL seconds
+(or immediately when the tenant's knowledge is reprocessed in this worker).
+
+With VECTOR_STORE_QUANTIZATION=int8|float16 the loaded embeddings are written
+to a quantized, memory-mapped store (see vector_store) shared by all workers
+on the host; workers open the store instead of querying knowledge_chunks
+while it is younger than LOCAL_INDEX_TTL. Quantized indexes use exact search
+(IVF applies to in-memory float32 indexes only).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from src.services.ann_index import IVFIndex
+from src.services.supabase_service import _client
+from src.services.vector_store import QuantizedTenantIndex, open_store, remove_store, write_store
+from src.utils.config import (
+    ANN_MIN_CHUNKS,
+    LOCAL_INDEX_MAX_BYTES,
+    LOCAL_INDEX_TTL,
+    VECTOR_STORE_QUANTIZATION
+)
+
+logger = logging.getLogger(__name__)
+
+# Columns returned by match_knowledge_chunks (besides similarity)
+CHUNK_COLUMNS = ["id", "owner_id", "knowledge_id", "category", "source", "chunk_text", "metadata"]
+
+# PostgREST caps each response; page through larger tenants
+_PAGE_SIZE = 1000
+
+
+def parse_embedding(value: Any) -> Optional[List[float]]:
+    """
+    Parse a pgvector value as returned by PostgREST.
+
+    pgvector columns come back as strings like "[0.1,0.2,...]".
+
+    Returns:
+        List of floats, or None if the value is empty
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+class TenantIndex:
+    """
+    Normalized embedding matrix plus chunk rows for one tenant.
+
+    Built incrementally with add(); the matrix grows geometrically so adding
+    pages of chunks does not copy everything each time.
+
+    Args:
+        ann_min_chunks: Build an IVF index once the tenant has this many
+            chunks (0 disables approximate search)
+    """
+
+    def __init__(self, ann_min_chunks: int = ANN_MIN_CHUNKS):
+        self.rows: List[Dict[str, Any]] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._categories = np.empty(0, dtype=object)
+        self.ann_min_chunks = ann_min_chunks
+        self.ann: Optional[IVFIndex] = None
+        self.loaded_at = time.monotonic()
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:len(self.rows)]
+
+    @property
+    def categories(self) -> np.ndarray:
+        return self._categories[:len(self.rows)]
+
+    @property
+    def nbytes(self) -> int:
+        # Text and row dicts are approximated at 2x the chunk text length
+        ann_bytes = self.ann.nbytes if self.ann is not None else 0
+        return int(self._matrix.nbytes + ann_bytes + sum(2 * len(row.get("chunk_text") or "") for row in self.rows))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _reserve(self, size: int, dims: int) -> None:
+        if self._matrix.shape[0] >= size and self._matrix.shape[1] == dims:
+            return
+        capacity = max(size, 2 * self._matrix.shape[0])
+        matrix = np.zeros((capacity, dims), dtype=np.float32)
+        categories = np.empty(capacity, dtype=object)
+        count = len(self.rows)
+        if count:
+            matrix[:count] = self._matrix[:count]
+            categories[:count] = self._categories[:count]
+        self._matrix = matrix
+        self._categories = categories
+
+    def add(self, rows: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        """
+        Append chunks to the index.
+
+        Args:
+            rows: Chunk rows (CHUNK_COLUMNS) in the same order as embeddings
+            embeddings: float32 matrix of shape (len(rows), dims)
+        """
+        if not rows:
+            return
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        start = len(self.rows)
+        end = start + len(rows)
+        self._reserve(end, embeddings.shape[1])
+        self._matrix[start:end] = embeddings / norms
+        self._categories[start:end] = [row.get("category") for row in rows]
+        self.rows.extend(rows)
+
+        if self.ann is not None:
+            self.ann.add(self._matrix, start, end)
+        elif self.ann_min_chunks and end >= self.ann_min_chunks:
+            self.ann = IVFIndex()
+            self.ann.add(self._matrix, 0, end)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        category: Optional[str] = None,
+        similarity_threshold: float = 0.7
+    ) -> List[Dict[str, Any]]:
+        """
+        Cosine top-k, same result shape as match_knowledge_chunks.
+
+        Uses the IVF index when the tenant has one; category-filtered
+        queries that find fewer than top_k matches in the probed clusters
+        fall back to an exact scan.
+
+        Returns:
+            Chunk dicts with a similarity score, highest first
+        """
+        if not self.rows:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0:
+            return []
+        query = query / norm
+
+        if self.ann is not None:
+            candidates, scores = self.ann.probe(self._matrix, query)
+            if category:
+                matches = self.categories[candidates] == category
+                candidates, scores = candidates[matches], scores[matches]
+            if len(candidates) >= top_k:
+                return self._top_k(candidates, scores, top_k, similarity_threshold)
+
+        scores = self.matrix @ query
+        if category:
+            scores = np.where(self.categories == category, scores, -np.inf)
+        return self._top_k(np.arange(len(scores)), scores, top_k, similarity_threshold)
+
+    def _top_k(
+        self,
+        candidates: np.ndarray,
+        scores: np.ndarray,
+        top_k: int,
+        similarity_threshold: float
+    ) -> List[Dict[str, Any]]:
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {**self.rows[candidates[i]], "similarity": float(scores[i])}
+            for i in best
+            if scores[i] >= similarity_threshold
+        ]
+
+
+def load_tenant_chunks(user_id: str, ann_min_chunks: int = ANN_MIN_CHUNKS) -> TenantIndex:
+    """
+    Load every chunk with its embedding for a tenant from knowledge_chunks.
+
+    Args:
+        user_id: Tenant (owner_id)
+        ann_min_chunks: Passed to TenantIndex (0 skips building an IVF index)
+
+    Returns:
+        TenantIndex for the tenant (possibly empty)
+
+    Raises:
+        Exception: If the database query fails
+    """
+    index = TenantIndex(ann_min_chunks=ann_min_chunks)
+    start = 0
+
+    while True:
+        result = _client.table("knowledge_chunks") \
+            .select(",".join(CHUNK_COLUMNS + ["embedding"])) \
+            .eq("owner_id", user_id) \
+            .order("id") \
+            .range(start, start + _PAGE_SIZE - 1) \
+            .execute()
+
+        page = result.data or []
+        rows: List[Dict[str, Any]] = []
+        vectors: List[List[float]] = []
+        for row in page:
+            embedding = parse_embedding(row.pop("embedding", None))
+            if embedding is None:
+                continue
+            rows.append(row)
+            vectors.append(embedding)
+
+        if rows:
+            index.add(rows, np.asarray(vectors, dtype=np.float32))
+
+        if len(page) < _PAGE_SIZE:
+            break
+        start += _PAGE_SIZE
+
+    logger.info(
+        f"Loaded local index for user {user_id[-4:]}: {len(index)} chunks "
+        f"(ann={'ivf' if index.ann is not None else 'off'})"
+    )
+
+    return index
+
+
+AnyTenantIndex = Union[TenantIndex, QuantizedTenantIndex]
+
+
+def load_tenant_index(user_id: str, ttl: float = LOCAL_INDEX_TTL) -> AnyTenantIndex:
+    """
+    Load a tenant's index, through the shared quantized store when enabled.
+
+    Args:
+        user_id: Tenant (owner_id)
+        ttl: Maximum age of a shared store build before it is rebuilt
+
+    Returns:
+        TenantIndex, or QuantizedTenantIndex when VECTOR_STORE_QUANTIZATION is set
+    """
+    if VECTOR_STORE_QUANTIZATION == "none":
+        return load_tenant_chunks(user_id)
+
+    index = open_store(user_id, VECTOR_STORE_QUANTIZATION, ttl)
+    if index is None:
+        loaded = load_tenant_chunks(user_id, ann_min_chunks=0)
+        directory = write_store(user_id, loaded.rows, loaded.matrix, VECTOR_STORE_QUANTIZATION)
+        index = QuantizedTenantIndex(directory)
+    return index
+
+
+class LocalIndexRegistry:
+    """
+    LRU registry of TenantIndex objects under a memory budget.
+
+    Args:
+        max_bytes: Memory budget across all tenants
+        ttl: Seconds before a tenant index is reloaded from the database
+    """
+
+    def __init__(self, max_bytes: int = LOCAL_INDEX_MAX_BYTES, ttl: float = LOCAL_INDEX_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._indexes: "OrderedDict[str, AnyTenantIndex]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        # Bumped by invalidate(): loads started under an older value are not stored
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.loads = 0
+
+    def _cached(self, user_id: str) -> Optional[AnyTenantIndex]:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None or time.monotonic() - index.loaded_at > self.ttl:
+                return None
+            self._indexes.move_to_end(user_id)
+            return index
+
+    def get(self, user_id: str) -> AnyTenantIndex:
+        """
+        Return the tenant's index, loading it from the database if needed.
+
+        Blocking (runs Supabase queries on a miss): call from a worker thread.
+        Concurrent misses for the same tenant load it only once. An index whose
+        load started before invalidate() is returned but not stored.
+        """
+        index = self._cached(user_id)
+        if index is not None:
+            self.hits += 1
+            return index
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(user_id, threading.Lock())
+
+        with load_lock:
+            index = self._cached(user_id)
+            if index is not None:
+                self.hits += 1
+                return index
+            with self._lock:
+                generation = self._generations.get(user_id, 0)
+            index = load_tenant_index(user_id, self.ttl)
+            self.loads += 1
+            self._store(user_id, index, generation)
+            return index
+
+    def _store(self, user_id: str, index: AnyTenantIndex, generation: int) -> None:
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                logger.info(f"Discarded local index for user {user_id[-4:]} (invalidated while loading)")
+                return
+            previous = self._indexes.pop(user_id, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._indexes[user_id] = index
+            self._bytes += index.nbytes
+            # Evict least recently used tenants over budget (never the one just loaded)
+            while self._bytes > self.max_bytes and len(self._indexes) > 1:
+                evicted_id, evicted = self._indexes.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                logger.info(f"Evicted local index for user {evicted_id[-4:]} ({evicted.nbytes} bytes)")
+
+    def invalidate(self, user_id: str) -> bool:
+        """Drop a tenant's index (reloaded on next search). Returns True if it was loaded."""
+        with self._lock:
+            index = self._indexes.pop(user_id, None)
+            if index is not None:
+                self._bytes -= index.nbytes
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            # Keep the load lock while a load holds it, so no second load starts alongside
+            load_lock = self._load_locks.get(user_id)
+            if load_lock is not None and not load_lock.locked():
+                del self._load_locks[user_id]
+            return index is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return tenant count, memory use and load counters."""
+        with self._lock:
+            return {
+                "name": "vector_index",
+                "tenants": len(self._indexes),
+                "ann_tenants": sum(1 for index in self._indexes.values() if index.ann is not None),
+                "chunks": sum(len(index) for index in self._indexes.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "quantization": VECTOR_STORE_QUANTIZATION,
+                "hits": self.hits,
+                "loads": self.loads,
+            }
+
+
+# Process-wide registry
+local_index = LocalIndexRegistry()
+
+
+def invalidate_local_index(user_id: str) -> bool:
+    """
+    Drop a tenant's local vector index (after its chunks were reprocessed).
+
+    Args:
+        user_id: User UUID
+
+    Returns:
+        True if an index was loaded
+    """
+    invalidated = local_index.invalidate(user_id)
+    if VECTOR_STORE_QUANTIZATION != "none":
+        remove_store(user_id)
+    logger.info(f"Local vector index invalidated for user {user_id[-4:]} (loaded={invalidated})")
+    return invalidated
@@ -11,22 +11,107 @@ from src.services.supabase_service import _client
 from src.models.message import MessageCreateRequest
 from src.models.conversation import ConversationUpsertRequest
 from src.services import conversation_service
+from src.services.history_buffer import history_buffers
+from src.utils.config import HISTORY_MESSAGE_MAX_CHARS, HISTORY_BUFFER_ENABLED
 
 logger = logging.getLogger(__name__)
 
 
+def _cap_message(row: Dict[str, Any], max_chars: Optional[int]) -> Dict[str, Any]:
+    """Cut a history message to max_chars characters (None or 0: no cap)."""
+    text = row.get("message")
+    if max_chars and text and len(text) > max_chars:
+        row = dict(row, message=text[:max_chars])
+    return row
+
+
+def _fetch_history_two_queries(
+    user_id: str,
+    external_contact_id: str,
+    limit: int,
+    max_chars: Optional[int]
+) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    History lookup without the get_conversation_history() Postgres function
+    (migration 035): conversation first, then its latest messages.
+    """
+    conv_result = _client.table("conversations") \
+        .select("id, contact_name") \
+        .eq("user_id", user_id) \
+        .eq("external_contact_id", external_contact_id) \
+        .execute()
+    
+    if not conv_result.data:
+        return [], None
+    
+    conversation_id = conv_result.data[0]['id']
+    contact_name = conv_result.data[0].get('contact_name')
+    
+    # Latest messages first, then back to chronological order
+    result = _client.table("messages") \
+        .select("direction, message, timestamp") \
+        .eq("conversation_id", conversation_id) \
+        .order("timestamp", desc=True) \
+        .limit(limit) \
+        .execute()
+    
+    messages = [_cap_message(row, max_chars) for row in reversed(result.data or [])]
+    return messages, contact_name
+
+
+def _read_history(
+    user_id: str,
+    external_contact_id: str,
+    limit: int,
+    max_chars: Optional[int]
+) -> Optional[tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Read the latest messages and contact name of a conversation from the database.
+    
+    Returns:
+        Tuple of (messages, contact_name), or None if there is no conversation
+        
+    Raises:
+        Exception: If the fallback queries fail
+    """
+    try:
+        result = _client.rpc('get_conversation_history', {
+            'p_user_id': user_id,
+            'p_external_contact_id': external_contact_id,
+            'p_limit': limit,
+            'p_max_chars': max_chars or None
+        }).execute()
+    except Exception as e:
+        logger.warning(f"get_conversation_history RPC failed, using two queries: {e}")
+        return _fetch_history_two_queries(user_id, external_contact_id, limit, max_chars)
+    
+    if not result.data:
+        return None
+    return result.data[0].get('messages') or [], result.data[0].get('contact_name')
+
+
 def get_conversation_history(
     user_id: str,
     external_contact_id: str,
-    limit: int = 10
+    limit: int = 10,
+    max_chars: Optional[int] = HISTORY_MESSAGE_MAX_CHARS
 ) -> tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Fetch recent message history for a conversation and contact name.
+    Fetch the latest messages of a conversation and the contact name.
+    
+    Served from the conversation's in-memory ring buffer when it is warm
+    (see history_buffer): create_message() writes every message through to
+    it. Otherwise one round trip: the get_conversation_history Postgres
+    function (migration 035) resolves the conversation and returns its last
+    messages, each cut to max_chars characters on the server, and the result
+    seeds the buffer. If the function is unavailable, the conversation and
+    its messages are queried separately.
     
     Args:
         user_id: User identifier (owner of the conversation)
         external_contact_id: External contact ID (e.g., phone number)
-        limit: Maximum number of messages to fetch (default: 10)
+        limit: Maximum number of messages to fetch, the most recent ones (default: 10)
+        max_chars: Maximum characters kept per message (None or 0: no cap)
         
     Returns:
         Tuple of (messages, contact_name) where:
@@ -37,41 +122,41 @@ def get_conversation_history(
         >>> messages, name = get_conversation_history("user-123", "+5511999999999")
         >>> print(f"Conversation with {name}")
         >>> for msg in messages:
-        ...     print(f"{msg['direction']}: {msg['mensagem']}")
+        ...     print(f"{msg['direction']}: {msg['message']}")
     """
+    key = (user_id, external_contact_id)
+    # The buffer holds messages capped at HISTORY_MESSAGE_MAX_CHARS
+    buffered = HISTORY_BUFFER_ENABLED and max_chars == HISTORY_MESSAGE_MAX_CHARS \
+        and limit <= history_buffers.capacity
+    
+    if buffered:
+        cached = history_buffers.get(key, limit)
+        if cached is not None:
+            logger.info(f"Found {len(cached[0])} messages in buffered conversation history")
+            return cached
+        token = history_buffers.begin_load(key)
+    
+    history = None
     try:
-        # First, find the conversation_id and contact_name
-        conv_result = _client.table("conversations") \
-            .select("id, contact_name") \
-            .eq("user_id", user_id) \
-            .eq("external_contact_id", external_contact_id) \
-            .execute()
+        # A seed read fetches a full ring (serves larger limits later on)
+        read_limit = history_buffers.capacity if buffered else limit
+        history = _read_history(user_id, external_contact_id, read_limit, max_chars)
         
-        if not conv_result.data:
+        if history is None:
             logger.info(f"No conversation found for user_id={user_id[-4:]} contact={external_contact_id}")
             return [], None
         
-        conversation_id = conv_result.data[0]['id']
-        contact_name = conv_result.data[0].get('contact_name')
-        
-        # Then, fetch messages for that conversation
-        result = _client.table("messages") \
-            .select("direction, message, timestamp") \
-            .eq("conversation_id", conversation_id) \
-            .order("timestamp", desc=False) \
-            .limit(limit) \
-            .execute()
-        
-        if result.data:
-            logger.info(f"Found {len(result.data)} messages in conversation history")
-            return result.data, contact_name
-        
-        logger.info("No conversation history found")
-        return [], contact_name
+        messages, contact_name = history
+        logger.info(f"Found {len(messages)} messages in conversation history")
+        return messages[-limit:] if limit > 0 else [], contact_name
         
     except Exception as e:
         logger.exception(f"Error fetching conversation history: {e}")
         return [], None
+    
+    finally:
+        if buffered:
+            history_buffers.finish_load(key, token, *(history or (None, None)))
 
 
 async def create_message(request: MessageCreateRequest) -> tuple[str, str]:
@@ -162,6 +247,18 @@ async def create_message(request: MessageCreateRequest) -> tuple[str, str]:
         
         message_id = result.data[0]["id"]
         
+        if HISTORY_BUFFER_ENABLED:
+            # Write through to the conversation's history ring (if buffered)
+            stored = result.data[0]
+            history_buffers.append(
+                (request.user_id, request.external_contact_id),
+                _cap_message({
+                    "direction": stored.get("direction", request.direction),
+                    "message": stored.get("message", request.text),
+                    "timestamp": stored.get("timestamp", timestamp),
+                }, HISTORY_MESSAGE_MAX_CHARS)
+            )
+        
         logger.info(
             f"Created message {message_id} for conversation {conversation_id} "
             f"(direction: {request.direction}, type: {request.type})"
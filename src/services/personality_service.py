@@ -1,11 +1,32 @@
 """
 Agent Personality Service
 Handles fetching and formatting agent personality configuration from Supabase.
+
+The personality block and the static instructions are compiled once per
+tenant into a CompiledPrompt, cached in-process and versioned by a hash of
+the personality row. Per request only the knowledge base context is spliced
+in, so neither the agent_personality query nor the prompt assembly runs on
+the hot path.
+
+PROMPT_LAYOUT selects where the knowledge base goes:
+- "legacy": personality, knowledge base, static instructions
+- "prefix_cache": personality and static instructions first, knowledge base
+  last, so the byte-stable per-tenant prefix can be reused by the provider's
+  prompt caching
 """
+import hashlib
+import json
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, NamedTuple
 
 from src.services.supabase_service import _client
+from src.utils.cache import TTLCache
+from src.utils.config import (
+    PERSONALITY_CACHE_TTL,
+    PERSONALITY_CACHE_SIZE,
+    CACHE_REFRESH_AHEAD,
+    PROMPT_LAYOUT
+)
 
 logger = logging.getLogger(__name__)
 
@@ -48,10 +69,21 @@ DEFAULT_PERSONALITY = {
 }
 
 
+class CompiledPrompt(NamedTuple):
+    """Per-tenant system prompt with a slot for the knowledge base context."""
+    version: str
+    personality: Dict[str, Any]
+    head: str
+    tail: str
+    minimal: str = ""
+
+
 def get_agent_personality(user_id: str) -> Dict[str, Any]:
     """
     Fetch agent personality configuration from agent_personality table.
     
+    Served from the compiled prompt cache (see get_compiled_prompt()).
+    
     Args:
         user_id: User UUID
         
@@ -70,23 +102,102 @@ def get_agent_personality(user_id: str) -> Dict[str, Any]:
         >>> print(personality["name"])
         "RAG-E Assistant"
     """
-    try:
-        result = _client.table("agent_personality") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
+    return get_compiled_prompt(user_id).personality.copy()
+
+
+def _fetch_personality_row(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Query the agent_personality row for a user.
+    
+    Args:
+        user_id: User UUID
+        
+    Returns:
+        Personality row, or None if the user has no personality configured
         
-        if result.data:
-            logger.info(f"Personality found for user_id={user_id[-4:]}")
-            return result.data
+    Raises:
+        Exception: If the database query fails
+    """
+    result = _client.table("agent_personality") \
+        .select("*") \
+        .eq("user_id", user_id) \
+        .maybe_single() \
+        .execute()
+    
+    if result and result.data:
+        logger.info(f"Personality found for user_id={user_id[-4:]}")
+        return result.data
+    
+    logger.warning(f"No personality found for user_id={user_id[-4:]}, using defaults")
+    return None
+
+
+def personality_version(personality: Dict[str, Any]) -> str:
+    """
+    Stable version tag for a personality row (hash of its contents).
+    
+    Args:
+        personality: Personality dictionary
         
-        logger.warning(f"No personality found for user_id={user_id[-4:]}, using defaults")
-        return DEFAULT_PERSONALITY.copy()
+    Returns:
+        Short hex digest that changes whenever the row changes
+    """
+    payload = json.dumps(personality, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def get_compiled_prompt(user_id: str) -> CompiledPrompt:
+    """
+    Get the tenant's compiled system prompt, rebuilding it only when the
+    personality row changed.
+    
+    Args:
+        user_id: User UUID
         
+    Returns:
+        CompiledPrompt for the tenant (defaults if not configured or on error)
+    """
+    try:
+        return _prompt_cache.get_or_load(user_id, lambda: _load_compiled_prompt(user_id))
     except Exception as e:
+        # Not cached: the next request retries the database
         logger.warning(f"Error fetching personality for user_id={user_id[-4:]}: {e}. Using defaults")
-        return DEFAULT_PERSONALITY.copy()
+        return _DEFAULT_COMPILED_PROMPT
+
+
+def _load_compiled_prompt(user_id: str) -> CompiledPrompt:
+    """Fetch the personality row and compile it, reusing the cached build if unchanged."""
+    row = _fetch_personality_row(user_id)
+    if row is None:
+        return _DEFAULT_COMPILED_PROMPT
+    
+    version = personality_version(row)
+    previous = _prompt_cache.peek(user_id)
+    if previous is not None and previous.version == version:
+        return previous
+    
+    logger.info(f"Compiling system prompt for user_id={user_id[-4:]} version={version}")
+    return compile_system_prompt(row, version)
+
+
+def invalidate_personality_cache(user_id: str) -> bool:
+    """
+    Drop the cached personality/compiled prompt for a user.
+    
+    Args:
+        user_id: User UUID
+        
+    Returns:
+        True if an entry was cached
+    """
+    invalidated = _prompt_cache.invalidate(user_id)
+    logger.info(f"Personality cache invalidated for user_id={user_id[-4:]} (cached={invalidated})")
+    return invalidated
+
+
+def get_personality_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss counters of the compiled prompt cache."""
+    return _prompt_cache.stats()
 
 
 def format_personality_context(personality: Dict[str, Any]) -> str:
@@ -152,6 +263,161 @@ def format_personality_context(personality: Dict[str, Any]) -> str:
     return "\n".join(lines)
 
 
+# Static instructions shared by every tenant (assembled once at import)
+STATIC_INSTRUCTIONS = "\n".join([
+    "=== INSTRUÇÕES ===",
+    "Você é o assistente virtual configurado acima. Use APENAS as informações fornecidas na base de conhecimento para responder.",
+    "Se não souber a resposta, seja honesto e ofereça ajuda para entrar em contato com um humano.",
+    "Mantenha a personalidade e tom de voz especificados.",
+    "Responda sempre em português brasileiro.",
+    "",
+    "=== REGRAS IMPORTANTES SOBRE O FLUXO DE CONVERSA ===",
+    "⚠️ CRÍTICO - LEIA COM ATENÇÃO:",
+    "",
+    "1. RESPEITE O SISTEMA DE PERGUNTAS E RESPOSTAS:",
+    "   - Faça UMA pergunta por vez",
+    "   - Aguarde a resposta do usuário antes de fazer nova pergunta",
+    "   - NÃO envie múltiplas mensagens consecutivas",
+    "   - Se o usuário responder com múltiplas informações, processe uma de cada vez",
+    "",
+    "2. USO DO NOME DO CONTATO:",
+    "   - Sempre que disponível, use o nome do contato para personalizar a conversa",
+    "   - Exemplo: 'Olá, {{contact_name}}! Como posso ajudar?'",
+    "   - Use o nome de forma natural, sem exageros",
+    "",
+    "3. FORMATO DE RESPOSTA:",
+    "   - Mantenha respostas concisas e objetivas",
+    "   - Use no máximo 2-3 parágrafos por mensagem",
+    "   - Se precisar coletar múltiplas informações, faça em etapas separadas",
+    "",
+    "4. EXEMPLO DE FLUXO CORRETO:",
+    "   ✅ CORRETO:",
+    "   Agente: 'Qual tipo de produto você busca?'",
+    "   [AGUARDA RESPOSTA]",
+    "   Usuário: 'Busco um shampoo'",
+    "   Agente: 'Ótimo! Para qual tipo de cabelo?'",
+    "   [AGUARDA RESPOSTA]",
+    "   ",
+    "   ❌ INCORRETO (NÃO FAÇA ISSO):",
+    "   Agente: 'Qual tipo de produto você busca?'",
+    "   Agente: 'Temos várias opções disponíveis!'",
+    "   Agente: 'Posso te ajudar a escolher?'",
+    "",
+    "5. TRATAMENTO DE CONTEXTO:",
+    "   - Use o histórico da conversa para manter contexto",
+    "   - Se o usuário mudar de assunto, adapte-se mas continue respeitando o fluxo",
+    "   - Uma mensagem por interação é a regra de ouro",
+    "",
+    "=== FORMATAÇÃO DE RESPOSTAS ===",
+    "Ao apresentar produtos ou planos:",
+    "1. Use quebras de linha para separar seções",
+    "2. Use negrito (*texto*) para destacar nomes de planos e preços principais",
+    "3. Liste benefícios com marcadores (• ou -) um por linha",
+    "4. Agrupe informações relacionadas",
+    "5. Evite parágrafos longos - prefira listas e tópicos",
+    "6. Para múltiplos planos, apresente um de cada vez com espaçamento claro",
+    "7. Use emojis com moderação para melhorar a visualização (💰 para preços, ✨ para destaques, 👥 para público-alvo)",
+    "",
+    "✅ BOM - Exemplo de formatação clara:",
+    "*Plano Essencial*",
+    "💰 R$ 260/mês ou R$ 2.600/ano (2 meses grátis)",
+    "",
+    "O que está incluído:",
+    "• Atendimento com IA",
+    "• Base de conhecimento personalizada",
+    "• Integração WhatsApp",
+    "",
+    "👥 Ideal para: Pequenos negócios",
+    "",
+    "❌ EVITE - Formatação confusa:",
+    "Plano Essencial: Preço mensal: R$ 260 Preço anual: R$ 2600 (2 meses grátis) Benefícios: Atendimento com IA por mensagens...",
+])
+
+
+# Instructions for turns that skip retrieval (greetings, thanks, farewells)
+SMALL_TALK_INSTRUCTIONS = "\n".join([
+    "=== INSTRUÇÕES ===",
+    "Você é o assistente virtual configurado acima.",
+    "A mensagem do usuário é uma saudação, agradecimento ou despedida: responda de forma breve e cordial.",
+    "Não cite produtos, preços ou condições; se o usuário quiser saber algo, pergunte como pode ajudar.",
+    "Mantenha a personalidade e tom de voz especificados.",
+    "Responda sempre em português brasileiro.",
+])
+
+
+def compile_system_prompt(
+    personality: Dict[str, Any],
+    version: Optional[str] = None,
+    layout: str = PROMPT_LAYOUT
+) -> CompiledPrompt:
+    """
+    Precompile the per-tenant parts of the system prompt.
+    
+    Args:
+        personality: Personality dict from get_agent_personality()
+        version: Version tag (computed from the personality if None)
+        layout: "legacy" or "prefix_cache" (see module docstring)
+        
+    Returns:
+        CompiledPrompt whose head/tail wrap the knowledge base context and
+        whose minimal prompt (no knowledge base) is used for small talk
+    """
+    personality_context = format_personality_context(personality)
+    version = version or personality_version(personality)
+    minimal = f"{personality_context}\n{SMALL_TALK_INSTRUCTIONS}"
+    
+    if layout == "prefix_cache":
+        return CompiledPrompt(
+            version=version,
+            personality=personality,
+            head=f"{personality_context}\n{STATIC_INSTRUCTIONS}\n\n",
+            tail="",
+            minimal=minimal
+        )
+    
+    return CompiledPrompt(
+        version=version,
+        personality=personality,
+        head=f"{personality_context}\n",
+        tail=f"\n\n{STATIC_INSTRUCTIONS}",
+        minimal=minimal
+    )
+
+
+def personalize_system_prompt(system_prompt: str, contact_name: str) -> str:
+    """
+    Fill the {{contact_name}} placeholder of the system prompt.
+    
+    Skipped in the "prefix_cache" layout: substituting a per-contact value
+    inside the static instructions would break the cacheable prefix. The
+    contact name is still sent in the conversation block of the user prompt.
+    
+    Args:
+        system_prompt: Rendered system prompt
+        contact_name: Contact name
+        
+    Returns:
+        System prompt with the placeholder replaced (or unchanged)
+    """
+    if PROMPT_LAYOUT == "prefix_cache":
+        return system_prompt
+    return system_prompt.replace('{{contact_name}}', contact_name)
+
+
+def render_system_prompt(compiled: CompiledPrompt, knowledge_base_context: str) -> str:
+    """
+    Splice the knowledge base context into a compiled prompt.
+    
+    Args:
+        compiled: CompiledPrompt from get_compiled_prompt()
+        knowledge_base_context: Formatted knowledge base context
+        
+    Returns:
+        Complete system prompt for AI
+    """
+    return f"{compiled.head}{knowledge_base_context}{compiled.tail}"
+
+
 def build_system_prompt_with_personality(
     knowledge_base_context: str,
     personality: Dict[str, Any]
@@ -171,80 +437,15 @@ def build_system_prompt_with_personality(
         >>> personality = get_agent_personality(user_id)
         >>> prompt = build_system_prompt_with_personality(kb_context, personality)
     """
-    # Format personality section
-    personality_context = format_personality_context(personality)
-    
-    # Combine all sections
-    prompt_parts = [
-        personality_context,
-        knowledge_base_context,
-        "",
-        "=== INSTRUÇÕES ===",
-        "Você é o assistente virtual configurado acima. Use APENAS as informações fornecidas na base de conhecimento para responder.",
-        "Se não souber a resposta, seja honesto e ofereça ajuda para entrar em contato com um humano.",
-        "Mantenha a personalidade e tom de voz especificados.",
-        "Responda sempre em português brasileiro.",
-        "",
-        "=== REGRAS IMPORTANTES SOBRE O FLUXO DE CONVERSA ===",
-        "⚠️ CRÍTICO - LEIA COM ATENÇÃO:",
-        "",
-        "1. RESPEITE O SISTEMA DE PERGUNTAS E RESPOSTAS:",
-        "   - Faça UMA pergunta por vez",
-        "   - Aguarde a resposta do usuário antes de fazer nova pergunta",
-        "   - NÃO envie múltiplas mensagens consecutivas",
-        "   - Se o usuário responder com múltiplas informações, processe uma de cada vez",
-        "",
-        "2. USO DO NOME DO CONTATO:",
-        "   - Sempre que disponível, use o nome do contato para personalizar a conversa",
-        "   - Exemplo: 'Olá, {{contact_name}}! Como posso ajudar?'",
-        "   - Use o nome de forma natural, sem exageros",
-        "",
-        "3. FORMATO DE RESPOSTA:",
-        "   - Mantenha respostas concisas e objetivas",
-        "   - Use no máximo 2-3 parágrafos por mensagem",
-        "   - Se precisar coletar múltiplas informações, faça em etapas separadas",
-        "",
-        "4. EXEMPLO DE FLUXO CORRETO:",
-        "   ✅ CORRETO:",
-        "   Agente: 'Qual tipo de produto você busca?'",
-        "   [AGUARDA RESPOSTA]",
-        "   Usuário: 'Busco um shampoo'",
-        "   Agente: 'Ótimo! Para qual tipo de cabelo?'",
-        "   [AGUARDA RESPOSTA]",
-        "   ",
-        "   ❌ INCORRETO (NÃO FAÇA ISSO):",
-        "   Agente: 'Qual tipo de produto você busca?'",
-        "   Agente: 'Temos várias opções disponíveis!'",
-        "   Agente: 'Posso te ajudar a escolher?'",
-        "",
-        "5. TRATAMENTO DE CONTEXTO:",
-        "   - Use o histórico da conversa para manter contexto",
-        "   - Se o usuário mudar de assunto, adapte-se mas continue respeitando o fluxo",
-        "   - Uma mensagem por interação é a regra de ouro",
-        "",
-        "=== FORMATAÇÃO DE RESPOSTAS ===",
-        "Ao apresentar produtos ou planos:",
-        "1. Use quebras de linha para separar seções",
-        "2. Use negrito (*texto*) para destacar nomes de planos e preços principais",
-        "3. Liste benefícios com marcadores (• ou -) um por linha",
-        "4. Agrupe informações relacionadas",
-        "5. Evite parágrafos longos - prefira listas e tópicos",
-        "6. Para múltiplos planos, apresente um de cada vez com espaçamento claro",
-        "7. Use emojis com moderação para melhorar a visualização (💰 para preços, ✨ para destaques, 👥 para público-alvo)",
-        "",
-        "✅ BOM - Exemplo de formatação clara:",
-        "*Plano Essencial*",
-        "💰 R$ 260/mês ou R$ 2.600/ano (2 meses grátis)",
-        "",
-        "O que está incluído:",
-        "• Atendimento com IA",
-        "• Base de conhecimento personalizada",
-        "• Integração WhatsApp",
-        "",
-        "👥 Ideal para: Pequenos negócios",
-        "",
-        "❌ EVITE - Formatação confusa:",
-        "Plano Essencial: Preço mensal: R$ 260 Preço anual: R$ 2600 (2 meses grátis) Benefícios: Atendimento com IA por mensagens...",
-    ]
-    
-    return "\n".join(prompt_parts)
+    return render_system_prompt(compile_system_prompt(personality), knowledge_base_context)
+
+
+_DEFAULT_COMPILED_PROMPT = compile_system_prompt(DEFAULT_PERSONALITY)
+
+# Compiled prompts by user_id
+_prompt_cache = TTLCache(
+    "agent_personality",
+    ttl=PERSONALITY_CACHE_TTL,
+    max_size=PERSONALITY_CACHE_SIZE,
+    refresh_ahead=CACHE_REFRESH_AHEAD
+)
@@ -0,0 +1,188 @@
+"""
+Semantic Response Cache
+Per-tenant cache of agent replies keyed by the query embedding.
+
+Customers ask the same question in many near-identical ways. When a new
+query's embedding is within RESPONSE_CACHE_THRESHOLD (cosine similarity) of a
+cached one for the same tenant, the cached reply is returned without
+retrieval or an LLM call.
+
+Entries are scoped to the tenant's personality version, knowledge base
+version (knowledge_base_version(): row count and latest update) and model;
+a scope change drops the tenant's entries, so knowledge base edits take
+effect in every worker. Reprocessing the knowledge base
+(/knowledge/process-chunks) also invalidates the tenant explicitly. Only turns
+without conversation history are cached - replies that depend on earlier
+messages or on the contact's name must not be reused.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from src.utils.config import (
+    RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_TENANTS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _TenantResponses:
+    """Fixed-capacity ring of (normalized embedding, reply) for one tenant."""
+
+    def __init__(self, scope: Hashable, dims: int, capacity: int):
+        self.scope = scope
+        self.vectors = np.zeros((capacity, dims), dtype=np.float32)
+        self.replies: List[Optional[str]] = [None] * capacity
+        self.stored_at = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+        self.next_slot = 0
+
+    def lookup(self, query: np.ndarray, threshold: float, ttl: float) -> Optional[str]:
+        if self.size == 0:
+            return None
+        scores = self.vectors[:self.size] @ query
+        # Expired slots never match
+        scores[self.stored_at[:self.size] < time.monotonic() - ttl] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return self.replies[best]
+        return None
+
+    def store(self, query: np.ndarray, reply: str) -> None:
+        slot = self.next_slot
+        self.vectors[slot] = query
+        self.replies[slot] = reply
+        self.stored_at[slot] = time.monotonic()
+        self.next_slot = (slot + 1) % len(self.replies)
+        self.size = min(self.size + 1, len(self.replies))
+
+
+class SemanticResponseCache:
+    """
+    Thread-safe per-tenant semantic cache.
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        ttl: Seconds a reply stays valid
+        max_entries: Replies kept per tenant (oldest overwritten first)
+        max_tenants: Tenants kept in memory (least recently used evicted)
+    """
+
+    def __init__(
+        self,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_tenants: int = RESPONSE_CACHE_MAX_TENANTS
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_tenants = max_tenants
+        self._tenants: "OrderedDict[str, _TenantResponses]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def lookup(self, user_id: str, scope: Hashable, embedding: List[float]) -> Optional[str]:
+        """
+        Find a cached reply for a semantically equivalent query.
+
+        Args:
+            user_id: Tenant identifier
+            scope: Tenant state the reply depends on (personality and
+                knowledge base versions, model)
+            embedding: Query embedding
+
+        Returns:
+            Cached reply, or None on a miss
+        """
+        query = self._normalize(embedding)
+
+        with self._lock:
+            tenant = self._tenants.get(user_id)
+            if query is None or tenant is None or tenant.scope != scope:
+                self.misses += 1
+                return None
+            self._tenants.move_to_end(user_id)
+            reply = tenant.lookup(query, self.threshold, self.ttl)
+            if reply is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return reply
+
+    def store(self, user_id: str, scope: Hashable, embedding: List[float], reply: str) -> None:
+        """
+        Cache a reply for a query.
+
+        Args:
+            user_id: Tenant identifier
+            scope: Tenant state the reply depends on
+            embedding: Query embedding
+            reply: Agent reply
+        """
+        query = self._normalize(embedding)
+        if query is None:
+            return
+
+        with self._lock:
+            tenant = self._tenants.get(user_id)
+            if tenant is None or tenant.scope != scope or tenant.vectors.shape[1] != len(query):
+                tenant = _TenantResponses(scope, len(query), self.max_entries)
+                self._tenants[user_id] = tenant
+            self._tenants.move_to_end(user_id)
+            tenant.store(query, reply)
+
+            while len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> bool:
+        """Drop all cached replies of a tenant. Returns True if any were cached."""
+        with self._lock:
+            return self._tenants.pop(user_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return tenant count and hit/miss counters."""
+        with self._lock:
+            return {
+                "name": "responses",
+                "tenants": len(self._tenants),
+                "entries": sum(t.size for t in self._tenants.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Process-wide cache shared by all requests
+response_cache = SemanticResponseCache()
+
+
+def invalidate_response_cache(user_id: str) -> bool:
+    """
+    Drop cached replies for a user (called when the knowledge base is reprocessed).
+
+    Args:
+        user_id: User UUID
+
+    Returns:
+        True if replies were cached
+    """
+    invalidated = response_cache.invalidate(user_id)
+    logger.info(f"Response cache invalidated for user_id={user_id[-4:]} (cached={invalidated})")
+    return invalidated
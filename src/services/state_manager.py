@@ -8,6 +8,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 
 from src.services.supabase_service import _client
+from src.services.history_buffer import history_buffers
+from src.utils.config import HISTORY_BUFFER_ENABLED
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +81,10 @@ def get_or_create_conversation_with_state(
             .insert(new_conversation) \
             .execute()
         
+        if HISTORY_BUFFER_ENABLED and user_id:
+            # Conversa nova não tem histórico: bufferizar desde o início
+            history_buffers.start((user_id, search_field))
+        
         return result.data[0]
         
     except Exception as e:
@@ -119,7 +125,7 @@ def update_conversation_name(conversation_id: str, name: str) -> None:
         name: Nome do contato
     """
     try:
-        _client.table("conversations") \
+        result = _client.table("conversations") \
             .update({
                 'contact_name': name,
                 'conversation_state': ConversationState.ACTIVE.value,
@@ -130,6 +136,12 @@ def update_conversation_name(conversation_id: str, name: str) -> None:
         
         logger.info(f"Nome '{name}' salvo para conversa {conversation_id}")
         
+        if HISTORY_BUFFER_ENABLED:
+            # Manter o nome do histórico em memória (history_buffer) atualizado
+            for row in result.data or []:
+                if row.get('user_id') and row.get('external_contact_id'):
+                    history_buffers.set_contact_name((row['user_id'], row['external_contact_id']), name)
+        
     except Exception as e:
         logger.exception(f"Erro ao salvar nome do contato: {e}")
         raise
@@ -12,18 +12,28 @@ in a flexible JSONB structure organized by categories:
 
 The get_context() function formats these items into a readable string
 that is injected into the AI's system prompt for contextual responses.
+Formatters are registered per category in KNOWLEDGE_FORMATTERS, and the
+formatted entries are cached per tenant, keyed by a knowledge base version,
+together with an estimate of their size in tokens (knowledge_base_tokens()).
 """
 import logging
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 from supabase import create_client, Client
+from src.services.context_assembly import ContextSection, assemble_context, lexical_relevance
+from src.utils.cache import TTLCache
+from src.utils.tokens import estimate_tokens
 from src.utils.config import (
     SUPABASE_URL,
     SUPABASE_KEY,
     KB_TABLE,
     KB_OWNER_COL,
     KB_FIELDS,
-    KB_LIMIT
+    KB_LIMIT,
+    KB_VERSION_COL,
+    KB_CONTEXT_CACHE_TTL,
+    KB_CONTEXT_CACHE_SIZE,
+    SMALL_KB_MAX_TOKENS
 )
 
 logger = logging.getLogger(__name__)
@@ -32,17 +42,425 @@ logger = logging.getLogger(__name__)
 _client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
-def get_context(owner_id: str, fields: str = KB_FIELDS, limit: int = KB_LIMIT) -> str:
+def _format_produto(dados: Dict[str, Any]) -> str:
+    """Format product data, including products with multiple pricing plans."""
+    lines = []
+
+    # Header
+    nome = dados.get("nome", "Produto sem nome")
+    lines.append(f"PRODUTO: {nome}")
+
+    # Basic info - Include ALL top-level fields
+    if dados.get("categoria_produto"):
+        lines.append(f"Categoria: {dados['categoria_produto']}")
+    elif dados.get("categoria"):
+        lines.append(f"Categoria: {dados['categoria']}")
+
+    if dados.get("tipo_produto"):
+        tipo = dados['tipo_produto']
+        tipo_label = {
+            "produto_unico": "Produto Único",
+            "assinatura_plano_unico": "Assinatura (Plano Único)",
+            "assinatura_multiplos_planos": "Assinatura (Múltiplos Planos)",
+            "pacote_combo": "Pacote/Combo",
+            "sob_consulta": "Sob Consulta"
+        }.get(tipo, tipo)
+        lines.append(f"Tipo: {tipo_label}")
+
+    if dados.get("descricao"):
+        lines.append(f"Descrição: {dados['descricao']}")
+
+    # IMPORTANT: Include trial period if exists
+    if dados.get("periodo_trial"):
+        trial = dados['periodo_trial']
+        lines.append(f"Período de teste grátis: {trial} dias")
+
+    # IMPORTANT: Include payment methods if exists
+    if dados.get("formas_pagamento"):
+        lines.append(f"Formas de pagamento: {dados['formas_pagamento']}")
+
+    # Include any other top-level fields that are simple values
+    # Skip known complex fields (planos, beneficios, etc.) as they're handled below
+    skip_fields = {
+        "nome", "categoria", "categoria_produto", "tipo_produto", "descricao",
+        "periodo_trial", "formas_pagamento", "planos", "beneficios",
+        "preco_mensal", "preco_anual", "desconto_anual", "preco",
+        "caracteristicas", "itens_inclusos", "limite_usuarios", "limite_conversas", "ideal_para"
+    }
+
+    for key, value in dados.items():
+        if key not in skip_fields and value and isinstance(value, (str, int, float, bool)):
+            # Format key (convert snake_case to Title Case)
+            formatted_key = key.replace('_', ' ').title()
+            lines.append(f"{formatted_key}: {value}")
+
+    # Handle different pricing structures
+    tipo_produto = dados.get("tipo_produto", "")
+
+    if tipo_produto == "assinatura_multiplos_planos" and dados.get("planos"):
+        # Multiple pricing plans
+        lines.append("")
+        lines.append("Planos disponíveis:")
+        lines.append("")
+
+        for plano in dados["planos"]:
+            lines.append(f"Plano {plano.get('nome', 'Sem nome')}:")
+
+            if plano.get("preco_mensal"):
+                lines.append(f"  Preço mensal: R$ {plano['preco_mensal']}")
+
+            if plano.get("preco_anual"):
+                desconto = f" ({plano['desconto_anual']})" if plano.get("desconto_anual") else ""
+                lines.append(f"  Preço anual: R$ {plano['preco_anual']}{desconto}")
+
+            if plano.get("beneficios") and isinstance(plano["beneficios"], list):
+                lines.append("  Benefícios:")
+                for beneficio in plano["beneficios"]:
+                    lines.append(f"    • {beneficio}")
+
+            if plano.get("limite_usuarios"):
+                lines.append(f"  Limite de usuários: {plano['limite_usuarios']}")
+
+            if plano.get("limite_conversas"):
+                lines.append(f"  Limite de conversas: {plano['limite_conversas']}")
+
+            if plano.get("ideal_para"):
+                lines.append(f"  Ideal para: {plano['ideal_para']}")
+
+            # Include any other plan-specific fields
+            plan_skip_fields = {
+                "nome", "preco_mensal", "preco_anual", "desconto_anual",
+                "beneficios", "limite_usuarios", "limite_conversas", "ideal_para"
+            }
+            for key, value in plano.items():
+                if key not in plan_skip_fields and value and isinstance(value, (str, int, float, bool)):
+                    formatted_key = key.replace('_', ' ').title()
+                    lines.append(f"  {formatted_key}: {value}")
+
+            lines.append("")  # Blank line between plans
+
+    elif tipo_produto == "assinatura_plano_unico":
+        # Single subscription plan
+        if dados.get("preco_mensal"):
+            lines.append(f"Preço mensal: R$ {dados['preco_mensal']}")
+
+        if dados.get("preco_anual"):
+            desconto = f" ({dados['desconto_anual']})" if dados.get("desconto_anual") else ""
+            lines.append(f"Preço anual: R$ {dados['preco_anual']}{desconto}")
+
+        if dados.get("beneficios") and isinstance(dados["beneficios"], list):
+            lines.append("Benefícios:")
+            for beneficio in dados["beneficios"]:
+                lines.append(f"  • {beneficio}")
+
+    elif tipo_produto == "produto_unico":
+        # Single product with simple pricing
+        if dados.get("preco"):
+            lines.append(f"Preço: R$ {dados['preco']}")
+
+        if dados.get("caracteristicas"):
+            if isinstance(dados["caracteristicas"], list):
+                lines.append("Características:")
+                for carac in dados["caracteristicas"]:
+                    lines.append(f"  • {carac}")
+            else:
+                lines.append(f"Características: {dados['caracteristicas']}")
+
+    elif tipo_produto == "pacote_combo":
+        # Package/combo
+        if dados.get("preco"):
+            lines.append(f"Preço do pacote: R$ {dados['preco']}")
+
+        if dados.get("itens_inclusos") and isinstance(dados["itens_inclusos"], list):
+            lines.append("Itens inclusos:")
+            for item in dados["itens_inclusos"]:
+                lines.append(f"  • {item}")
+
+    elif tipo_produto == "sob_consulta":
+        lines.append("Preço: Sob consulta")
+
+    else:
+        # Fallback for old structure or unknown type
+        if dados.get("preco"):
+            lines.append(f"Preço: {dados['preco']}")
+
+        if dados.get("caracteristicas"):
+            lines.append(f"Características: {dados['caracteristicas']}")
+
+    return "\n".join(lines)
+
+
+def _format_servico(dados: Dict[str, Any]) -> str:
+    """Format service data."""
+    lines = []
+
+    if dados.get("nome"):
+        lines.append(f"SERVIÇO: {dados['nome']}")
+
+    if dados.get("descricao"):
+        lines.append(f"Descrição: {dados['descricao']}")
+
+    if dados.get("duracao"):
+        lines.append(f"Duração: {dados['duracao']}")
+
+    if dados.get("preco"):
+        lines.append(f"Preço: {dados['preco']}")
+
+    if dados.get("beneficios") and isinstance(dados["beneficios"], list):
+        lines.append("Benefícios:")
+        for beneficio in dados["beneficios"]:
+            lines.append(f"  • {beneficio}")
+
+    return "\n".join(lines) if lines else f"Serviço: {str(dados)}"
+
+
+def _format_empresa(dados: Dict[str, Any]) -> str:
+    """Format company/business info."""
+    lines = []
+
+    # Support both old and new field names
+    titulo = dados.get("titulo") or dados.get("topico")
+    conteudo = dados.get("descricao") or dados.get("conteudo")
+
+    if titulo:
+        lines.append(f"INFORMAÇÃO: {titulo}")
+
+    if conteudo:
+        lines.append(conteudo)
+
+    if dados.get("informacoes_adicionais"):
+        lines.append(dados["informacoes_adicionais"])
+
+    return "\n".join(lines) if lines else f"Empresa: {str(dados)}"
+
+
+def _format_faq(dados: Dict[str, Any]) -> str:
+    """Format FAQ entry."""
+    lines = []
+
+    if dados.get("pergunta"):
+        lines.append(f"FAQ: {dados['pergunta']}")
+
+    if dados.get("resposta"):
+        lines.append(f"Resposta: {dados['resposta']}")
+
+    return "\n".join(lines) if lines else f"FAQ: {str(dados)}"
+
+
+def _format_personalizado(dados: Dict[str, Any]) -> str:
+    """Format custom knowledge entries."""
+    lines = []
+
+    # Try to find a title/header field
+    titulo = dados.get("titulo") or dados.get("nome") or dados.get("topico")
+    if titulo:
+        lines.append(f"INFORMAÇÃO: {titulo}")
+
+    # Add other fields
+    for key, value in dados.items():
+        if key not in ["titulo", "nome", "topico"] and value:
+            if isinstance(value, list):
+                lines.append(f"{key.capitalize()}:")
+                for item in value:
+                    lines.append(f"  • {item}")
+            else:
+                lines.append(f"{key.capitalize()}: {value}")
+
+    return "\n".join(lines) if lines else f"Personalizado: {str(dados)}"
+
+
+# Formatters by knowledge_base category (unknown categories are stringified)
+KNOWLEDGE_FORMATTERS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "product": _format_produto,
+    "service": _format_servico,
+    "company": _format_empresa,
+    "faq": _format_faq,
+    "custom": _format_personalizado,
+}
+
+
+def format_knowledge_entry(row: Dict[str, Any]) -> str:
+    """
+    Format a single row from knowledge_base into readable text.
+    Handles JSONB 'data' field based on 'category'.
+    
+    Supports multiple product types including products with pricing plans.
+    """
+    category = row.get("category", "").lower()
+    data = row.get("data", {})
+    
+    # If data is not a dict (edge case), return raw
+    if not isinstance(data, dict):
+        return f"{category.capitalize()}: {str(data)}"
+    
+    formatter = KNOWLEDGE_FORMATTERS.get(category)
+    if formatter is None:
+        # Unknown category - just stringify the data
+        return f"{category.capitalize()}: {str(data)}"
+    
+    return formatter(data)
+
+
+# Header of the knowledge base context built by get_context()
+KB_CONTEXT_HEADER = "=== BASE DE CONHECIMENTO ===\n"
+
+
+class FormattedKnowledgeBase(NamedTuple):
+    """Cached formatted entries of a tenant's knowledge base."""
+    version: str
+    fields: str
+    limit: int
+    entries: List[Tuple[str, str]]
+    tokens: int
+
+
+# Formatted knowledge_base entries by owner_id, validated against the KB version
+_kb_context_cache = TTLCache(
+    "knowledge_context",
+    ttl=KB_CONTEXT_CACHE_TTL,
+    max_size=KB_CONTEXT_CACHE_SIZE
+)
+
+
+def knowledge_base_version(owner_id: str) -> str:
+    """
+    Cheap version of a tenant's knowledge base: row count and latest
+    KB_VERSION_COL, read in one request without fetching any data.
+    
+    Any insert or edit moves the latest timestamp and any delete changes
+    the count, so formatted entries cached under another version are stale.
+    
+    Raises:
+        Exception: If the database query fails
+    """
+    result = _client.table(KB_TABLE) \
+        .select(KB_VERSION_COL, count="exact") \
+        .eq(KB_OWNER_COL, owner_id) \
+        .order(KB_VERSION_COL, desc=True) \
+        .limit(1) \
+        .execute()
+    
+    latest = result.data[0].get(KB_VERSION_COL) if result.data else None
+    return f"{result.count}:{latest}"
+
+
+def _get_formatted_entries(owner_id: str, fields: str, limit: int) -> List[Tuple[str, str]]:
+    """
+    (name, formatted text) of a tenant's knowledge_base entries.
+    
+    Served from the cache when the stored version matches the current one;
+    if the version cannot be read, the entries are fetched and not cached.
+    """
+    try:
+        version = knowledge_base_version(owner_id)
+    except Exception as e:
+        logger.warning("Knowledge base version check failed for owner=%s: %s", owner_id[-4:], e)
+        version = None
+    
+    if version is not None:
+        found, cached = _kb_context_cache.get(owner_id)
+        if found and (cached.version, cached.fields, cached.limit) == (version, fields, limit):
+            return cached.entries
+    
+    # Query Supabase table filtered by user_id
+    # If 'ativo' field exists, filter only active entries (future-proofing)
+    # For now, we fetch all entries since 'ativo' field doesn't exist yet
+    response = _client.table(KB_TABLE).select(fields).eq(KB_OWNER_COL, owner_id).limit(limit).execute()
+    
+    rows: List[Dict[str, Any]] = response.data or []
+    entries = [(str(row.get("id") or i), format_knowledge_entry(row)) for i, row in enumerate(rows)]
+    
+    if version is not None:
+        tokens = estimate_tokens("\n".join([KB_CONTEXT_HEADER] + [text + "\n" for _, text in entries]))
+        _kb_context_cache.set(owner_id, FormattedKnowledgeBase(version, fields, limit, entries, tokens))
+    
+    return entries
+
+
+def knowledge_base_tokens(owner_id: str, load: bool = False) -> Optional[int]:
+    """
+    Estimated tokens of a tenant's full knowledge base context.
+    
+    Read from the formatted knowledge base cache, including expired entries:
+    the size of a knowledge base rarely changes much, and the context itself
+    is revalidated when it is built.
+    
+    Args:
+        owner_id: User UUID
+        load: Fetch and cache the formatted entries if nothing is cached
+            (blocking: runs Supabase queries)
+        
+    Returns:
+        Estimated tokens, or None if unknown
+    """
+    cached = _kb_context_cache.peek(owner_id)
+    if cached is None and load:
+        try:
+            _get_formatted_entries(owner_id, KB_FIELDS, KB_LIMIT)
+        except Exception as e:
+            logger.warning("Knowledge base size unavailable for owner=%s: %s", owner_id[-4:], e)
+            return None
+        cached = _kb_context_cache.peek(owner_id)
+    return cached.tokens if cached is not None else None
+
+
+def is_small_knowledge_base(owner_id: str, max_tokens: int = SMALL_KB_MAX_TOKENS) -> bool:
+    """
+    Whether a tenant's whole knowledge base fits in max_tokens, judged by
+    the cached size estimate (False while unknown or if max_tokens is 0).
+    
+    Small knowledge bases are inlined in the prompt instead of searched.
+    
+    Example:
+        >>> is_small_knowledge_base("uuid-never-seen")
+        False
+    """
+    if max_tokens <= 0:
+        return False
+    tokens = knowledge_base_tokens(owner_id)
+    return tokens is not None and tokens <= max_tokens
+
+
+def invalidate_kb_context_cache(owner_id: str) -> bool:
+    """
+    Drop a tenant's cached formatted knowledge base.
+    
+    Args:
+        owner_id: User UUID
+        
+    Returns:
+        True if an entry was cached
+    """
+    return _kb_context_cache.invalidate(owner_id)
+
+
+def get_kb_context_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss counters of the formatted knowledge base cache."""
+    return _kb_context_cache.stats()
+
+
+def get_context(
+    owner_id: str,
+    fields: str = KB_FIELDS,
+    limit: int = KB_LIMIT,
+    query: Optional[str] = None,
+    token_budget: Optional[int] = None
+) -> str:
     """
     Fetch knowledge base context for a specific owner from Supabase.
     
     Queries the knowledge_base table for all active knowledge entries
     belonging to the specified user and formats them into a readable context string.
+    Formatted entries are cached per tenant and reused while the tenant's
+    knowledge base version (see knowledge_base_version()) is unchanged.
     
     Args:
         owner_id: User/owner identifier to filter knowledge base (user_id in knowledge_base)
         fields: Comma-separated field names to retrieve (default: from config)
         limit: Maximum number of records to fetch (default: from config)
+        query: User's message; entries sharing more words with it are kept
+            first when the budget does not fit them all
+        token_budget: Maximum estimated tokens of the context (None: no limit)
         
     Returns:
         Formatted context string with knowledge items, or default message if empty
@@ -52,292 +470,31 @@ def get_context(owner_id: str, fields: str = KB_FIELDS, limit: int = KB_LIMIT) -
         "Knowledge Base:\\n\\n- FAQ: Question: What time? | Answer: 9am to 6pm\\n\\n- Product: Item X | Description: ... | Price: R$ 50"
     """
     try:
-        logger.debug("Fetching knowledge base for owner_id=%s", owner_id[-4:] if len(owner_id) > 4 else "***")
-        
-        # Query Supabase table filtered by user_id
-        query = _client.table(KB_TABLE).select(fields).eq(KB_OWNER_COL, owner_id)
-        
-        # If 'ativo' field exists, filter only active entries (future-proofing)
-        # For now, we fetch all entries since 'ativo' field doesn't exist yet
+        entries = _get_formatted_entries(owner_id, fields, limit)
         
-        response = query.limit(limit).execute()
-        
-        rows: List[Dict[str, Any]] = response.data or []
-        
-        if not rows:
+        if not entries:
             logger.info("No knowledge base entries found for owner=%s", owner_id[-4:] if len(owner_id) > 4 else "***")
             return "Nenhuma base de conhecimento cadastrada para este usuário."
         
-        # Format rows into readable context
-        def format_row(row: Dict[str, Any]) -> str:
-            """
-            Format a single row from knowledge_base into readable text.
-            Handles JSONB 'data' field based on 'category'.
-            
-            Supports multiple product types including products with pricing plans.
-            """
-            category = row.get("category", "").lower()
-            data = row.get("data", {})
-            
-            # If data is not a dict (edge case), return raw
-            if not isinstance(data, dict):
-                return f"{category.capitalize()}: {str(data)}"
-            
-            # Format based on category
-            if category == "product":
-                return format_produto(data)
-            
-            elif category == "service":
-                return format_servico(data)
-            
-            elif category == "company":
-                return format_empresa(data)
-            
-            elif category == "faq":
-                return format_faq(data)
-            
-            elif category == "custom":
-                return format_personalizado(data)
-            
-            else:
-                # Unknown category - just stringify the data
-                return f"{category.capitalize()}: {str(data)}"
-        
-        def format_produto(dados: Dict[str, Any]) -> str:
-            """Format product data, including products with multiple pricing plans."""
-            lines = []
-            
-            # Header
-            nome = dados.get("nome", "Produto sem nome")
-            lines.append(f"PRODUTO: {nome}")
-            
-            # Basic info - Include ALL top-level fields
-            if dados.get("categoria_produto"):
-                lines.append(f"Categoria: {dados['categoria_produto']}")
-            elif dados.get("categoria"):
-                lines.append(f"Categoria: {dados['categoria']}")
-            
-            if dados.get("tipo_produto"):
-                tipo = dados['tipo_produto']
-                tipo_label = {
-                    "produto_unico": "Produto Único",
-                    "assinatura_plano_unico": "Assinatura (Plano Único)",
-                    "assinatura_multiplos_planos": "Assinatura (Múltiplos Planos)",
-                    "pacote_combo": "Pacote/Combo",
-                    "sob_consulta": "Sob Consulta"
-                }.get(tipo, tipo)
-                lines.append(f"Tipo: {tipo_label}")
-            
-            if dados.get("descricao"):
-                lines.append(f"Descrição: {dados['descricao']}")
-            
-            # IMPORTANT: Include trial period if exists
-            if dados.get("periodo_trial"):
-                trial = dados['periodo_trial']
-                lines.append(f"Período de teste grátis: {trial} dias")
-            
-            # IMPORTANT: Include payment methods if exists
-            if dados.get("formas_pagamento"):
-                lines.append(f"Formas de pagamento: {dados['formas_pagamento']}")
-            
-            # Include any other top-level fields that are simple values
-            # Skip known complex fields (planos, beneficios, etc.) as they're handled below
-            skip_fields = {
-                "nome", "categoria", "categoria_produto", "tipo_produto", "descricao",
-                "periodo_trial", "formas_pagamento", "planos", "beneficios",
-                "preco_mensal", "preco_anual", "desconto_anual", "preco",
-                "caracteristicas", "itens_inclusos", "limite_usuarios", "limite_conversas", "ideal_para"
-            }
-            
-            for key, value in dados.items():
-                if key not in skip_fields and value and isinstance(value, (str, int, float, bool)):
-                    # Format key (convert snake_case to Title Case)
-                    formatted_key = key.replace('_', ' ').title()
-                    lines.append(f"{formatted_key}: {value}")
-            
-            # Handle different pricing structures
-            tipo_produto = dados.get("tipo_produto", "")
-            
-            if tipo_produto == "assinatura_multiplos_planos" and dados.get("planos"):
-                # Multiple pricing plans
-                lines.append("")
-                lines.append("Planos disponíveis:")
-                lines.append("")
-                
-                for plano in dados["planos"]:
-                    lines.append(f"Plano {plano.get('nome', 'Sem nome')}:")
-                    
-                    if plano.get("preco_mensal"):
-                        lines.append(f"  Preço mensal: R$ {plano['preco_mensal']}")
-                    
-                    if plano.get("preco_anual"):
-                        desconto = f" ({plano['desconto_anual']})" if plano.get("desconto_anual") else ""
-                        lines.append(f"  Preço anual: R$ {plano['preco_anual']}{desconto}")
-                    
-                    if plano.get("beneficios") and isinstance(plano["beneficios"], list):
-                        lines.append("  Benefícios:")
-                        for beneficio in plano["beneficios"]:
-                            lines.append(f"    • {beneficio}")
-                    
-                    if plano.get("limite_usuarios"):
-                        lines.append(f"  Limite de usuários: {plano['limite_usuarios']}")
-                    
-                    if plano.get("limite_conversas"):
-                        lines.append(f"  Limite de conversas: {plano['limite_conversas']}")
-                    
-                    if plano.get("ideal_para"):
-                        lines.append(f"  Ideal para: {plano['ideal_para']}")
-                    
-                    # Include any other plan-specific fields
-                    plan_skip_fields = {
-                        "nome", "preco_mensal", "preco_anual", "desconto_anual",
-                        "beneficios", "limite_usuarios", "limite_conversas", "ideal_para"
-                    }
-                    for key, value in plano.items():
-                        if key not in plan_skip_fields and value and isinstance(value, (str, int, float, bool)):
-                            formatted_key = key.replace('_', ' ').title()
-                            lines.append(f"  {formatted_key}: {value}")
-                    
-                    lines.append("")  # Blank line between plans
-            
-            elif tipo_produto == "assinatura_plano_unico":
-                # Single subscription plan
-                if dados.get("preco_mensal"):
-                    lines.append(f"Preço mensal: R$ {dados['preco_mensal']}")
-                
-                if dados.get("preco_anual"):
-                    desconto = f" ({dados['desconto_anual']})" if dados.get("desconto_anual") else ""
-                    lines.append(f"Preço anual: R$ {dados['preco_anual']}{desconto}")
-                
-                if dados.get("beneficios") and isinstance(dados["beneficios"], list):
-                    lines.append("Benefícios:")
-                    for beneficio in dados["beneficios"]:
-                        lines.append(f"  • {beneficio}")
-            
-            elif tipo_produto == "produto_unico":
-                # Single product with simple pricing
-                if dados.get("preco"):
-                    lines.append(f"Preço: R$ {dados['preco']}")
-                
-                if dados.get("caracteristicas"):
-                    if isinstance(dados["caracteristicas"], list):
-                        lines.append("Características:")
-                        for carac in dados["caracteristicas"]:
-                            lines.append(f"  • {carac}")
-                    else:
-                        lines.append(f"Características: {dados['caracteristicas']}")
-            
-            elif tipo_produto == "pacote_combo":
-                # Package/combo
-                if dados.get("preco"):
-                    lines.append(f"Preço do pacote: R$ {dados['preco']}")
-                
-                if dados.get("itens_inclusos") and isinstance(dados["itens_inclusos"], list):
-                    lines.append("Itens inclusos:")
-                    for item in dados["itens_inclusos"]:
-                        lines.append(f"  • {item}")
-            
-            elif tipo_produto == "sob_consulta":
-                lines.append("Preço: Sob consulta")
-            
-            else:
-                # Fallback for old structure or unknown type
-                if dados.get("preco"):
-                    lines.append(f"Preço: {dados['preco']}")
-                
-                if dados.get("caracteristicas"):
-                    lines.append(f"Características: {dados['caracteristicas']}")
-            
-            return "\n".join(lines)
-        
-        def format_servico(dados: Dict[str, Any]) -> str:
-            """Format service data."""
-            lines = []
-            
-            if dados.get("nome"):
-                lines.append(f"SERVIÇO: {dados['nome']}")
-            
-            if dados.get("descricao"):
-                lines.append(f"Descrição: {dados['descricao']}")
-            
-            if dados.get("duracao"):
-                lines.append(f"Duração: {dados['duracao']}")
-            
-            if dados.get("preco"):
-                lines.append(f"Preço: {dados['preco']}")
-            
-            if dados.get("beneficios") and isinstance(dados["beneficios"], list):
-                lines.append("Benefícios:")
-                for beneficio in dados["beneficios"]:
-                    lines.append(f"  • {beneficio}")
-            
-            return "\n".join(lines) if lines else f"Serviço: {str(dados)}"
-        
-        def format_empresa(dados: Dict[str, Any]) -> str:
-            """Format company/business info."""
-            lines = []
-            
-            # Support both old and new field names
-            titulo = dados.get("titulo") or dados.get("topico")
-            conteudo = dados.get("descricao") or dados.get("conteudo")
-            
-            if titulo:
-                lines.append(f"INFORMAÇÃO: {titulo}")
-            
-            if conteudo:
-                lines.append(conteudo)
-            
-            if dados.get("informacoes_adicionais"):
-                lines.append(dados["informacoes_adicionais"])
-            
-            return "\n".join(lines) if lines else f"Empresa: {str(dados)}"
-        
-        def format_faq(dados: Dict[str, Any]) -> str:
-            """Format FAQ entry."""
-            lines = []
-            
-            if dados.get("pergunta"):
-                lines.append(f"FAQ: {dados['pergunta']}")
-            
-            if dados.get("resposta"):
-                lines.append(f"Resposta: {dados['resposta']}")
-            
-            return "\n".join(lines) if lines else f"FAQ: {str(dados)}"
-        
-        def format_personalizado(dados: Dict[str, Any]) -> str:
-            """Format custom knowledge entries."""
-            lines = []
-            
-            # Try to find a title/header field
-            titulo = dados.get("titulo") or dados.get("nome") or dados.get("topico")
-            if titulo:
-                lines.append(f"INFORMAÇÃO: {titulo}")
-            
-            # Add other fields
-            for key, value in dados.items():
-                if key not in ["titulo", "nome", "topico"] and value:
-                    if isinstance(value, list):
-                        lines.append(f"{key.capitalize()}:")
-                        for item in value:
-                            lines.append(f"  • {item}")
-                    else:
-                        lines.append(f"{key.capitalize()}: {value}")
-            
-            return "\n".join(lines) if lines else f"Personalizado: {str(dados)}"
-        
-        # Build context with header
-        context_lines = ["=== BASE DE CONHECIMENTO ===", ""]
+        # Build context with header, most relevant entries first within the budget
+        sections = []
         
-        for row in rows:
-            formatted = format_row(row)
-            context_lines.append(formatted)
-            context_lines.append("")  # Blank line between entries
+        for name, formatted in entries:
+            sections.append(ContextSection(
+                name=name,
+                text=formatted + "\n",  # Blank line between entries
+                relevance=lexical_relevance(query, formatted) if query else 0.0
+            ))
         
-        context = "\n".join(context_lines)
+        assembled = assemble_context(KB_CONTEXT_HEADER, sections, budget=token_budget)
         
-        logger.info("Retrieved %d KB entries for owner=%s", len(rows), owner_id[-4:] if len(owner_id) > 4 else "***")
+        logger.info(
+            "Retrieved %d KB entries for owner=%s, kept %d (~%d tokens, budget: %s)",
+            len(entries), owner_id[-4:] if len(owner_id) > 4 else "***",
+            len(assembled.section_tokens), assembled.tokens_used, token_budget
+        )
         
-        return context
+        return assembled.text
         
     except Exception as e:
         logger.exception("Failed to fetch context from Supabase for owner=%s: %s", 
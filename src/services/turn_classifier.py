@@ -0,0 +1,134 @@
+"""
+Turn Classifier Service
+Decides whether a customer message needs knowledge base retrieval.
+
+Greetings, thanks and farewells ("oi", "obrigado", "tchau") do not
+benefit from retrieval: embedding them finds nothing above the similarity
+threshold and the fallback then puts the whole knowledge base in the
+prompt. classify_turn() decides with a few rules, in-process:
+
+1. Empty/punctuation-only messages and known small-talk phrases skip
+   retrieval; emoji-only reactions retrieve
+2. Questions, numbers, long messages and messages with any word outside the
+   small-talk vocabulary retrieve
+3. The rest (small-talk words only, e.g. "valeu pela força, até amanhã")
+   skip retrieval
+
+Affirmations and negations ("sim", "não", "ok", "pode ser", "fechado") are
+never small talk: they usually answer the agent's own question ("quer saber
+o preço do plano Essencial?") and need the knowledge base as much as the
+question did. Reaction emoji ("👍", "👎", "😡") are treated the same way:
+they are affirmations, negations or complaints without words.
+"""
+import logging
+import re
+import unicodedata
+from typing import List, NamedTuple
+
+from src.services.lexical_index import fold_accents
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Three or more repeats of a letter ("obrigadooo", "kkkk") are squeezed to one
+_REPEATED_RE = re.compile(r"(.)\1{2,}")
+
+# Messages longer than this (normalized) always retrieve
+_LONG_MESSAGE = 60
+
+# Normalized (see _normalize) whole messages that never need retrieval
+_SMALL_TALK_PHRASES = frozenset([
+    "oi", "ola", "opa", "eai", "e ai", "hey", "hi", "hello", "alo",
+    "bom dia", "boa tarde", "boa noite", "oi bom dia", "oi boa tarde", "oi boa noite",
+    "ola bom dia", "ola boa tarde", "ola boa noite", "tudo bem", "oi tudo bem",
+    "bom dia tudo bem", "boa tarde tudo bem", "boa noite tudo bem", "tudo bom", "oi tudo bom",
+    "obrigado", "obrigada", "obg", "obgd", "brigado", "brigada", "muito obrigado",
+    "muito obrigada", "obrigado mesmo", "valeu", "vlw", "valeu mesmo", "agradeco",
+    "haha", "rs", "tchau", "ate mais", "ate logo", "abraco", "falou", "flw", "bjs",
+])
+
+# More small talk; with the phrases above, their words form the small-talk vocabulary
+_SMALL_TALK_EXAMPLES: List[str] = [
+    "oi tudo bem com voce",
+    "ola boa tarde tudo joia",
+    "bom dia pessoal",
+    "boa noite tudo joia",
+    "muito obrigado pela ajuda",
+    "obrigada pela atencao",
+    "valeu pela forca",
+    "agradeco o retorno",
+    "ate amanha",
+    "tchau bom fim de semana",
+    "abracos ate mais",
+    "falou valeu",
+    "tudo otimo e voce",
+    "estou bem e voce",
+    "tudo joia por ai",
+    "de nada",
+]
+
+_SMALL_TALK_WORDS = frozenset(
+    word
+    for text in list(_SMALL_TALK_PHRASES) + _SMALL_TALK_EXAMPLES
+    for word in text.split()
+)
+
+
+class TurnDecision(NamedTuple):
+    """Result of classify_turn()."""
+    needs_retrieval: bool
+    reason: str
+
+
+def _normalize(message: str) -> str:
+    words = _WORD_RE.findall(fold_accents(message or ""))
+    return _REPEATED_RE.sub(r"\1", " ".join(words))
+
+
+def _has_symbol(message: str) -> bool:
+    """True if the message has an emoji or other symbol character."""
+    return any(unicodedata.category(char).startswith("S") for char in message)
+
+
+def classify_turn(message: str) -> TurnDecision:
+    """
+    Decide whether a message needs knowledge base retrieval.
+
+    Args:
+        message: Customer message
+
+    Returns:
+        TurnDecision with needs_retrieval and the deciding rule ("empty",
+        "reaction", "small_talk", "question", "number", "long", "unknown_word" or
+        "small_talk_words")
+
+    Example:
+        >>> classify_turn("Obrigadooo!! 👍")
+        TurnDecision(needs_retrieval=False, reason='small_talk')
+        >>> classify_turn("Quanto custa o plano Essencial?").needs_retrieval
+        True
+        >>> classify_turn("valeu pela força, até amanhã").needs_retrieval
+        False
+        >>> classify_turn("sim")
+        TurnDecision(needs_retrieval=True, reason='unknown_word')
+        >>> classify_turn("👍")
+        TurnDecision(needs_retrieval=True, reason='reaction')
+    """
+    text = _normalize(message)
+
+    if not text:
+        if _has_symbol(message or ""):
+            return TurnDecision(True, "reaction")
+        return TurnDecision(False, "empty")
+    if text in _SMALL_TALK_PHRASES:
+        return TurnDecision(False, "small_talk")
+    if "?" in message:
+        return TurnDecision(True, "question")
+    if any(char.isdigit() for char in text):
+        return TurnDecision(True, "number")
+    if len(text) > _LONG_MESSAGE:
+        return TurnDecision(True, "long")
+    if any(word not in _SMALL_TALK_WORDS for word in text.split()):
+        return TurnDecision(True, "unknown_word")
+    return TurnDecision(False, "small_talk_words")
@@ -1,13 +1,33 @@
 """
 Vector Search Service
 Performs semantic search using embeddings and pgvector.
+
+VECTOR_BACKEND selects where similarity search runs:
+- "rpc": the match_knowledge_chunks Postgres function (default)
+- "local": an in-process per-tenant index (see local_index), with the RPC
+  as fallback if the index cannot be loaded
+
+hybrid_search() fuses vector hits with BM25 hits (see lexical_index) by
+reciprocal rank fusion, and skips vector search for confident lexical matches
+and for knowledge bases small enough to be inlined whole (SMALL_KB_MAX_TOKENS).
 """
+import asyncio
 import logging
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 from supabase import Client
 
+from src.services.context_assembly import ContextSection, assemble_context
 from src.services.embeddings import generate_embedding
-from src.services.supabase_service import _client
+from src.services.lexical_index import LexicalResult, lexical_search
+from src.services.supabase_service import _client, knowledge_base_tokens
+from src.services.local_index import local_index
+from src.utils.config import (
+    VECTOR_BACKEND,
+    LEXICAL_SEARCH_ENABLED,
+    LEXICAL_ONLY_ENABLED,
+    RRF_K,
+    SMALL_KB_MAX_TOKENS
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +37,8 @@ async def search_similar_chunks(
     query: str,
     top_k: int = 5,
     category: Optional[str] = None,
-    similarity_threshold: float = 0.7
+    similarity_threshold: float = 0.7,
+    query_embedding: Optional[List[float]] = None
 ) -> List[Dict]:
     """
     Search for the most similar knowledge chunks using vector embeddings.
@@ -28,6 +49,7 @@ async def search_similar_chunks(
         top_k: Number of most relevant chunks to return
         category: Optional filter by category (product, faq, company, etc.)
         similarity_threshold: Minimum similarity score (0-1, where 1 is identical)
+        query_embedding: Precomputed embedding of the query (generated if None)
     
     Returns:
         List of dicts with chunk data and similarity scores:
@@ -38,7 +60,8 @@ async def search_similar_chunks(
                 "category": "product",
                 "source": "dashboard",
                 "similarity": 0.89,
-                "knowledge_id": "uuid..."
+                "knowledge_id": "uuid...",
+                "metadata": {"section": "plan", "plan": "Essencial", ...}
             },
             ...
         ]
@@ -57,10 +80,26 @@ async def search_similar_chunks(
     try:
         logger.info(f"Searching chunks for user {user_id[-4:]}, query: '{query[:50]}...'")
         
-        # 1. Generate embedding for the query
-        query_embedding = await generate_embedding(query)
+        # 1. Generate embedding for the query (unless the caller already has it)
+        if query_embedding is None:
+            query_embedding = await generate_embedding(query)
         
-        # 2. Call Supabase RPC function for vector search
+        # 2a. Search the in-process index when enabled
+        if VECTOR_BACKEND == "local":
+            try:
+                index = await asyncio.to_thread(local_index.get, user_id)
+                chunks = index.search(
+                    query_embedding,
+                    top_k=top_k,
+                    category=category,
+                    similarity_threshold=similarity_threshold
+                )
+                logger.info(f"Found {len(chunks)} similar chunks in local index (threshold: {similarity_threshold})")
+                return chunks
+            except Exception as e:
+                logger.warning(f"Local vector index unavailable, falling back to RPC: {e}")
+        
+        # 2b. Call Supabase RPC function for vector search
         params = {
             'query_embedding': query_embedding,
             'match_count': top_k,
@@ -71,7 +110,8 @@ async def search_similar_chunks(
         if category:
             params['filter_category'] = category
         
-        result = _client.rpc('match_knowledge_chunks', params).execute()
+        # The Supabase client is synchronous: keep it off the event loop
+        result = await asyncio.to_thread(_client.rpc('match_knowledge_chunks', params).execute)
         
         chunks = result.data if result.data else []
         
@@ -85,12 +125,96 @@ async def search_similar_chunks(
         return []
 
 
+def format_chunks_context(chunks: List[Dict], token_budget: Optional[int] = None) -> str:
+    """
+    Format retrieved chunks (best first) as context within a token budget.
+    
+    Args:
+        chunks: Chunk rows from vector and/or lexical search, best first
+        token_budget: Maximum estimated tokens of the context (None: no limit)
+    
+    Returns:
+        Formatted context string for the LLM
+    """
+    sections = []
+    
+    for i, chunk in enumerate(chunks, 1):
+        category_label = chunk.get('category', 'geral').upper()
+        plan = (chunk.get('metadata') or {}).get('plan')
+        if plan:
+            category_label += f" - PLANO {plan.upper()}"
+        text = chunk.get('chunk_text', '')
+        
+        # Format with relevance indicator (lexical-only hits have no similarity)
+        if chunk.get('similarity') is not None:
+            relevance = f"relevância: {chunk['similarity']:.0%}"
+        else:
+            relevance = "correspondência por palavras-chave"
+        
+        sections.append(ContextSection(
+            name=str(chunk.get('id') or i),
+            text=f"- [{category_label}] ({relevance})\n{text}\n",
+            relevance=len(chunks) - i
+        ))
+    
+    assembled = assemble_context(
+        "=== BASE DE CONHECIMENTO (Busca Semântica) ===\n",
+        sections,
+        budget=token_budget
+    )
+    
+    logger.info(
+        f"Built context with {len(assembled.section_tokens)}/{len(chunks)} chunks "
+        f"(~{assembled.tokens_used} tokens, budget: {token_budget}, "
+        f"per chunk: {list(assembled.section_tokens.values())})"
+    )
+    
+    return assembled.text
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], top_k: int = 5, k: int = RRF_K) -> List[Dict]:
+    """
+    Merge ranked chunk lists by reciprocal rank fusion.
+    
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in
+    (rank starts at 1), so chunks found by both searches rise to the top.
+    Chunks are identified by id; the first row seen for an id is kept.
+    
+    Args:
+        rankings: Chunk lists, each best first
+        top_k: Number of chunks to return
+        k: RRF constant (larger flattens the rank weights)
+    
+    Returns:
+        Up to top_k chunk rows, best first
+    
+    Example:
+        >>> vector = [{"id": "a"}, {"id": "b"}]
+        >>> lexical = [{"id": "b"}, {"id": "c"}]
+        >>> [c["id"] for c in reciprocal_rank_fusion([vector, lexical], top_k=3)]
+        ['b', 'a', 'c']
+    """
+    scores: Dict[str, float] = {}
+    rows: Dict[str, Dict] = {}
+    
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            chunk_id = str(chunk.get('id'))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+            rows.setdefault(chunk_id, chunk)
+    
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [rows[chunk_id] for chunk_id in best]
+
+
 async def get_context_from_chunks(
     user_id: str,
     query: str,
     category: Optional[str] = None,
     top_k: int = 5,
-    similarity_threshold: float = 0.7
+    similarity_threshold: float = 0.7,
+    query_embedding: Optional[List[float]] = None,
+    token_budget: Optional[int] = None
 ) -> str:
     """
     Main function that replaces the original get_context().
@@ -98,7 +222,7 @@ async def get_context_from_chunks(
     
     This function:
     1. Searches for semantically similar chunks
-    2. Formats them into a readable context string
+    2. Keeps the most similar ones that fit the token budget
     3. Returns the context for inclusion in the AI prompt
     
     Args:
@@ -107,6 +231,8 @@ async def get_context_from_chunks(
         category: Optional category filter
         top_k: Number of chunks to include in context
         similarity_threshold: Minimum similarity score
+        query_embedding: Precomputed embedding of the query (generated if None)
+        token_budget: Maximum estimated tokens of the context (None: no limit)
     
     Returns:
         Formatted context string for the LLM
@@ -126,81 +252,113 @@ async def get_context_from_chunks(
             query=query,
             top_k=top_k,
             category=category,
-            similarity_threshold=similarity_threshold
+            similarity_threshold=similarity_threshold,
+            query_embedding=query_embedding
         )
         
         if not chunks:
             logger.warning(f"No relevant chunks found for user {user_id[-4:]}")
             return "Nenhuma informação relevante encontrada na base de conhecimento."
         
-        # Format chunks as context
-        context_parts = ["=== BASE DE CONHECIMENTO (Busca Semântica) ===\n"]
-        
-        for i, chunk in enumerate(chunks, 1):
-            category_label = chunk.get('category', 'geral').upper()
-            text = chunk.get('chunk_text', '')
-            similarity = chunk.get('similarity', 0)
-            
-            # Format with relevance indicator
-            context_parts.append(
-                f"{i}. [{category_label}] (relevância: {similarity:.0%})\n{text}\n"
-            )
-        
-        context = "\n".join(context_parts)
-        
-        logger.debug(f"Built context with {len(chunks)} chunks ({len(context)} chars)")
-        
-        return context
+        return format_chunks_context(chunks, token_budget)
         
     except Exception as e:
         logger.exception(f"Error getting context from chunks: {e}")
         return "Erro ao buscar informações na base de conhecimento."
 
 
+# Background knowledge base size estimates in flight, per tenant
+_size_warmups: Dict[str, "asyncio.Task[Any]"] = {}
+
+
+def _warm_knowledge_base_size(user_id: str) -> None:
+    """
+    Estimate a tenant's knowledge base size in the background (at most one
+    estimate per tenant at a time), so later turns can inline it.
+    """
+    if user_id in _size_warmups:
+        return
+    task = asyncio.create_task(asyncio.to_thread(knowledge_base_tokens, user_id, True))
+    _size_warmups[user_id] = task
+    task.add_done_callback(lambda _: _size_warmups.pop(user_id, None))
+
+
 async def hybrid_search(
     user_id: str,
     query: str,
     category: Optional[str] = None,
-    top_k: int = 5
+    top_k: int = 5,
+    query_embedding: Optional[List[float]] = None,
+    token_budget: Optional[int] = None,
+    lexical: Optional[LexicalResult] = None
 ) -> str:
     """
-    Hybrid search: tries vector search first, falls back to original get_context().
+    Hybrid search: lexical (BM25) and vector search fused by reciprocal rank
+    fusion, with the original get_context() as fallback.
     
-    This allows gradual migration - if no chunks are found in knowledge_chunks,
-    falls back to the original knowledge_base table.
+    A knowledge base whose whole formatted context fits SMALL_KB_MAX_TOKENS
+    (and the token budget) is inlined from the get_context() cache without
+    any search. Its size is only read from the cache; while unknown it is
+    estimated in the background and this turn is searched normally. A confident lexical match is used on its own
+    (LEXICAL_ONLY_ENABLED), so neither the embedding call nor vector search
+    runs. Otherwise vector hits and lexical hits are fused, and if both are
+    empty the original knowledge_base table is used (gradual migration).
     
     Args:
         user_id: User ID
         query: User's question
         category: Optional category filter
         top_k: Number of results
+        query_embedding: Precomputed embedding of the query (generated if None
+            and vector search runs)
+        token_budget: Maximum estimated tokens of the context (both paths)
+        lexical: Precomputed lexical_search() result (searched here if None
+            and LEXICAL_SEARCH_ENABLED)
     
     Returns:
-        Context string from vector search or fallback
+        Context string from retrieval or fallback
     """
+    from src.services.supabase_service import get_context as original_get_context
+    
     try:
-        # Try vector search first
-        context = await get_context_from_chunks(
+        if SMALL_KB_MAX_TOKENS > 0 and not category:
+            kb_tokens = knowledge_base_tokens(user_id)
+            if kb_tokens is None:
+                _warm_knowledge_base_size(user_id)
+            limit = min(SMALL_KB_MAX_TOKENS, token_budget or SMALL_KB_MAX_TOKENS)
+            if kb_tokens is not None and kb_tokens <= limit:
+                logger.info(f"Inlining small knowledge base (~{kb_tokens} tokens, cutoff: {limit})")
+                return await asyncio.to_thread(original_get_context, user_id, query=query, token_budget=token_budget)
+        
+        if lexical is None and LEXICAL_SEARCH_ENABLED:
+            lexical = await asyncio.to_thread(lexical_search, user_id, query, top_k, category)
+        lexical_chunks = [hit.row for hit in lexical.hits] if lexical else []
+        
+        if lexical is not None and lexical.confident and LEXICAL_ONLY_ENABLED:
+            logger.info(f"Using lexical-only results (confidence: {lexical.confidence})")
+            return format_chunks_context(lexical_chunks, token_budget)
+        
+        chunks = await search_similar_chunks(
             user_id=user_id,
             query=query,
-            category=category,
             top_k=top_k,
-            similarity_threshold=0.7
+            category=category,
+            similarity_threshold=0.7,
+            query_embedding=query_embedding
         )
         
-        # Check if vector search found anything
-        if "Nenhuma informação relevante" not in context and "Erro ao buscar" not in context:
-            logger.info("Using vector search results")
-            return context
+        if lexical_chunks:
+            chunks = reciprocal_rank_fusion([chunks, lexical_chunks], top_k=top_k)
         
-        # Fall back to original get_context
-        logger.info("Vector search empty, falling back to original get_context()")
-        from src.services.supabase_service import get_context as original_get_context
+        if chunks:
+            logger.info(f"Using retrieval results ({len(chunks)} chunks, lexical hits: {len(lexical_chunks)})")
+            return format_chunks_context(chunks, token_budget)
         
-        return original_get_context(user_id)
+        # Fall back to original get_context
+        logger.info("Retrieval empty, falling back to original get_context()")
+        return await asyncio.to_thread(original_get_context, user_id, query=query, token_budget=token_budget)
         
     except Exception as e:
         logger.exception(f"Error in hybrid search: {e}")
         # Last resort fallback
-        from src.services.supabase_service import get_context as original_get_context
-        return original_get_context(user_id)
+        return await asyncio.to_thread(original_get_context, user_id, query=query, token_budget=token_budget)
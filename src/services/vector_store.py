@@ -0,0 +1,278 @@
+"""
+Quantized Vector Store
+Compact, memory-mapped on-disk copy of a tenant's chunk embeddings.
+
+A 1536-dim float32 vector is 6 KB (and ~50 KB as a Python list); stored as
+int8 codes with one float32 scale per vector it is ~1.5 KB, as float16 3 KB.
+Stores live under VECTOR_STORE_DIR and are opened with np.load(mmap_mode="r"),
+so every uvicorn worker on the host maps the same page-cache pages instead of
+holding a private copy.
+
+Layout (one directory per tenant):
+
+    <VECTOR_STORE_DIR>/<user_id>/CURRENT        name of the live build
+    <VECTOR_STORE_DIR>/<user_id>/<build>/meta.json
+    <VECTOR_STORE_DIR>/<user_id>/<build>/rows.json
+    <VECTOR_STORE_DIR>/<user_id>/<build>/codes.npy
+    <VECTOR_STORE_DIR>/<user_id>/<build>/scales.npy     (int8 only)
+    <VECTOR_STORE_DIR>/<user_id>/<build>/vectors.npy    (float32, if re-scoring)
+
+A build is written to a temporary directory, renamed into place and then
+published by atomically replacing CURRENT, so readers never see a partial
+store. Search scores the quantized codes directly; when VECTOR_STORE_RESCORE
+is set, the best top_k * VECTOR_STORE_RESCORE candidates are re-scored with
+the float32 vectors (only those rows are paged in).
+"""
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.utils.config import VECTOR_STORE_DIR, VECTOR_STORE_RESCORE
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 at a time while scoring (bounds temporary memory)
+_SCORE_BLOCK = 4096
+
+# Superseded builds are removed once older than this (another worker may be
+# between renaming its build into place and publishing it)
+_STALE_BUILD_SECONDS = 60
+
+
+def quantize(matrix: np.ndarray, quantization: str) -> Dict[str, np.ndarray]:
+    """
+    Quantize normalized float32 vectors.
+
+    int8 uses symmetric per-vector scales: codes = round(x / scale) with
+    scale = max|x| / 127, so x ~= codes * scale.
+
+    Returns:
+        Dict with "codes" and, for int8, "scales"
+    """
+    if quantization == "float16":
+        return {"codes": matrix.astype(np.float16)}
+    if quantization != "int8":
+        raise ValueError(f"Unknown quantization: {quantization}")
+
+    scales = np.abs(matrix).max(axis=1, initial=0.0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return {"codes": codes, "scales": scales.astype(np.float32)}
+
+
+class QuantizedTenantIndex:
+    """
+    Memory-mapped quantized index with the same interface as TenantIndex.
+
+    Args:
+        directory: Build directory written by write_store()
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(directory, "rows.json"), encoding="utf-8") as f:
+            self.rows: List[Dict[str, Any]] = json.load(f)
+
+        self.quantization = self.meta["quantization"]
+        self.codes = np.load(os.path.join(directory, "codes.npy"), mmap_mode="r")
+        self.scales = (
+            np.load(os.path.join(directory, "scales.npy")) if self.quantization == "int8" else None
+        )
+        vectors_path = os.path.join(directory, "vectors.npy")
+        self.vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+        self.categories = np.array([row.get("category") for row in self.rows], dtype=object)
+        self.ann = None
+        # Age the index from its build time so every worker reloads on the same schedule
+        self.loaded_at = time.monotonic() - max(0.0, time.time() - self.meta["built_at"])
+
+    @property
+    def nbytes(self) -> int:
+        # Mapped pages are shared between workers; count them anyway so the
+        # registry budget stays an upper bound on this worker's footprint
+        scales = self.scales.nbytes if self.scales is not None else 0
+        return int(self.codes.nbytes + scales + sum(2 * len(row.get("chunk_text") or "") for row in self.rows))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(self.rows), dtype=np.float32)
+        for start in range(0, len(self.rows), _SCORE_BLOCK):
+            block = self.codes[start:start + _SCORE_BLOCK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        category: Optional[str] = None,
+        similarity_threshold: float = 0.7
+    ) -> List[Dict[str, Any]]:
+        """
+        Cosine top-k on the quantized codes, optionally re-scored with floats.
+
+        Returns:
+            Chunk dicts with a similarity score, highest first
+        """
+        if not self.rows:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0:
+            return []
+        query = query / norm
+
+        scores = self._scores(query)
+        if category:
+            scores = np.where(self.categories == category, scores, -np.inf)
+
+        rescore = self.vectors is not None and VECTOR_STORE_RESCORE > 0
+        k = min(top_k * VECTOR_STORE_RESCORE if rescore else top_k, len(scores))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+
+        if rescore:
+            candidates = np.sort(candidates[np.isfinite(scores[candidates])])
+            scores = np.full(len(self.rows), -np.inf, dtype=np.float32)
+            scores[candidates] = self.vectors[candidates] @ query
+            candidates = candidates[np.argsort(-scores[candidates])][:top_k]
+        else:
+            candidates = candidates[np.argsort(-scores[candidates])]
+
+        return [
+            {**self.rows[i], "similarity": float(scores[i])}
+            for i in candidates
+            if scores[i] >= similarity_threshold
+        ]
+
+
+def _tenant_dir(user_id: str, root: str) -> str:
+    # user_id comes from the URL: never let it escape the store root
+    if not user_id or user_id.startswith(".") or os.sep in user_id or (os.altsep and os.altsep in user_id):
+        raise ValueError(f"Invalid user_id for vector store: {user_id!r}")
+    return os.path.join(root, user_id)
+
+
+def write_store(
+    user_id: str,
+    rows: List[Dict[str, Any]],
+    matrix: np.ndarray,
+    quantization: str,
+    root: str = VECTOR_STORE_DIR
+) -> str:
+    """
+    Write and publish a new build of a tenant's store.
+
+    Args:
+        user_id: Tenant (owner_id)
+        rows: Chunk rows in the same order as matrix
+        matrix: Normalized float32 embeddings (len(rows), dims)
+        quantization: "int8" or "float16"
+        root: Store root directory
+
+    Returns:
+        Path of the published build directory
+    """
+    tenant_dir = _tenant_dir(user_id, root)
+    os.makedirs(tenant_dir, exist_ok=True)
+
+    build = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(tenant_dir, f".{build}.tmp")
+    os.makedirs(tmp_dir)
+
+    try:
+        dims = matrix.shape[1] if len(rows) else 0
+        for name, array in quantize(matrix.reshape(len(rows), dims), quantization).items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        if VECTOR_STORE_RESCORE > 0:
+            np.save(os.path.join(tmp_dir, "vectors.npy"), matrix.astype(np.float32, copy=False))
+        with open(os.path.join(tmp_dir, "rows.json"), "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "quantization": quantization,
+                "count": len(rows),
+                "dims": dims,
+                "built_at": time.time(),
+            }, f)
+
+        build_dir = os.path.join(tenant_dir, build)
+        os.rename(tmp_dir, build_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    current_tmp = os.path.join(tenant_dir, f".CURRENT.{build}")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(build)
+    os.replace(current_tmp, os.path.join(tenant_dir, "CURRENT"))
+
+    _remove_stale_builds(tenant_dir, keep=build)
+    logger.info(f"Wrote {quantization} vector store for user {user_id[-4:]}: {len(rows)} vectors")
+    return build_dir
+
+
+def _remove_stale_builds(tenant_dir: str, keep: str) -> None:
+    # Open mmaps of removed builds stay valid until the readers drop them
+    cutoff = time.time() - _STALE_BUILD_SECONDS
+    for name in os.listdir(tenant_dir):
+        path = os.path.join(tenant_dir, name)
+        if name == keep or name.startswith(".") or not os.path.isdir(path):
+            continue
+        if os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def open_store(
+    user_id: str,
+    quantization: str,
+    max_age: float,
+    root: str = VECTOR_STORE_DIR
+) -> Optional[QuantizedTenantIndex]:
+    """
+    Open the tenant's published build if it is fresh enough.
+
+    Args:
+        user_id: Tenant (owner_id)
+        quantization: Required quantization (other builds are ignored)
+        max_age: Maximum build age in seconds
+        root: Store root directory
+
+    Returns:
+        QuantizedTenantIndex, or None if there is no usable build
+    """
+    tenant_dir = _tenant_dir(user_id, root)
+    try:
+        with open(os.path.join(tenant_dir, "CURRENT"), encoding="utf-8") as f:
+            build = f.read().strip()
+        index = QuantizedTenantIndex(os.path.join(tenant_dir, build))
+    except FileNotFoundError:
+        return None
+
+    if index.quantization != quantization or time.time() - index.meta["built_at"] > max_age:
+        return None
+    return index
+
+
+def remove_store(user_id: str, root: str = VECTOR_STORE_DIR) -> bool:
+    """
+    Unpublish a tenant's store so every worker rebuilds it on its next load.
+
+    Returns:
+        True if a build was published
+    """
+    try:
+        os.remove(os.path.join(_tenant_dir(user_id, root), "CURRENT"))
+        return True
+    except FileNotFoundError:
+        return False
@@ -0,0 +1,199 @@
+"""
+In-process caching utilities.
+
+TTLCache is a small thread-safe LRU cache with per-entry expiry and optional
+refresh-ahead. It is used to keep per-tenant data that rarely changes
+(credentials, personality, ...) out of the per-message hot path.
+
+Each uvicorn worker has its own cache: explicit invalidation only reaches the
+worker that served it, and the TTL bounds staleness everywhere else.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("value", "stored_at", "expires_at", "refreshing")
+
+    def __init__(self, value: Any, ttl: float):
+        now = time.monotonic()
+        self.value = value
+        self.stored_at = now
+        self.expires_at = now + ttl
+        self.refreshing = False
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry TTL and refresh-ahead.
+
+    Args:
+        name: Name used in logs and stats
+        ttl: Default time-to-live in seconds
+        max_size: Maximum number of entries (least recently used is evicted)
+        refresh_ahead: Fraction of the TTL after which get_or_load() reloads
+            the entry in a background thread while still serving the cached
+            value (0 disables refresh-ahead)
+        ttl_for: Optional callable returning the TTL for a loaded value
+            (e.g. a shorter TTL for negative results)
+
+    Example:
+        >>> cache = TTLCache("credentials", ttl=300, max_size=1000)
+        >>> creds = cache.get_or_load(user_id, lambda: fetch_credentials(user_id))
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_size: int = 1024,
+        refresh_ahead: float = 0.0,
+        ttl_for: Optional[Callable[[Any], float]] = None
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh_ahead = refresh_ahead
+        self.ttl_for = ttl_for
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _ttl_for(self, value: Any) -> float:
+        return self.ttl_for(value) if self.ttl_for else self.ttl
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Look up a key.
+
+        Returns:
+            Tuple of (found, value); expired entries count as not found
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value
+
+    def peek(self, key: Hashable) -> Any:
+        """
+        Return the stored value even if expired, without touching LRU order
+        or counters (None if absent). Useful to reuse work across reloads.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry if full."""
+        entry = _Entry(value, ttl if ttl is not None else self._ttl_for(value))
+        with self._lock:
+            self._set_locked(key, entry)
+
+    def _set_locked(self, key: Hashable, entry: _Entry) -> None:
+        """Store an entry, evicting the least recently used if full. Caller holds the lock."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached value, loading it on a miss.
+
+        When refresh-ahead is enabled and the entry is older than
+        refresh_ahead * TTL, the cached value is returned immediately and the
+        entry is reloaded in a background thread.
+
+        Exceptions raised by the loader on a miss propagate and nothing is
+        cached; failures during a background refresh are logged and the
+        current entry is kept until it expires.
+        """
+        now = time.monotonic()
+        refresh = False
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if (
+                    self.refresh_ahead
+                    and not entry.refreshing
+                    and now - entry.stored_at >= (entry.expires_at - entry.stored_at) * self.refresh_ahead
+                ):
+                    entry.refreshing = True
+                    refresh = True
+                value = entry.value
+            else:
+                # Expired entries stay until overwritten so loaders can peek() them
+                self.misses += 1
+                entry = None
+
+        if entry is None:
+            value = loader()
+            self.set(key, value)
+            return value
+
+        if refresh:
+            threading.Thread(
+                target=self._refresh,
+                args=(key, loader, entry),
+                name=f"{self.name}-refresh",
+                daemon=True
+            ).start()
+
+        return value
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any], entry: _Entry) -> None:
+        try:
+            value = loader()
+        except Exception as e:
+            logger.warning(f"Cache refresh failed for {self.name}: {e}")
+            entry.refreshing = False
+            return
+
+        refreshed = _Entry(value, self._ttl_for(value))
+        with self._lock:
+            # Only replace the entry we refreshed (it may have been invalidated meanwhile)
+            if self._entries.get(key) is not entry:
+                return
+            self._set_locked(key, refreshed)
+            self.refreshes += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove a key. Returns True if it was cached."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -20,8 +20,108 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.2"))
 
+# System prompt layout: "legacy" or "prefix_cache" (stable prefix first, KB last)
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "legacy").lower()
+
+# HTTP connection pool for OpenAI clients (keep-alive reuse across requests)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+
+# Pool of per-tenant chat clients (keyed by api_key, base_url, organization_id)
+AI_CLIENT_POOL_SIZE = int(os.getenv("AI_CLIENT_POOL_SIZE", "64"))
+AI_CLIENT_IDLE_TTL = float(os.getenv("AI_CLIENT_IDLE_TTL", "600"))
+AI_CLIENT_MAX_CONNECTIONS = int(os.getenv("AI_CLIENT_MAX_CONNECTIONS", "10"))
+AI_CLIENT_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_CLIENT_MAX_KEEPALIVE_CONNECTIONS", "5"))
+AI_CLIENT_HTTP2 = os.getenv("AI_CLIENT_HTTP2", "true").lower() == "true"
+
+# Vector search backend: "rpc" (match_knowledge_chunks) or "local" (in-process index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "rpc").lower()
+LOCAL_INDEX_MAX_BYTES = int(os.getenv("LOCAL_INDEX_MAX_BYTES", str(512 * 1024 * 1024)))
+LOCAL_INDEX_TTL = float(os.getenv("LOCAL_INDEX_TTL", "600"))
+
+# Approximate (IVF) search for tenants with at least ANN_MIN_CHUNKS chunks (0 disables)
+ANN_MIN_CHUNKS = int(os.getenv("ANN_MIN_CHUNKS", "20000"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))  # 0 = sqrt(chunks)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "2.0"))
+
+# Lexical (BM25) retrieval fused with vector search by reciprocal rank fusion.
+# A confident lexical match (share of the query's idf weight matched and
+# score margin over the runner-up) skips the embedding call and vector search.
+LEXICAL_SEARCH_ENABLED = os.getenv("LEXICAL_SEARCH_ENABLED", "true").lower() == "true"
+LEXICAL_ONLY_ENABLED = os.getenv("LEXICAL_ONLY_ENABLED", "true").lower() == "true"
+LEXICAL_CONFIDENCE = float(os.getenv("LEXICAL_CONFIDENCE", "0.9"))
+LEXICAL_MARGIN = float(os.getenv("LEXICAL_MARGIN", "1.5"))
+LEXICAL_INDEX_TTL = float(os.getenv("LEXICAL_INDEX_TTL", os.getenv("LOCAL_INDEX_TTL", "600")))
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", "500"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Retrieval skip: small talk ("oi", "obrigado", "tchau") gets a minimal prompt
+# without embedding or knowledge base lookups (see turn_classifier)
+RETRIEVAL_SKIP_ENABLED = os.getenv("RETRIEVAL_SKIP_ENABLED", "true").lower() == "true"
+
+# Shared on-disk store for local indexes: "none" (in-memory float32), "int8" or "float16"
+VECTOR_STORE_QUANTIZATION = os.getenv("VECTOR_STORE_QUANTIZATION", "none").lower()
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "/tmp/agent-vector-store")
+VECTOR_STORE_RESCORE = int(os.getenv("VECTOR_STORE_RESCORE", "4"))  # 0 = no float re-scoring
+
+# Background knowledge processing jobs (in-process queue)
+KNOWLEDGE_JOB_WORKERS = int(os.getenv("KNOWLEDGE_JOB_WORKERS", "2"))
+KNOWLEDGE_JOB_HISTORY = int(os.getenv("KNOWLEDGE_JOB_HISTORY", "1000"))
+
+# Knowledge processing pipeline: chunks per embed/insert page, embedded pages
+# allowed to wait for the writer, and insert retries per page
+KNOWLEDGE_PAGE_SIZE = int(os.getenv("KNOWLEDGE_PAGE_SIZE", "500"))
+KNOWLEDGE_PIPELINE_DEPTH = int(os.getenv("KNOWLEDGE_PIPELINE_DEPTH", "2"))
+KNOWLEDGE_INSERT_RETRIES = int(os.getenv("KNOWLEDGE_INSERT_RETRIES", "3"))
+
 # Knowledge Base (Supabase table) configuration
 KB_TABLE = os.getenv("KB_TABLE", "knowledge_base")
 KB_OWNER_COL = os.getenv("KB_OWNER_COL", "user_id")
 KB_FIELDS = os.getenv("KB_FIELDS", "category,data")
-KB_LIMIT = int(os.getenv("KB_LIMIT", "100"))  # Fetch all entries (increased from 10)
\ No newline at end of file
+KB_LIMIT = int(os.getenv("KB_LIMIT", "100"))  # Fetch all entries (increased from 10)
+KB_VERSION_COL = os.getenv("KB_VERSION_COL", "updated_at")  # Its max value + row count version the KB
+KB_CONTEXT_CACHE_TTL = float(os.getenv("KB_CONTEXT_CACHE_TTL", "3600"))
+KB_CONTEXT_CACHE_SIZE = int(os.getenv("KB_CONTEXT_CACHE_SIZE", "2000"))
+# Knowledge bases up to this many estimated tokens are inlined in the prompt
+# without embedding the query or searching (0 disables)
+SMALL_KB_MAX_TOKENS = int(os.getenv("SMALL_KB_MAX_TOKENS", "1500"))
+
+# Default knowledge context budget in estimated tokens (per tenant override:
+# ai_credentials.context_token_budget; 0 disables the limit)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Conversation history: characters kept per message (cut in the database; 0 disables)
+HISTORY_MESSAGE_MAX_CHARS = int(os.getenv("HISTORY_MESSAGE_MAX_CHARS", "1000"))
+
+# Write-through ring buffers of the latest messages per conversation
+HISTORY_BUFFER_ENABLED = os.getenv("HISTORY_BUFFER_ENABLED", "true").lower() == "true"
+HISTORY_BUFFER_SIZE = int(os.getenv("HISTORY_BUFFER_SIZE", "20"))  # Messages per conversation
+HISTORY_BUFFER_TTL = float(os.getenv("HISTORY_BUFFER_TTL", "1800"))  # Since the ring was created
+HISTORY_BUFFER_MAX_CONVERSATIONS = int(os.getenv("HISTORY_BUFFER_MAX_CONVERSATIONS", "10000"))
+
+# In-process caches
+CACHE_ADMIN_TOKEN = os.getenv("CACHE_ADMIN_TOKEN", "")  # Required by /cache/* endpoints
+CACHE_REFRESH_AHEAD = float(os.getenv("CACHE_REFRESH_AHEAD", "0.8"))  # Fraction of TTL; 0 disables
+AI_CREDENTIALS_CACHE_TTL = float(os.getenv("AI_CREDENTIALS_CACHE_TTL", "300"))
+AI_CREDENTIALS_NEGATIVE_TTL = float(os.getenv("AI_CREDENTIALS_NEGATIVE_TTL", "60"))
+AI_CREDENTIALS_CACHE_SIZE = int(os.getenv("AI_CREDENTIALS_CACHE_SIZE", "5000"))
+PERSONALITY_CACHE_TTL = float(os.getenv("PERSONALITY_CACHE_TTL", "300"))
+PERSONALITY_CACHE_SIZE = int(os.getenv("PERSONALITY_CACHE_SIZE", "5000"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Batch embedding (knowledge processing): requests packed by estimated tokens
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "2048"))  # OpenAI limit
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "1.0"))
+EMBEDDING_RETRY_MAX_DELAY = float(os.getenv("EMBEDDING_RETRY_MAX_DELAY", "30.0"))
+
+# Semantic response cache (per tenant, keyed by query embedding)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))  # Cosine similarity
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))  # Per tenant
+RESPONSE_CACHE_MAX_TENANTS = int(os.getenv("RESPONSE_CACHE_MAX_TENANTS", "500"))
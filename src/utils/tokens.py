@@ -0,0 +1,30 @@
+"""
+Token Utilities
+Local token-count estimate for batching and prompt budgets (no tokenizer
+dependency and no API call).
+"""
+import math
+
+# OpenAI BPE tokenizers average ~4 characters per token for English and a bit
+# less for Portuguese (accents and longer words split more). 3.5 errs on the
+# high side, which is the safe direction for request and prompt limits.
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate how many tokens a text costs.
+
+    Args:
+        text: Any text
+
+    Returns:
+        Estimated token count (0 for empty text)
+
+    Example:
+        >>> estimate_tokens("Qual o preço do plano Essencial?")
+        10
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)